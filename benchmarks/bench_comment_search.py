@@ -0,0 +1,103 @@
+'''
+Full-text search latency over the comment descriptions (text index of schema.setup) while the
+comment collection grows, compared with a case-insensitive regex scan of the descriptions.
+
+Usage: python -m benchmarks.bench_comment_search [--scales 100000 1000000 5000000] [--iterations 200]
+'''
+import argparse
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from benchmarks import common
+from domains.survey import logic, search
+from domains.survey.models import SurveyComment, SurveyCommentParameter
+from schema import schema
+
+# Words of the descriptions per language, the first ones are frequent and the last one is rare
+WORDS = {
+    "en": ["page", "slow", "loading", "button", "checkout", "payments", "failing", "invoices"],
+    "fr": ["page", "lente", "chargement", "bouton", "paiement", "factures", "commandes", "remboursements"],
+    "de": ["seite", "langsam", "laden", "knopf", "bezahlung", "rechnungen", "bestellungen", "erstattungen"],
+    "es": ["pagina", "lenta", "carga", "boton", "pago", "facturas", "pedidos", "reembolsos"],
+}
+SEARCHES = [("frequent word", "en", "page"), ("stemmed word", "en", "payment"),
+            ("rare word", "fr", "remboursement"), ("phrase", "de", '"langsam laden"'),
+            ("every language", None, "payment")]
+
+
+def description(language):
+    words = WORDS[language]
+    # Rare words in about 1% of the comments
+    weights = [10] * (len(words) - 1) + [0.5]
+    return " ".join(random.choices(words, weights=weights, k=random.randint(3, 12)))
+
+
+async def seed(engine, feature_ids, count, batch_size=10000):
+    user_ids = [uuid.uuid4() for _ in range(1000)]
+    start = datetime.utcnow() - timedelta(days=365)
+    inserted = 0
+    while inserted < count:
+        size = min(batch_size, count - inserted)
+        documents = []
+        for _ in range(size):
+            language = random.choice(list(WORDS))
+            documents.append({+SurveyComment.feature: random.choice(feature_ids),
+                              +SurveyComment.user_id: random.choice(user_ids),
+                              +SurveyComment.date: start + timedelta(seconds=random.randrange(365 * 24 * 3600)),
+                              +SurveyComment.rating: random.randint(1, 5),
+                              +SurveyComment.description: description(language),
+                              +SurveyComment.language: language,
+                              +SurveyComment.search_language: search.text_language(language)})
+        await engine.get_collection(SurveyComment).insert_many(documents, ordered=False)
+        inserted += size
+
+
+async def run(scales, features, iterations):
+    engine = common.connect()
+    await common.drop(engine)
+    await schema.setup(engine.client, engine)
+    seeded = await common.seed_project(engine, features, with_rules=False)
+    project_id = str(seeded["project_id"])
+    comments = 0
+    try:
+        for scale in sorted(scales):
+            await seed(engine, seeded["feature_ids"], scale - comments)
+            comments = scale
+            for label, language, text in SEARCHES:
+                parameter = SurveyCommentParameter(project_id=project_id, language=language)
+
+                async def first_page():
+                    await logic.search_survey_comments_page(engine, parameter, text, 50, None, as_dict=True)
+
+                common.print_row(f"search {label}, {scale} comments",
+                                 await common.measure(first_page, iterations))
+
+            parameter = SurveyCommentParameter(project_id=project_id, feature_url=random.choice(seeded["urls"]))
+            page = await logic.search_survey_comments_page(engine, parameter, "checkout", 50, None, as_dict=True)
+
+            async def next_page():
+                await logic.search_survey_comments_page(engine, parameter, "checkout", 50, page["next_cursor"],
+                                                        as_dict=True)
+
+            common.print_row(f"search next page, one feature, {scale} comments",
+                             await common.measure(next_page, iterations))
+
+            async def regex_scan():
+                await engine.get_collection(SurveyComment).find(
+                    {+SurveyComment.description: {"$regex": "remboursement", "$options": "i"}}).to_list(length=50)
+
+            common.print_row(f"regex scan, {scale} comments",
+                             await common.measure(regex_scan, max(iterations // 20, 1), warmup=1))
+    finally:
+        await common.drop(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scales", type=int, nargs="+", default=[100000, 1000000, 5000000])
+    parser.add_argument("--features", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.scales, args.features, args.iterations))
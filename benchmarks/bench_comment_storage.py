@@ -0,0 +1,65 @@
+'''
+Storage size and range-query latency of the comments in the SurveyComment collection
+and in the comments time-series collection (SURVEY_COMMENTS_STORAGE), on the same comments.
+
+Usage: python -m benchmarks.bench_comment_storage [--comments 1000000] [--features 100] [--iterations 50]
+'''
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import common
+from domains.survey import logic, storage
+from domains.survey.models import SurveyCommentParameter
+from schema import schema
+
+RANGES = [("1 day", 1), ("1 week", 7), ("1 month", 30)]
+
+
+async def print_size(engine, layout, collection):
+    stats = await engine.database.command("collStats", collection.name)
+    buckets = stats.get("timeseries", {}).get("bucketCount")
+    print(f"{layout}: {await collection.count_documents({})} comments"
+          f"{'' if buckets is None else f' in {buckets} buckets'}, "
+          f"storage {stats['storageSize'] / 2 ** 20:.1f} MiB, indexes {stats['totalIndexSize'] / 2 ** 20:.1f} MiB")
+
+
+async def run(comments, features, iterations):
+    engine = common.connect()
+    await common.drop(engine)
+    await schema.setup(engine.client, engine)
+    try:
+        seeded = await common.seed_project(engine, features, with_rules=False)
+        await common.seed_comments(engine, seeded["feature_ids"], comments)
+        start = time.perf_counter()
+        await storage.copy_comments_to_timeseries(engine)
+        print(f"copied {comments} comments to the time-series collection in {time.perf_counter() - start:.1f}s")
+
+        end = datetime.utcnow()
+        for layout, comment_storage in storage.STORAGES.items():
+            storage.comment_storage = comment_storage
+            await print_size(engine, layout, comment_storage.collection(engine))
+            for label, days in RANGES:
+                for scope, parameter in [
+                        ("feature", {"feature_url": random.choice(seeded["urls"])}),
+                        ("project", {"project_id": str(seeded["project_id"])})]:
+                    parameter = SurveyCommentParameter(starting_date=end - timedelta(days=days), ending_date=end,
+                                                       **parameter)
+
+                    async def query():
+                        await logic.get_survey_comments(engine, parameter)
+
+                    common.print_row(f"{layout} {label}, {scope}", await common.measure(query, iterations, warmup=2))
+    finally:
+        await common.drop(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--comments", type=int, default=1000000)
+    parser.add_argument("--features", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.comments, args.features, args.iterations))
@@ -0,0 +1,59 @@
+'''
+Load benchmark of the survey decision of the feedback widget:
+GET /survey/eligibility versus the three calls flow
+(GET /survey/rules, GET /survey/times, GET /survey/timestamps), driven in-process.
+
+DB_URL must set uuidRepresentation=standard.
+
+Usage: python -m benchmarks.bench_eligibility [--requests 10000] [--concurrency 20]
+'''
+import argparse
+import asyncio
+import base64
+import os
+import random
+import uuid
+
+from benchmarks import common
+
+
+async def run(features, users, requests, concurrency):
+    engine = common.connect()
+    await common.drop(engine)
+    app = await common.start_app()
+    try:
+        seeded = await common.seed_project(engine, features)
+        user_ids = [uuid.uuid4() for _ in range(users)]
+        await common.seed_comments(engine, seeded["feature_ids"], users * 2, user_ids=user_ids)
+        await common.asgi_request(app, "POST", "/survey/timestamps",
+                                  json_body={"key": base64.b64encode(os.urandom(32)).decode()})
+
+        def pick():
+            return {"feature_url": random.choice(seeded["urls"]), "user_id": str(random.choice(user_ids))}
+
+        async def eligibility():
+            await common.asgi_request(app, "GET", "/survey/eligibility", pick())
+
+        async def three_calls():
+            params = pick()
+            await common.asgi_request(app, "GET", "/survey/rules", {"feature_url": params["feature_url"]})
+            await common.asgi_request(app, "GET", "/survey/times", params)
+            await common.asgi_request(app, "GET", "/survey/timestamps")
+
+        # Warm the caches up so that the second run measures cache hits
+        for label, flow in [("three calls", three_calls), ("eligibility", eligibility)]:
+            common.print_row(f"{label}, cold", await common.load(flow, requests, concurrency))
+            common.print_row(f"{label}, warm", await common.load(flow, requests, concurrency))
+    finally:
+        await common.stop_app(app)
+        await common.drop(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--features", type=int, default=100)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.features, args.users, args.requests, args.concurrency))
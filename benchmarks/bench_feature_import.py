@@ -0,0 +1,54 @@
+'''
+Benchmark of a bulk import: POST /features then POST /survey
+with one rule per imported feature, driven in-process.
+
+Usage: python -m benchmarks.bench_feature_import [--features 10000] [--runs 5]
+'''
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from benchmarks import common
+
+
+async def run(features, runs):
+    engine = common.connect()
+    await common.drop(engine)
+    app = await common.start_app()
+    try:
+        seeded = await common.seed_project(engine, 0, with_rules=False)
+        project_id = str(seeded["project_id"])
+        timings = {"features": [], "rules": []}
+        for run_index in range(runs):
+            urls = [f"http://benchmark/import/{run_index}/{i}" for i in range(features)]
+            body = [{"project_id": project_id, "name": f"feature-{i}", "description": "imported feature",
+                     "resource": url, "payload": {}, "requirement_ids": []}
+                    for i, url in enumerate(urls)]
+            start = time.perf_counter()
+            status, _ = await common.asgi_request(app, "POST", "/features", json_body=body)
+            timings["features"].append(time.perf_counter() - start)
+            assert status == 200, status
+
+            body = {"project_id": project_id, "is_activated": True, "delay_to_answer": 1000,
+                    "feature_rules": [{"url": url, "ratio": 50, "delay_before_new_proposition": 3} for url in urls]}
+            start = time.perf_counter()
+            status, _ = await common.asgi_request(app, "POST", "/survey", json_body=body)
+            timings["rules"].append(time.perf_counter() - start)
+            assert status == 200, status
+
+        for label, seconds in timings.items():
+            print(f"import {features} {label:<10} median={np.median(seconds) * 1000:9.1f}ms  "
+                  f"max={max(seconds) * 1000:9.1f}ms  {features / np.median(seconds):9.1f} items/s")
+    finally:
+        await common.stop_app(app)
+        await common.drop(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--features", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.features, args.runs))
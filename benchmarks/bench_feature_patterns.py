@@ -0,0 +1,169 @@
+'''
+URL -> feature resolution with 100k URL pattern resources (path templates, globs and literals)
+spread over projects: compilation time and memory of the matchers, latency of the in-memory
+resolution, and latency of the former lookup of a literal resource by equality in MongoDB.
+Then the worst case of the trie: the projects share one origin and all their resources are
+partial globs of the same path segment, with the lag of the event loop while a project is recompiled.
+
+Usage: python -m benchmarks.bench_feature_patterns [--patterns 100000] [--projects 100] [--iterations 10000]
+'''
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+from odmantic import ObjectId
+
+from benchmarks import common
+from domains.features.models import Feature
+from domains.features.patterns import FeaturePatternStore
+from domains.projects.models import Project
+from schema import schema
+
+SHAPES = [
+    "{origin}/app{n}/orders/{{id}}",
+    "{origin}/app{n}/orders/{{id}}/items/*",
+    "{origin}/app{n}/files/report-*.pdf",
+    "{origin}/app{n}/docs/**",
+    "{origin}/app{n}/settings",
+]
+SHARED_ORIGIN = "https://shared.benchmark"
+
+
+def sample_url(origin, n, shape):
+    # A URL matched by the resource of the given shape, with ids and a query string
+    return {
+        0: f"{origin}/app{n}/orders/{random.randrange(10 ** 6)}?tab=details",
+        1: f"{origin}/app{n}/orders/{random.randrange(10 ** 6)}/items/{random.randrange(100)}",
+        2: f"{origin}/app{n}/files/report-{random.randrange(2000, 2030)}.pdf",
+        3: f"{origin}/app{n}/docs/guide/chapter-{random.randrange(20)}",
+        4: f"{origin}/app{n}/settings?user={random.randrange(10 ** 6)}",
+    }[shape]
+
+
+async def seed(engine, patterns, projects):
+    per_project = patterns // projects
+    origins = [f"https://project-{i}.benchmark" for i in range(projects)]
+    project_ids = [ObjectId() for _ in range(projects)]
+    await engine.get_collection(Project).insert_many([{"_id": project_id, "name": f"project-{i}"}
+                                                      for i, project_id in enumerate(project_ids)])
+    for origin, project_id in zip(origins, project_ids):
+        await engine.get_collection(Feature).insert_many([
+            {"project": project_id, "name": f"feature-{i}", "requirement_ids": [],
+             "resource": SHAPES[i % len(SHAPES)].format(origin=origin, n=i // len(SHAPES))}
+            for i in range(per_project)
+        ], ordered=False)
+    return origins, per_project // len(SHAPES)
+
+
+async def run(patterns, projects, iterations):
+    engine = common.connect()
+    await common.drop(engine)
+    await schema.setup(engine.client, engine)
+    try:
+        origins, apps = await seed(engine, patterns, projects)
+        store = FeaturePatternStore(refresh_interval=60)
+        tracemalloc.start()
+        start = time.perf_counter()
+        await store.wait_loaded(engine)
+        elapsed = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"compiled {patterns} patterns of {projects} projects in {elapsed:.2f}s, {memory / 2 ** 20:.1f} MiB")
+
+        start = time.perf_counter()
+        await store.changed(engine, [next(iter(store.resources))])
+        print(f"recompiled one project in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        for label, shape in [("template + query string", 0), ("nested glob", 1), ("partial glob", 2),
+                             ("rest of path", 3), ("literal + query string", 4)]:
+            async def resolve():
+                url = sample_url(random.choice(origins), random.randrange(apps), shape)
+                assert await store.resolve(engine, url) is not None, url
+
+            common.print_row(f"resolve, {label}", await common.measure(resolve, iterations))
+
+        async def miss():
+            assert await store.resolve(engine, f"{random.choice(origins)}/unknown/{random.randrange(10 ** 6)}") is None
+
+        common.print_row("resolve, no match", await common.measure(miss, iterations))
+
+        async def lookup():
+            url = f"{random.choice(origins)}/app{random.randrange(apps)}/settings"
+            await engine.get_collection(Feature).find_one({+Feature.resource: url}, {"_id": 1})
+
+        common.print_row("mongodb equality lookup", await common.measure(lookup, min(iterations, 1000)))
+    finally:
+        await common.drop(engine)
+
+
+async def seed_shared(engine, patterns, projects):
+    # report-<n>-*.pdf (indexed by prefix) and {id}-<n>.csv (indexed by suffix), all under /files
+    project_ids = [ObjectId() for _ in range(projects)]
+    await engine.get_collection(Project).insert_many([{"_id": project_id, "name": f"project-{i}"}
+                                                      for i, project_id in enumerate(project_ids)])
+    await engine.get_collection(Feature).insert_many([
+        {"project": project_ids[i % projects], "name": f"feature-{i}", "requirement_ids": [],
+         "resource": f"{SHARED_ORIGIN}/files/report-{i}-*.pdf" if i % 2 else f"{SHARED_ORIGIN}/files/{{id}}-{i}.csv"}
+        for i in range(patterns)
+    ], ordered=False)
+    return project_ids
+
+
+async def event_loop_lag(call) -> float:
+    # Largest delay of a 1 ms periodic timer while call runs, in milliseconds
+    lags = []
+
+    async def tick():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    ticker = asyncio.create_task(tick())
+    await call()
+    ticker.cancel()
+    return max(lags, default=0.0) * 1000
+
+
+async def run_shared(patterns, projects, iterations):
+    engine = common.connect()
+    await common.drop(engine)
+    await schema.setup(engine.client, engine)
+    try:
+        project_ids = await seed_shared(engine, patterns, projects)
+        store = FeaturePatternStore(refresh_interval=60)
+        start = time.perf_counter()
+        await store.wait_loaded(engine)
+        print(f"compiled {patterns} partial globs of {projects} projects under one segment of one origin "
+              f"in {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        lag = await event_loop_lag(lambda: store.changed(engine, [project_ids[0]]))
+        print(f"recompiled the origin in {(time.perf_counter() - start) * 1000:.1f}ms, "
+              f"event loop lag {lag:.1f}ms")
+
+        async def resolve():
+            n = random.randrange(patterns)
+            url = f"{SHARED_ORIGIN}/files/report-{n}-q1.pdf" if n % 2 else f"{SHARED_ORIGIN}/files/42-{n}.csv"
+            assert await store.resolve(engine, url) is not None, url
+
+        common.print_row("shared origin, resolve", await common.measure(resolve, iterations))
+
+        async def miss():
+            assert await store.resolve(engine, f"{SHARED_ORIGIN}/files/unknown-{random.randrange(10 ** 6)}") is None
+
+        common.print_row("shared origin, no match", await common.measure(miss, iterations))
+    finally:
+        await common.drop(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--patterns", type=int, default=100000)
+    parser.add_argument("--projects", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(run(args.patterns, args.projects, args.iterations))
+    asyncio.run(run_shared(args.patterns, args.projects, args.iterations))
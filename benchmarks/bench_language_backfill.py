@@ -0,0 +1,64 @@
+'''
+Throughput of the language backfill (domains.jobs.backfill_languages) of comments stored without
+language, with one detection process versus every core.
+
+Usage: python -m benchmarks.bench_language_backfill [--comments 100000] [--features 100]
+'''
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from benchmarks import common
+from domains.jobs import logic
+from domains.jobs.models import LanguageBackfillJob
+from domains.survey.language import LanguageDetectionPool
+from domains.survey.models import SurveyComment
+from schema import schema
+
+SENTENCES = [
+    "The checkout page is really slow when I add more than ten items to the cart.",
+    "La page de paiement est vraiment lente quand j'ajoute plus de dix articles au panier.",
+    "Die Bezahlseite ist sehr langsam, wenn ich mehr als zehn Artikel in den Warenkorb lege.",
+    "La página de pago es muy lenta cuando agrego más de diez artículos al carrito.",
+    "ok",
+]
+
+
+async def run(comments, features):
+    engine = common.connect()
+    await common.drop(engine)
+    await schema.setup(engine.client, engine)
+    try:
+        seeded = await common.seed_project(engine, features, with_rules=False)
+        await common.seed_comments(engine, seeded["feature_ids"], comments)
+        collection = engine.get_collection(SurveyComment)
+        for workers in sorted({1, os.cpu_count()}):
+            # Every comment written before language detection, with its own description
+            async for comment in collection.find({}, {"_id": 1}):
+                await collection.update_one({"_id": comment["_id"]},
+                                            {"$set": {+SurveyComment.description: random.choice(SENTENCES)},
+                                             "$unset": {+SurveyComment.language: ""}})
+            await engine.get_collection(LanguageBackfillJob).delete_many({})
+            pool = LanguageDetectionPool(executor_type="process", workers=workers, batch_size=32, batch_delay=0)
+            await pool.start()
+            await pool.warm_up()
+            try:
+                job = await logic.create_language_backfill(engine, redetect_all=False)
+                start = time.perf_counter()
+                job = await logic.run_language_backfill(engine, job, pool, max_rate=0)
+                elapsed = time.perf_counter() - start
+            finally:
+                await pool.stop()
+            print(f"{workers} workers: {job.scanned} comments in {elapsed:.1f}s, {job.scanned / elapsed:.0f} comments/s")
+    finally:
+        await common.drop(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--comments", type=int, default=100000)
+    parser.add_argument("--features", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.comments, args.features))
@@ -0,0 +1,93 @@
+'''
+Event loop latency while comments of mixed sizes go through language detection,
+inline on the event loop (previous behaviour) versus the detection pool.
+The lag is how late a 1 ms periodic timer fires while the detections run.
+
+Usage: python -m benchmarks.bench_language_detection [--comments 2000] [--concurrency 50]
+'''
+import argparse
+import asyncio
+import random
+import time
+
+import numpy as np
+
+from domains.survey import language
+
+SENTENCES = [
+    "The checkout page is really slow when I add more than ten items to the cart.",
+    "La page de paiement est vraiment lente quand j'ajoute plus de dix articles au panier.",
+    "Die Bezahlseite ist sehr langsam, wenn ich mehr als zehn Artikel in den Warenkorb lege.",
+    "La página de pago es muy lenta cuando agrego más de diez artículos al carrito.",
+]
+
+
+def make_comments(count: int):
+    comments = []
+    for _ in range(count):
+        size = random.choice(["empty", "short", "medium", "long"])
+        if size == "empty":
+            comments.append("")
+        elif size == "short":
+            comments.append("Nice!")
+        elif size == "medium":
+            comments.append(random.choice(SENTENCES))
+        else:
+            comments.append(" ".join(random.choice(SENTENCES) for _ in range(40)))
+    return comments
+
+
+async def _inline_detect(text):
+    return language.detect_language(text)
+
+
+async def run_flow(detect, comments, concurrency):
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append((time.perf_counter() - start - 0.001) * 1000)
+
+    async def worker(chunk):
+        for text in chunk:
+            await detect(text)
+
+    ticker_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(comments[i::concurrency]) for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticker_task
+    p50, p99 = np.percentile(lags, [50, 99])
+    return {"comments_per_s": len(comments) / elapsed, "lag_p50_ms": p50, "lag_p99_ms": p99, "lag_max_ms": max(lags)}
+
+
+async def run(count, concurrency, executor_type, workers):
+    comments = make_comments(count)
+    language.detect_languages(SENTENCES)  # load the profiles outside of the measure
+
+    results = {"inline": await run_flow(_inline_detect, comments, concurrency)}
+    pool = language.LanguageDetectionPool(executor_type, workers, batch_size=32, batch_delay=0.005)
+    await pool.start()
+    await pool.warm_up()
+    try:
+        results[f"{executor_type} pool"] = await run_flow(pool.detect, comments, concurrency)
+    finally:
+        await pool.stop()
+
+    for label, stats in results.items():
+        print(f"{label:<16} {stats['comments_per_s']:9.1f} comments/s  loop lag p50={stats['lag_p50_ms']:7.3f}ms "
+              f"p99={stats['lag_p99_ms']:7.3f}ms  max={stats['lag_max_ms']:7.3f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--comments", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--executor", choices=["process", "thread"], default="process")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(run(args.comments, args.concurrency, args.executor, args.workers))
@@ -0,0 +1,62 @@
+'''
+Validated (response model) versus fast (raw documents + orjson) rendering of large lists:
+GET /projects, GET /features/project/{id} and GET /survey/projects/{id}/comments
+with 10k items each, driven in-process. Both paths must return the same JSON.
+Every field is requested, then the default fields (payloads left out) with the fast path.
+
+Usage: python -m benchmarks.bench_list_serialization [--items 10000] [--iterations 20]
+'''
+import argparse
+import asyncio
+import json
+
+from odmantic import ObjectId
+
+from benchmarks import common
+from domains import serialization
+from domains.features.models import Feature
+from domains.projects.models import Project
+
+
+async def run(items, iterations):
+    engine = common.connect()
+    await common.drop(engine)
+    app = await common.start_app()
+    try:
+        seeded = await common.seed_project(engine, items, with_rules=False)
+        await common.seed_comments(engine, seeded["feature_ids"], items)
+        await engine.get_collection(Project).insert_many([
+            {"_id": ObjectId(), "name": f"project-{i}", "description": "benchmark project", "is_active": True,
+             "payload": {"raw": "x" * 512}}
+            for i in range(items - 1)
+        ], ordered=False)
+        project_id = str(seeded["project_id"])
+
+        for path, model in [("/projects", Project),
+                            (f"/features/project/{project_id}", Feature),
+                            (f"/survey/projects/{project_id}/comments", None)]:
+            every_field = {"fields": ",".join(model.__fields__)} if model is not None else {}
+            bodies = {}
+            for label, fast, params in [("validated", False, every_field), ("fast", True, every_field),
+                                        ("fast, default fields", True, {})]:
+                serialization.FAST_RESPONSES = fast
+
+                async def call():
+                    status, body = await common.asgi_request(app, "GET", path, params)
+                    assert status == 200, status
+                    bodies[label] = body
+
+                common.print_row(f"{path.split('/')[1]}/{path.split('/')[-1][:8]} {label}",
+                                 await common.measure(call, iterations, warmup=2))
+            assert json.loads(bodies["validated"]) == json.loads(bodies["fast"]), f"{path}: different JSON"
+    finally:
+        await common.stop_app(app)
+        await common.drop(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.items, args.iterations))
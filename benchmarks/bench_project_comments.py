@@ -0,0 +1,48 @@
+'''
+Latency of the project comments listing (GET /survey/projects/{project_id}/comments)
+for projects with 10, 100 and 1000 features.
+
+Usage: python -m benchmarks.bench_project_comments [--features 10 100 1000] [--comments-per-feature 10]
+'''
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+
+from benchmarks import common
+from domains.survey import logic
+from domains.survey.models import SurveyCommentParameter
+from schema import schema
+
+
+async def run(feature_counts, comments_per_feature, iterations):
+    engine = common.connect()
+    await common.drop(engine)
+    await schema.setup(engine.client, engine)
+    try:
+        for features in feature_counts:
+            seeded = await common.seed_project(engine, features, with_rules=False)
+            await common.seed_comments(engine, seeded["feature_ids"], features * comments_per_feature)
+            project_id = str(seeded["project_id"])
+
+            async def list_all():
+                await logic.get_survey_comments(engine, SurveyCommentParameter(project_id=project_id))
+
+            async def list_filtered():
+                await logic.get_survey_comments(engine, SurveyCommentParameter(
+                    project_id=project_id,
+                    language="en",
+                    starting_date=datetime.utcnow() - timedelta(days=30)))
+
+            common.print_row(f"{features} features, all", await common.measure(list_all, iterations))
+            common.print_row(f"{features} features, filtered", await common.measure(list_filtered, iterations))
+    finally:
+        await common.drop(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--features", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--comments-per-feature", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.features, args.comments_per_feature, args.iterations))
@@ -0,0 +1,61 @@
+'''
+Widget lookups while the comment collection grows, with the indexes declared in schema.setup:
+the last comment of a user on a feature (idxSurveyCommentFeatureUserDate), which reads the
+comments, and the rule lookup (GET /survey/rules without the in-process cache) as a control,
+which does not read them. The documents examined by the comment lookup are reported from explain.
+
+Usage: python -m benchmarks.bench_rule_lookup [--scales 1000 10000 100000 1000000]
+'''
+import argparse
+import asyncio
+import random
+import uuid
+
+import pymongo
+
+from benchmarks import common
+from domains.survey import logic
+from domains.survey.models import SurveyComment
+from schema import schema
+
+
+async def run(scales, features, users, iterations):
+    engine = common.connect()
+    await common.drop(engine)
+    await schema.setup(engine.client, engine)
+    seeded = await common.seed_project(engine, features)
+    user_ids = [uuid.uuid4() for _ in range(users)]
+    comments = engine.get_collection(SurveyComment)
+    count = 0
+    try:
+        for scale in sorted(scales):
+            await common.seed_comments(engine, seeded["feature_ids"], scale - count, user_ids)
+            count = scale
+
+            def last_comment_query():
+                return comments.find({+SurveyComment.feature: random.choice(seeded["feature_ids"]),
+                                      +SurveyComment.user_id: random.choice(user_ids)},
+                                     sort=[(+SurveyComment.date, pymongo.DESCENDING)], limit=1)
+
+            async def last_comment():
+                await last_comment_query().to_list(length=1)
+
+            async def rule_lookup():
+                await logic._find_survey_rule(random.choice(seeded["feature_ids"]), engine)
+
+            stats = (await last_comment_query().explain())["executionStats"]
+            common.print_row(f"last comment, {scale} comments", await common.measure(last_comment, iterations))
+            print(f"  examined {stats['totalDocsExamined']} documents, {stats['totalKeysExamined']} keys")
+            common.print_row(f"rule lookup, {scale} comments", await common.measure(rule_lookup, iterations))
+    finally:
+        await common.drop(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--features", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(run(args.scales, args.features, args.users, args.iterations))
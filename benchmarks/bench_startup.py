@@ -0,0 +1,71 @@
+'''
+Cold start of a worker: import of the application, startup handlers,
+first request and end of the warm-up (GET /ready), each run in a fresh interpreter.
+The first run applies the migrations on an empty database, the next ones find the schema current.
+
+Usage: python -m benchmarks.bench_startup [--runs 5]
+'''
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Only the standard library is imported here, so that the child measures the whole import of the application
+STEPS = ["import_ms", "startup_ms", "first_request_ms", "ready_ms"]
+
+
+async def child():
+    from dotenv import load_dotenv
+    load_dotenv()
+    os.environ["DB_NAME"] = os.getenv("BENCHMARK_DB_NAME", "ottm_benchmark")
+    start = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    from benchmarks import common
+    await main.app.router.startup()
+    started = time.perf_counter()
+    status, _ = await common.asgi_request(main.app, "GET", "/survey/rules", {"feature_url": "http://benchmark/none"})
+    assert status == 404, status
+    first_request = time.perf_counter()
+    while (await common.asgi_request(main.app, "GET", "/ready"))[0] != 200:
+        await asyncio.sleep(0.001)
+    ready = time.perf_counter()
+    await main.app.router.shutdown()
+    print(json.dumps(dict(zip(STEPS, [(imported - start) * 1000, (started - imported) * 1000,
+                                      (first_request - started) * 1000, (ready - start) * 1000]))))
+
+
+async def drop():
+    from benchmarks import common
+    await common.drop(common.connect())
+
+
+def run(runs):
+    import numpy as np
+    asyncio.run(drop())
+    results = []
+    try:
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--child"],
+                                    check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        asyncio.run(drop())
+    for label, measures in [("first boot (migrations)", results[:1]), ("next boots", results[1:])]:
+        if measures:
+            print(f"{label:<24} " + "  ".join(f"{step}={np.median([m[step] for m in measures]):8.1f}"
+                                              for step in STEPS))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(child())
+    else:
+        run(args.runs)
@@ -0,0 +1,65 @@
+'''
+Sustained ingestion throughput of POST /timeseries/{series} on a single worker,
+NDJSON batches driven in-process.
+
+Usage: python -m benchmarks.bench_timeseries_ingestion [--points 1000000] [--batch 10000] [--concurrency 4]
+'''
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from odmantic import ObjectId
+
+from benchmarks import common
+
+
+def ndjson_batch(size: int, start: datetime, projects, features) -> bytes:
+    return "\n".join(json.dumps({"timestamp": (start + timedelta(seconds=i)).isoformat() + "Z",
+                                 "value": random.expovariate(1 / 120),
+                                 "metadata": {"project": random.choice(projects),
+                                              "feature": random.choice(features)}})
+                     for i in range(size)).encode()
+
+
+async def run(series, points, batch, concurrency):
+    engine = common.connect()
+    await common.drop(engine)
+    app = await common.start_app()
+    try:
+        projects = [str(ObjectId()) for _ in range(10)]
+        features = [str(ObjectId()) for _ in range(1000)]
+        start = datetime.utcnow() - timedelta(days=30)
+        # Encode the bodies beforehand, only the service is measured
+        bodies = [ndjson_batch(min(batch, points - offset), start + timedelta(seconds=offset), projects, features)
+                  for offset in range(0, points, batch)]
+        accepted = 0
+
+        async def client(bodies):
+            nonlocal accepted
+            for body in bodies:
+                status, response = await common.asgi_request(app, "POST", f"/timeseries/{series}",
+                                                             body=body, content_type="application/x-ndjson")
+                assert status == 200, status
+                accepted += json.loads(response)["accepted"]
+
+        started = time.perf_counter()
+        await asyncio.gather(*[client(bodies[i::concurrency]) for i in range(concurrency)])
+        elapsed = time.perf_counter() - started
+        print(f"{series}: {accepted} points in {elapsed:.1f}s, {accepted / elapsed:,.0f} points/s "
+              f"(batches of {batch}, {concurrency} concurrent requests)")
+    finally:
+        await common.stop_app(app)
+        await common.drop(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--series", default="latency")
+    parser.add_argument("--points", type=int, default=1000000)
+    parser.add_argument("--batch", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(run(args.series, args.points, args.batch, args.concurrency))
@@ -0,0 +1,71 @@
+'''
+Latency of the downsampled queries GET /timeseries/{series} over tens of millions
+of synthetic points spread over a year, driven in-process.
+
+Usage: python -m benchmarks.bench_timeseries_query [--points 20000000] [--features 100] [--iterations 20]
+'''
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+from odmantic import ObjectId
+
+from benchmarks import common
+
+SPAN = timedelta(days=365)
+
+
+async def seed(engine, series, points, project_id, feature_ids, batch_size=50000, concurrency=4):
+    collection = engine.database[series]
+    end = datetime.utcnow()
+    step = SPAN / points
+
+    async def writer(offsets):
+        for offset in offsets:
+            await collection.insert_many([
+                {"timestamp": end - SPAN + step * i,
+                 "metadata": {"project": project_id, "feature": random.choice(feature_ids)},
+                 "value": random.expovariate(1 / 120)}
+                for i in range(offset, min(offset + batch_size, points))
+            ], ordered=False)
+
+    offsets = list(range(0, points, batch_size))
+    start = time.perf_counter()
+    await asyncio.gather(*[writer(offsets[i::concurrency]) for i in range(concurrency)])
+    print(f"seeded {points} points in {time.perf_counter() - start:.1f}s")
+    return end
+
+
+async def run(series, points, features, iterations):
+    engine = common.connect()
+    await common.drop(engine)
+    app = await common.start_app()
+    try:
+        project_id = ObjectId()
+        feature_ids = [ObjectId() for _ in range(features)]
+        end = await seed(engine, series, points, project_id, feature_ids)
+        for label, days in [("1 day", 1), ("1 week", 7), ("1 month", 30), ("1 year", 365)]:
+            for scope, params in [("project", {"project_id": str(project_id)}),
+                                  ("feature", {"feature_id": str(random.choice(feature_ids))})]:
+                params = {**params, "start": (end - timedelta(days=days)).isoformat(), "end": end.isoformat()}
+
+                async def query():
+                    status, _ = await common.asgi_request(app, "GET", f"/timeseries/{series}", params)
+                    assert status == 200, status
+
+                common.print_row(f"{series} {label}, {scope}", await common.measure(query, iterations, warmup=2))
+    finally:
+        await common.stop_app(app)
+        await common.drop(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--series", default="latency")
+    parser.add_argument("--points", type=int, default=20000000)
+    parser.add_argument("--features", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.series, args.points, args.features, args.iterations))
@@ -0,0 +1,223 @@
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import numpy as np
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from odmantic import AIOEngine, ObjectId
+
+from domains.features.models import Feature
+from domains.projects.models import Project
+from domains.survey.models import Survey, SurveyRule, SurveyComment
+
+load_dotenv()
+
+# Never run the benchmarks against the service database, they drop what they seed
+BENCHMARK_DB_NAME = os.getenv("BENCHMARK_DB_NAME", "ottm_benchmark")
+
+LANGUAGES = ["en", "fr", "de", "es", "unknown"]
+
+# Seeded ids are built like ObjectId() in a single process (timestamp, process value, counter), from a fixed
+# date and the random module rather than the clock and os.urandom: a seed reproduces the data and its index layout
+OBJECT_ID_EPOCH = 1704067200  # 2024-01-01T00:00:00Z
+_object_id_counter = itertools.count()
+_object_id_process: Optional[bytes] = None
+
+
+def object_id() -> ObjectId:
+    global _object_id_process
+    if _object_id_process is None:
+        _object_id_process = random.getrandbits(40).to_bytes(5, "big")
+    count = next(_object_id_counter)
+    return ObjectId((OBJECT_ID_EPOCH + (count >> 24)).to_bytes(4, "big") + _object_id_process
+                    + (count & 0xFFFFFF).to_bytes(3, "big"))
+
+
+def user_id() -> uuid.UUID:
+    # Random (version 4) UUID drawn from the random module, see object_id
+    return uuid.UUID(int=random.getrandbits(128), version=4)
+
+
+def connect() -> AIOEngine:
+    client = AsyncIOMotorClient(os.getenv("DB_URL", "mongodb://127.0.0.1"), uuidRepresentation="standard")
+    return AIOEngine(motor_client=client, database=BENCHMARK_DB_NAME)
+
+
+async def drop(engine: AIOEngine):
+    await engine.client.drop_database(BENCHMARK_DB_NAME)
+
+
+async def seed_project(engine: AIOEngine, features: int, with_rules: bool = True) -> Dict:
+    '''
+    Insert one project with its features (and a rule per feature) using raw bulk inserts
+
+    Returns
+    -------
+    dict
+        project id, feature ids and feature urls
+    '''
+    project_id = object_id()
+    await engine.get_collection(Project).insert_one({"_id": project_id, "name": f"project-{project_id}",
+                                                     "description": "benchmark project", "is_active": True})
+    feature_ids = [object_id() for _ in range(features)]
+    urls = [f"http://benchmark/{project_id}/page/{i}" for i in range(features)]
+    if features:
+        await engine.get_collection(Feature).insert_many([
+            {"_id": feature_id, "project": project_id, "name": f"feature-{i}", "resource": url,
+             "payload": {"raw": "x" * 512}, "requirement_ids": []}
+            for i, (feature_id, url) in enumerate(zip(feature_ids, urls))
+        ], ordered=False)
+    if with_rules and features:
+        survey_id = object_id()
+        await engine.get_collection(Survey).insert_one({"_id": survey_id, "project": project_id, "is_activated": True})
+        await engine.get_collection(SurveyRule).insert_many([
+            {"_id": object_id(), "survey": survey_id, "feature": feature_id, "ratio": 50, "delay_to_answer": 1000,
+             "delay_before_reanswer": 3, "is_activated": True}
+            for feature_id in feature_ids
+        ], ordered=False)
+    return {"project_id": project_id, "feature_ids": feature_ids, "urls": urls}
+
+
+async def seed_comments(engine: AIOEngine, feature_ids: List[ObjectId], count: int,
+                        user_ids: List[uuid.UUID] = None, batch_size: int = 10000):
+    '''
+    Insert `count` comments spread over the given features and users, in unordered batches
+    '''
+    user_ids = user_ids or [user_id() for _ in range(1000)]
+    start = datetime.utcnow() - timedelta(days=365)
+    collection = engine.get_collection(SurveyComment)
+    inserted = 0
+    while inserted < count:
+        size = min(batch_size, count - inserted)
+        await collection.insert_many([
+            {"_id": object_id(),
+             "feature": random.choice(feature_ids),
+             "user_id": random.choice(user_ids),
+             "date": start + timedelta(seconds=random.randrange(365 * 24 * 3600)),
+             "rating": random.randint(1, 5),
+             "description": "benchmark comment",
+             "language": random.choice(LANGUAGES)}
+            for _ in range(size)
+        ], ordered=False)
+        inserted += size
+
+
+async def measure(call: Callable[[], Awaitable], iterations: int, warmup: int = 10) -> Dict[str, float]:
+    '''
+    Await `call` repeatedly and return its latency percentiles in milliseconds
+    '''
+    for _ in range(warmup):
+        await call()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"iterations": iterations, **_percentiles(latencies)}
+
+
+def _percentiles(latencies: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"mean_ms": float(np.mean(latencies)), "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+async def load(call: Callable[[], Awaitable], requests: int, concurrency: int) -> Dict[str, float]:
+    '''
+    Await `call` `requests` times from `concurrency` concurrent clients,
+    return the throughput and latency percentiles in milliseconds
+    '''
+    latencies = []
+
+    async def client(count):
+        for _ in range(count):
+            start = time.perf_counter()
+            await call()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(requests // concurrency + (1 if i < requests % concurrency else 0))
+                           for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {"requests": requests, "concurrency": concurrency, "throughput_rps": requests / elapsed,
+            **_percentiles(latencies)}
+
+
+def print_row(label: str, stats: Dict[str, float]):
+    throughput = f"  {stats['throughput_rps']:9.1f} req/s" if "throughput_rps" in stats else ""
+    print(f"{label:<32} p50={stats['p50_ms']:8.3f}ms  p95={stats['p95_ms']:8.3f}ms  p99={stats['p99_ms']:8.3f}ms"
+          f"{throughput}")
+
+
+async def start_app():
+    '''
+    Start the service application in-process on the benchmark database
+    '''
+    os.environ["DB_NAME"] = BENCHMARK_DB_NAME
+    import main
+    await main.app.router.startup()
+    return main.app
+
+
+async def stop_app(app):
+    await app.router.shutdown()
+
+
+async def asgi_request(app, method: str, path: str, params: Optional[Dict] = None,
+                       json_body=None, body: Optional[bytes] = None,
+                       content_type: str = "application/json") -> Tuple[int, bytes]:
+    '''
+    Send a request straight to the ASGI application, without any network,
+    with either a JSON body or a raw body of `content_type`
+
+    Returns
+    -------
+    Tuple[int, bytes]
+        status code and body of the response
+    '''
+    if body is None:
+        body = b"" if json_body is None else json.dumps(json_body).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": urlencode(params or {}, doseq=True).encode(),
+        "headers": [(b"host", b"benchmark"),
+                    (b"content-type", content_type.encode()),
+                    (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    disconnected = asyncio.get_running_loop().create_future()
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        # The client never disconnects, streaming responses run to the end
+        await disconnected
+        return {"type": "http.disconnect"}
+
+    status, chunks = 0, []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
@@ -0,0 +1,172 @@
+'''
+Benchmark suite of the hot paths of the API, driven in-process (no network) against
+the mongoDB server of DB_URL, on synthetic data seeded at a configurable scale:
+GET /survey/rules, GET /survey/times, POST /survey/comments,
+GET /survey/projects/{id}/comments and GET /projects?fulltext=.
+
+The results are written as JSON. Given the results of a previous run (--baseline),
+scenarios whose p95 latency or throughput got worse than --threshold are flagged
+and the exit code is 1.
+
+Usage: python -m benchmarks.suite [--projects 10] [--features 100] [--comments 100000] [--users 1000]
+                                  [--requests 2000] [--concurrency 20]
+                                  [--output benchmark-results.json] [--baseline previous.json] [--threshold 0.2]
+'''
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+from datetime import datetime
+from importlib import metadata
+from typing import Dict, List
+
+from benchmarks import common
+from domains.projects.models import Project
+
+# Dependencies whose upgrades the suite is meant to check
+PACKAGES = ["fastapi", "starlette", "pydantic", "odmantic", "motor", "pymongo", "orjson"]
+WORDS = ["billing", "search", "checkout", "profile", "catalog", "analytics", "mobile", "portal", "payment",
+         "delivery", "inventory", "support", "booking", "reporting", "onboarding", "messaging"]
+
+
+async def seed(engine, projects: int, features: int, comments: int, users: int) -> Dict:
+    '''
+    Seed the projects with their features, rules and comments, and projects to search for
+
+    Returns
+    -------
+    dict
+        project ids, feature urls and user ids seeded
+    '''
+    user_ids = [common.user_id() for _ in range(users)]
+    seeded = {"project_ids": [], "urls": [], "user_ids": user_ids}
+    for _ in range(projects):
+        project = await common.seed_project(engine, features)
+        await common.seed_comments(engine, project["feature_ids"], comments // projects, user_ids=user_ids)
+        seeded["project_ids"].append(project["project_id"])
+        seeded["urls"].extend(project["urls"])
+    await engine.get_collection(Project).insert_many([
+        {"_id": common.object_id(), "name": f"{random.choice(WORDS)} {i}", "is_active": True,
+         "description": " ".join(random.choices(WORDS, k=8))}
+        for i in range(projects * 100)
+    ], ordered=False)
+    return seeded
+
+
+def scenarios(seeded: Dict) -> Dict:
+    # name: (method, path, parameters or body factory, expected statuses)
+    return {
+        "survey_rules": ("GET", lambda: "/survey/rules",
+                         lambda: {"feature_url": random.choice(seeded["urls"])}, {200}),
+        "survey_times": ("GET", lambda: "/survey/times",
+                         lambda: {"feature_url": random.choice(seeded["urls"]),
+                                  "user_id": str(random.choice(seeded["user_ids"]))}, {200, 404}),
+        "comment_post": ("POST", lambda: "/survey/comments",
+                         lambda: {"feature_url": random.choice(seeded["urls"]),
+                                  "user_id": str(random.choice(seeded["user_ids"])),
+                                  "date": datetime.utcnow().isoformat(),
+                                  "rating": str(random.randint(1, 5)),
+                                  "description": "The page loads quickly and the form is easy to fill in"},
+                         {200, 202}),
+        "comment_list": ("GET", lambda: f"/survey/projects/{random.choice(seeded['project_ids'])}/comments",
+                         lambda: {"limit": 100}, {200}),
+        "project_search": ("GET", lambda: "/projects",
+                           lambda: {"fulltext": random.choice(WORDS), "limit": 20}, {200}),
+    }
+
+
+async def run_scenario(app, method, path, arguments, expected, requests, concurrency) -> Dict:
+    errors = 0
+
+    async def call():
+        nonlocal errors
+        if method == "GET":
+            status, _ = await common.asgi_request(app, method, path(), params=arguments())
+        else:
+            status, _ = await common.asgi_request(app, method, path(), json_body=arguments())
+        if status not in expected:
+            errors += 1
+
+    # Warm the caches and the connection pool up
+    await common.load(call, min(requests, concurrency * 10), concurrency)
+    errors = 0
+    stats = await common.load(call, requests, concurrency)
+    return {**stats, "errors": errors}
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    regressions = []
+    for name, stats in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        if stats["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.2f}ms -> {stats['p95_ms']:.2f}ms")
+        if stats["throughput_rps"] < previous["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']:.1f} -> "
+                               f"{stats['throughput_rps']:.1f} req/s")
+    return regressions
+
+
+def _versions() -> Dict[str, str]:
+    versions = {"python": platform.python_version()}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+async def run(args) -> Dict:
+    engine = common.connect()
+    await common.drop(engine)
+    try:
+        # Seeded before the startup, so that the migrations index and backfill the data
+        seeded = await seed(engine, args.projects, args.features, args.comments, args.users)
+        app = await common.start_app()
+        try:
+            results = {"date": datetime.utcnow().isoformat(),
+                       "versions": _versions(),
+                       "scale": {"projects": args.projects, "features": args.features,
+                                 "comments": args.comments, "users": args.users},
+                       "load": {"requests": args.requests, "concurrency": args.concurrency},
+                       "scenarios": {}}
+            for name, (method, path, arguments, expected) in scenarios(seeded).items():
+                stats = await run_scenario(app, method, path, arguments, expected, args.requests, args.concurrency)
+                results["scenarios"][name] = stats
+                common.print_row(f"{name} ({stats['errors']} errors)", stats)
+            return results
+        finally:
+            await common.stop_app(app)
+    finally:
+        await common.drop(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=10)
+    parser.add_argument("--features", type=int, default=100, help="features per project")
+    parser.add_argument("--comments", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic data and requests")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="tolerated slowdown (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            results["regressions"] = compare(results, json.load(baseline_file), args.threshold)
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"results written to {args.output}")
+    for regression in results.get("regressions", []):
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if results.get("regressions") else 0)
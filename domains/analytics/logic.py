@@ -0,0 +1,180 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from odmantic import ObjectId
+from pymongo import UpdateOne
+
+from domains.analytics.models import RatingRollup, RatingSummary
+from domains.features.models import Feature
+from domains.survey.exceptions import ModelNotFound
+from domains.survey import storage
+from domains.survey.models import SurveyComment
+
+RATINGS = ["1", "2", "3", "4", "5"]
+UNKNOWN_LANGUAGE = 'unknown'
+GROUP_BY_KEYS = {"day": +RatingRollup.day, "language": +RatingRollup.language, "feature": +RatingRollup.feature}
+
+
+def _day(date: datetime) -> datetime:
+    # Days in UTC, as $dateTrunc in rebuild_rating_rollups (naive dates are stored as UTC)
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc)
+    return datetime(date.year, date.month, date.day)
+
+
+async def update_rating_rollups(engine,
+                                comments: Iterable[dict],
+                                feature_projects: Dict[ObjectId, ObjectId],
+                                sign: int = 1):
+    '''
+    Add freshly written comments to their (feature, day, language) rollups
+    with atomic upserts, a single bulk write for all the comments
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+    comments : Iterable[dict]
+        Comment documents as written in the SurveyComment collection
+    feature_projects : Dict[ObjectId, ObjectId]
+        Project of each feature of the comments
+    sign : int
+        -1 to remove the comments from their rollups (e.g. before changing their language)
+    '''
+    increments = defaultdict(lambda: defaultdict(int))
+    for comment in comments:
+        key = (comment[+SurveyComment.feature],
+               _day(comment[+SurveyComment.date]),
+               comment.get(+SurveyComment.language) or UNKNOWN_LANGUAGE)
+        rating = comment[+SurveyComment.rating]
+        increments[key][+RatingRollup.count] += sign
+        increments[key][+RatingRollup.sum] += sign * rating
+        increments[key][f"{+RatingRollup.histogram}.{rating}"] += sign
+    if not increments:
+        return
+    operations = [
+        UpdateOne({+RatingRollup.feature: feature, +RatingRollup.day: day, +RatingRollup.language: language},
+                  {"$inc": dict(increment),
+                   "$setOnInsert": {+RatingRollup.project: feature_projects[feature]}},
+                  upsert=True)
+        for (feature, day, language), increment in increments.items()
+    ]
+    await engine.get_collection(RatingRollup).bulk_write(operations, ordered=False)
+
+
+async def rebuild_rating_rollups(engine):
+    '''
+    Recompute every rollup from the comments (whatever their storage) with an aggregation pipeline,
+    the rollup collection is replaced at the end of the pipeline (its indexes are kept).
+    Comments written while the pipeline runs may be missed, run it when traffic is low.
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+    '''
+    # Keys of the stored layout, see storage.comment_storage
+    field = storage.comment_storage.field
+    pipeline = [
+        {"$group": {
+            "_id": {"feature": f"${field(+SurveyComment.feature)}",
+                    "day": {"$dateTrunc": {"date": f"${field(+SurveyComment.date)}", "unit": "day"}},
+                    "language": {"$ifNull": [f"${field(+SurveyComment.language)}", UNKNOWN_LANGUAGE]},
+                    "rating": f"${field(+SurveyComment.rating)}"},
+            "count": {"$sum": 1}}},
+        {"$group": {
+            "_id": {"feature": "$_id.feature", "day": "$_id.day", "language": "$_id.language"},
+            "count": {"$sum": "$count"},
+            "sum": {"$sum": {"$multiply": ["$_id.rating", "$count"]}},
+            "histogram": {"$push": {"k": {"$toString": "$_id.rating"}, "v": "$count"}}}},
+        {"$lookup": {"from": Feature.__collection__,
+                     "localField": "_id.feature",
+                     "foreignField": "_id",
+                     "pipeline": [{"$project": {+Feature.project: 1}}],
+                     "as": "features"}},
+        {"$project": {"_id": 0,
+                      +RatingRollup.project: {"$first": f"$features.{+Feature.project}"},
+                      +RatingRollup.feature: "$_id.feature",
+                      +RatingRollup.day: "$_id.day",
+                      +RatingRollup.language: "$_id.language",
+                      +RatingRollup.count: 1,
+                      +RatingRollup.sum: 1,
+                      +RatingRollup.histogram: {"$arrayToObject": "$histogram"}}},
+        {"$out": RatingRollup.__collection__},
+    ]
+    await storage.comment_storage.collection(engine).aggregate(pipeline).to_list(length=None)
+
+
+def _summarize(key: Optional[str], count: int, rating_sum: int, distribution: Dict[str, int]) -> RatingSummary:
+    return RatingSummary(key=key,
+                         count=count,
+                         average=rating_sum / count if count else None,
+                         distribution=distribution)
+
+
+async def get_rating_summaries(engine,
+                               project_id: Optional[str] = None,
+                               feature_url: Optional[str] = None,
+                               starting_date: Optional[datetime] = None,
+                               ending_date: Optional[datetime] = None,
+                               language: Optional[str] = None,
+                               group_by: Optional[str] = None) -> List[RatingSummary]:
+    '''
+    Rating summaries of a feature (by its URL) or of a project, merged from the daily rollups.
+    The rollups are per UTC day: starting_date and ending_date select whole days, from the day
+    of starting_date to the day of ending_date included (their time of day is ignored).
+
+    Raises
+    ------
+    ModelNotFound
+        Unknown feature, or neither a feature nor a project
+    '''
+    if feature_url is not None:
+        feature = await engine.get_collection(Feature).find_one({+Feature.resource: feature_url}, {"_id": 1})
+        if feature is None:
+            raise ModelNotFound
+        query = {+RatingRollup.feature: feature["_id"]}
+    elif project_id is not None:
+        query = {+RatingRollup.project: ObjectId(project_id)}
+    else:
+        raise ModelNotFound
+    day_range = {}
+    if starting_date is not None:
+        day_range["$gte"] = _day(starting_date)
+    if ending_date is not None:
+        day_range["$lte"] = _day(ending_date)
+    if day_range:
+        query[+RatingRollup.day] = day_range
+    if language is not None:
+        query[+RatingRollup.language] = language
+
+    projection = {"_id": 0, +RatingRollup.count: 1, +RatingRollup.sum: 1, +RatingRollup.histogram: 1}
+    if group_by is not None:
+        projection[GROUP_BY_KEYS[group_by]] = 1
+    rollups = await engine.get_collection(RatingRollup).find(query, projection).to_list(length=None)
+    if not rollups:
+        return [] if group_by is not None else [_summarize(None, 0, 0, {rating: 0 for rating in RATINGS})]
+
+    # Merge the daily rollups of the range, pandas is only imported when first needed (slow import)
+    import pandas as pd
+    frame = pd.DataFrame({
+        "key": [str(rollup[GROUP_BY_KEYS[group_by]]) if group_by else "" for rollup in rollups],
+        "count": [rollup[+RatingRollup.count] for rollup in rollups],
+        "sum": [rollup[+RatingRollup.sum] for rollup in rollups],
+        **{rating: [rollup[+RatingRollup.histogram].get(rating, 0) for rollup in rollups] for rating in RATINGS},
+    })
+    merged = frame.groupby("key", sort=True).sum()
+
+    keys = {}
+    if group_by == "feature":
+        features = engine.get_collection(Feature).find({"_id": {"$in": [ObjectId(key) for key in merged.index]}},
+                                                       {+Feature.resource: 1})
+        keys = {str(feature["_id"]): feature.get(+Feature.resource) async for feature in features}
+    elif group_by == "day":
+        keys = {key: datetime.fromisoformat(key).date().isoformat() for key in merged.index}
+    return [_summarize(keys.get(key, key) if group_by else None,
+                       int(row["count"]),
+                       int(row["sum"]),
+                       {rating: int(row[rating]) for rating in RATINGS})
+            for key, row in merged.iterrows()]
@@ -0,0 +1,42 @@
+from datetime import datetime
+from typing import Dict, Optional
+
+from odmantic import Model, ObjectId
+from pydantic import BaseModel
+
+
+class RatingRollup(Model):
+    """
+    This class is a model of the ratings given on a feature, a given day, in a given language.
+    The counters are incremented on every comment written and rebuilt from
+    the comments by :py:func:`~domains.analytics.logic.rebuild_rating_rollups`.
+
+    Attributes:
+    -----------
+        project:          Project of the feature (no reference so as to avoid lookups)
+        feature:          Feature commented
+        day:              Day of the comments (midnight UTC)
+        language:         Language of the comments
+        count:            Number of comments
+        sum:              Sum of the ratings
+        histogram:        Number of comments per rating ("1" to "5")
+    """
+    project: ObjectId
+    feature: ObjectId
+    day: datetime
+    language: str
+    count: int
+    sum: int
+    histogram: Dict[str, int]
+
+
+class RatingSummary(BaseModel):
+    """
+    This class is only used for modeling the API output
+    of the rating summaries computed from the rollups.
+    see :py:class:`~domains.analytics.RatingRollup`
+    """
+    key: Optional[str]
+    count: int
+    average: Optional[float]
+    distribution: Dict[str, int]
@@ -0,0 +1,29 @@
+'''
+Recompute the rating rollups from the comments.
+
+Usage: python -m domains.analytics.rebuild
+'''
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from odmantic import AIOEngine
+
+# Load the .env file before importing the domains, some of them read their settings at import time
+load_dotenv()
+
+from domains.analytics import logic
+
+
+async def main():
+    client = AsyncIOMotorClient(os.getenv("DB_URL"))
+    engine = AIOEngine(motor_client=client, database=os.getenv("DB_NAME"))
+    try:
+        await logic.rebuild_rating_rollups(engine)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
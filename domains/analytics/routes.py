@@ -0,0 +1,31 @@
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+
+from domains.analytics import logic
+from domains.analytics.models import RatingSummary
+from domains.survey.exceptions import ModelNotFound
+
+router = APIRouter()
+
+
+@router.get("/ratings", response_model=List[RatingSummary])
+async def get_rating_summaries(request: Request,
+                               project_id: Optional[str] = None,
+                               feature_url: Optional[str] = None,
+                               starting_date: Optional[datetime] = None,
+                               ending_date: Optional[datetime] = None,
+                               language: Optional[str] = None,
+                               group_by: Optional[str] = Query(None, regex="^(day|language|feature)$")
+                               ) -> List[RatingSummary]:
+    try:
+        return await logic.get_rating_summaries(request.app.engine,
+                                                project_id=project_id,
+                                                feature_url=feature_url,
+                                                starting_date=starting_date,
+                                                ending_date=ending_date,
+                                                language=language,
+                                                group_by=group_by)
+    except ModelNotFound as error:
+        raise HTTPException(404) from error
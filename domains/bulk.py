@@ -0,0 +1,30 @@
+from typing import Generic, List, TypeVar
+
+import bson
+from pydantic import BaseModel
+from pydantic.generics import GenericModel
+
+ItemType = TypeVar("ItemType")
+
+
+class BulkError(BaseModel):
+    """
+    This class is only used for modeling the error
+    of one item of a bulk creation.
+    """
+    index: int
+    detail: str
+
+
+class BulkResult(GenericModel, Generic[ItemType]):
+    """
+    This class is only used for modeling the result of a bulk creation
+    where some items were rejected (HTTP 207), items holds the created ones
+    and errors refers to the rejected ones by their index in the request.
+    """
+    items: List[ItemType]
+    errors: List[BulkError]
+
+    class Config:
+        # Same rendering as the ODMantic models created
+        json_encoders = {bson.ObjectId: str}
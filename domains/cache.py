@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Tuple
+
+from prometheus_client import Counter, Gauge
+
+# Named after the first cache (survey rules), kept for the existing dashboards
+CACHE_HITS = Counter("survey_cache_hits_total", "Number of cache lookups answered from memory", ["cache"])
+CACHE_MISSES = Counter("survey_cache_misses_total", "Number of cache lookups that fell through to MongoDB", ["cache"])
+CACHE_EVICTIONS = Counter("survey_cache_evictions_total", "Number of entries evicted because the cache was full", ["cache"])
+CACHE_SIZE = Gauge("survey_cache_entries", "Number of entries currently held in the cache", ["cache"])
+
+# Returned by TTLCache.get when the key is absent or expired, so that None can be cached
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded in-process cache with least-recently-used eviction
+    and a time to live on every entry.
+    Hits, misses and evictions are exported to prometheus under the cache name.
+
+    Attributes:
+    -----------
+        name:          Label used for the prometheus counters
+        max_size:      Maximum number of entries kept in memory
+        ttl:           Time to live of an entry in seconds
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+                CACHE_SIZE.labels(self.name).set(len(self._entries))
+            CACHE_MISSES.labels(self.name).inc()
+            return MISSING
+        self._entries.move_to_end(key)
+        CACHE_HITS.labels(self.name).inc()
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            CACHE_EVICTIONS.labels(self.name).inc()
+        CACHE_SIZE.labels(self.name).set(len(self._entries))
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+        CACHE_SIZE.labels(self.name).set(len(self._entries))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        CACHE_SIZE.labels(self.name).set(0)
+
+    def __len__(self) -> int:
+        return len(self._entries)
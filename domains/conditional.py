@@ -0,0 +1,116 @@
+import os
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+from odmantic import Field, Model
+from pymongo import UpdateOne
+
+from domains.cache import TTLCache, MISSING
+
+# Cache-Control of the responses with an ETag: the rules are read by every widget and may be cached
+# by the CDN for a while, the single resources are revalidated on every use
+RULES_CACHE_CONTROL = os.getenv("RULES_CACHE_CONTROL", "public, max-age=60")
+RESOURCE_CACHE_CONTROL = os.getenv("RESOURCE_CACHE_CONTROL", "private, no-cache")
+
+# Stamps read from MongoDB are trusted for a short while, so a 304 usually costs no query
+# (other workers see a write once their entry expires)
+versions_cache = TTLCache("resource_versions",
+                          max_size=int(os.getenv("RESOURCE_VERSION_CACHE_SIZE", "100000")),
+                          ttl=float(os.getenv("RESOURCE_VERSION_CACHE_TTL", "5")))
+
+# Key of the stamp shared by all the rules, bumped when features disappear with their project
+ALL_RULES = "*"
+
+
+class ResourceVersion(Model):
+    """
+    This class is a model of the version stamp of a resource served with an ETag,
+    bumped on every write of the resource.
+
+    Attributes:
+    -----------
+        id:               Kind and key of the resource (e.g. project:<id>)
+        version:          Number of writes of the resource
+        modified:         Date of the last write
+    """
+    id: str = Field(primary_field=True)
+    version: int
+    modified: datetime
+
+
+def _key(kind: str, key: str) -> str:
+    return f"{kind}:{key}"
+
+
+async def bump(engine, kind: str, keys: Iterable[str]):
+    '''
+    Record a write of the resources, their ETag and Last-Modified change
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+    kind : str
+        Kind of the resources (project, rules)
+    keys : Iterable[str]
+        Keys of the written resources of this kind
+    '''
+    stamp_keys = {_key(kind, key) for key in keys}
+    if not stamp_keys:
+        return
+    update = {"$inc": {+ResourceVersion.version: 1}, "$set": {+ResourceVersion.modified: datetime.utcnow()}}
+    await engine.get_collection(ResourceVersion).bulk_write(
+        [UpdateOne({"_id": stamp_key}, update, upsert=True) for stamp_key in stamp_keys], ordered=False)
+    for stamp_key in stamp_keys:
+        versions_cache.invalidate(stamp_key)
+
+
+async def get_version(engine, kind: str, key: str) -> Tuple[int, Optional[datetime]]:
+    '''
+    Version and date of the last write of a resource, (0, None) if it was never written since stamps exist
+    '''
+    stamp_key = _key(kind, key)
+    stamp = versions_cache.get(stamp_key)
+    if stamp is MISSING:
+        document = await engine.get_collection(ResourceVersion).find_one({"_id": stamp_key})
+        stamp = (0, None) if document is None else (document[+ResourceVersion.version],
+                                                    document[+ResourceVersion.modified])
+        versions_cache.set(stamp_key, stamp)
+    return stamp
+
+
+def make_etag(*parts) -> str:
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    # If-None-Match takes precedence over If-Modified-Since (RFC 7232)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison, proxies may strip the W/ prefix
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return etag in tags or etag[2:] in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def set_headers(response: Response, etag: str, last_modified: Optional[datetime], cache_control: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    if last_modified is not None:
+        response.headers["Last-Modified"] = format_datetime(last_modified.replace(microsecond=0), usegmt=False) \
+            .replace("-0000", "GMT")
+
+
+def not_modified_response(etag: str, last_modified: Optional[datetime], cache_control: str) -> Response:
+    response = Response(status_code=304)
+    set_headers(response, etag, last_modified, cache_control)
+    return response
@@ -0,0 +1,42 @@
+import os
+from typing import Dict, Type
+
+from bson import json_util
+from odmantic import Model
+
+from domains.cache import TTLCache, MISSING
+
+# Filtered counts are served from memory for a short while, dashboards refresh them often
+counts_cache = TTLCache("counts",
+                        max_size=int(os.getenv("COUNT_CACHE_SIZE", "1000")),
+                        ttl=float(os.getenv("COUNT_CACHE_TTL", "10")))
+
+
+async def count(engine, model: Type[Model], query: Dict, exact: bool = False) -> int:
+    '''
+    Number of documents of `model` matching `query`. Unless exact, the collection metadata
+    gives the count of an unfiltered collection (no scan) and filtered counts are cached for
+    COUNT_CACHE_TTL seconds.
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+    model : Type[Model]
+        Model of the counted documents
+    query : QueryExpression or dict
+        Filter of the count, empty for the whole collection
+    exact : bool
+        Always count the matching documents
+    '''
+    collection = engine.get_collection(model)
+    if exact:
+        return await collection.count_documents(query)
+    if not query:
+        return await collection.estimated_document_count()
+    key = (model.__collection__, json_util.dumps(query, sort_keys=True))
+    result = counts_cache.get(key)
+    if result is MISSING:
+        result = await collection.count_documents(query)
+        counts_cache.set(key, result)
+    return result
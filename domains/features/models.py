@@ -18,7 +18,7 @@ class FeatureInApi(Model):
     resource: Optional[str]
     synced: Optional[datetime]
     payload: Optional[Dict[Any, Any]]
-    requirement_ids: List[ObjectId] = []
+    requirement_ids: List[str] = []
 
 
 class Feature(Model):
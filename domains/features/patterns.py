@@ -0,0 +1,345 @@
+import asyncio
+import logging
+import os
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+from odmantic import ObjectId
+
+from domains import conditional
+from domains.features.models import Feature
+from domains.projects.models import Project
+
+logger = logging.getLogger(__name__)
+
+# Version stamp (see domains.conditional) of the features of a project, bumped when they change
+STAMP_KIND = "feature_patterns"
+
+# Segment of a resource matching any segment, and segments or parts of segments with a wildcard
+ANY_SEGMENT = re.compile(r"^(\*|\{[^{}/]*\})$")
+WILDCARD = re.compile(r"\{[^{}/]*\}|\*")
+# Last segment of a resource matching the rest of the path (possibly nothing)
+REST = "**"
+
+
+class FeatureMatch(NamedTuple):
+    feature: ObjectId
+    project: ObjectId
+    resource: str
+
+
+class _Node:
+    __slots__ = ("literals", "partials", "shapes", "any", "rest", "match")
+
+    def __init__(self):
+        self.literals: Dict[str, _Node] = {}
+        # Partial wildcard segments by (literal prefix, literal suffix), then by regex
+        self.partials: Dict[Tuple[str, str], Dict[str, _Partial]] = {}
+        # (prefix length, suffix length) of the partial wildcard segments, longest affixes first
+        self.shapes: List[Tuple[int, int]] = []
+        self.any: Optional[_Node] = None
+        self.rest: Optional[FeatureMatch] = None
+        self.match: Optional[FeatureMatch] = None
+
+
+class _Partial:
+    __slots__ = ("pattern", "regex", "node")
+
+    def __init__(self, pattern: Optional[str], node: _Node):
+        # A segment with a single wildcard matches whenever its affixes do: no regex
+        self.pattern = pattern
+        self.regex: Optional[re.Pattern] = None
+        self.node = node
+
+    def fullmatch(self, segment: str) -> bool:
+        if self.pattern is None:
+            return True
+        if self.regex is None:
+            # Compiled on first use, compiling every pattern would dominate the compilation of the trie
+            self.regex = re.compile(self.pattern)
+        return self.regex.fullmatch(segment) is not None
+
+
+def split_url(url: str) -> Tuple[str, List[str]]:
+    '''
+    Origin (scheme://host, lower case) and path segments of a URL, without its query string and fragment.
+    Empty segments are ignored (/orders/ is /orders).
+    '''
+    parts = urlsplit(url)
+    origin = f"{parts.scheme.lower()}://{parts.netloc.lower()}" if parts.netloc else ""
+    return origin, [segment for segment in parts.path.split("/") if segment]
+
+
+def _segment_regex(segment: str) -> Tuple[str, str, str, int]:
+    # {name} and * match any part of a single segment, the rest is literal:
+    # regex, literal prefix and suffix, number of wildcards
+    wildcards = list(WILDCARD.finditer(segment))
+    pattern, position = "", 0
+    for wildcard in wildcards:
+        pattern += re.escape(segment[position:wildcard.start()]) + "[^/]*"
+        position = wildcard.end()
+    return (pattern + re.escape(segment[position:]), segment[:wildcards[0].start()], segment[wildcards[-1].end():],
+            len(wildcards))
+
+
+class UrlPatternMatcher:
+    """
+    Resources of the features of an origin (whatever their project) compiled into a trie of path segments,
+    so that resolving a URL only visits the branches matching its segments: in order of specificity,
+    backtracking when a branch leads to no resource. Every node is visited at most once (the trie is a tree),
+    the worst case is bounded by the nodes matching a prefix of the path rather than by its length.
+    A resource is either a literal URL or a pattern whose segments may hold
+    path templates ({id}), globs (*, page-*.html) or end with ** (rest of the path).
+    At every segment, a literal beats a partial wildcard which beats a whole segment wildcard,
+    which beats **: the most specific resource wins. Between partial wildcards,
+    the one with the longest literal prefix and suffix wins.
+    Partial wildcards are indexed by their literal prefix and suffix: a segment is only tested
+    against the patterns sharing its affixes.
+
+    Attributes:
+    -----------
+        exact:            Features by literal resource (query string included)
+        root:             Root of the trie
+    """
+
+    def __init__(self):
+        self.exact: Dict[str, FeatureMatch] = {}
+        self.root = _Node()
+
+    def add(self, feature: ObjectId, project: ObjectId, resource: str):
+        match = FeatureMatch(feature=feature, project=project, resource=resource)
+        _, segments = split_url(resource)
+        node = self.root
+        if not WILDCARD.search(resource):
+            # The first feature of a resource wins, as the former lookup by equality did
+            self.exact.setdefault(resource, match)
+            if urlsplit(resource).query:
+                # The query string of a literal resource is significant, only matched by equality
+                return
+        for position, segment in enumerate(segments):
+            if segment == REST and position == len(segments) - 1:
+                node.rest = node.rest or match
+                return
+            if ANY_SEGMENT.match(segment):
+                node.any = node.any or _Node()
+                node = node.any
+            elif WILDCARD.search(segment):
+                pattern, prefix, suffix, wildcards = _segment_regex(segment)
+                patterns = node.partials.setdefault((prefix, suffix), {})
+                if pattern not in patterns:
+                    patterns[pattern] = _Partial(pattern if wildcards > 1 else None, _Node())
+                    shape = (len(prefix), len(suffix))
+                    if shape not in node.shapes:
+                        node.shapes.append(shape)
+                        node.shapes.sort(key=lambda lengths: -sum(lengths))
+                node = patterns[pattern].node
+            else:
+                node = node.literals.setdefault(segment, _Node())
+        node.match = node.match or match
+
+    def match(self, segments: List[str]) -> Optional[FeatureMatch]:
+        return self._match(self.root, segments, 0)
+
+    def _match(self, node: _Node, segments: List[str], position: int) -> Optional[FeatureMatch]:
+        if position == len(segments):
+            return node.match or node.rest
+        segment = segments[position]
+        child = node.literals.get(segment)
+        if child is not None:
+            match = self._match(child, segments, position + 1)
+            if match is not None:
+                return match
+        for prefix_length, suffix_length in node.shapes:
+            if prefix_length + suffix_length > len(segment):
+                continue
+            patterns = node.partials.get((segment[:prefix_length], segment[len(segment) - suffix_length:]))
+            for partial in (patterns or {}).values():
+                if partial.fullmatch(segment):
+                    match = self._match(partial.node, segments, position + 1)
+                    if match is not None:
+                        return match
+        if node.any is not None:
+            match = self._match(node.any, segments, position + 1)
+            if match is not None:
+                return match
+        return node.rest
+
+
+# Features of the projects: (feature, resource) by origin, by project
+ProjectResources = Dict[ObjectId, Dict[str, List[Tuple[ObjectId, str]]]]
+
+
+def compile_matchers(resources: ProjectResources, origins: Iterable[str]) -> Dict[str, UrlPatternMatcher]:
+    '''
+    Matcher of every origin, from the features of all the projects on that origin
+    '''
+    origins = set(origins)
+    matchers = {}
+    # In project order so that the first feature of a resource is always the same
+    for project in sorted(resources):
+        for origin, features in resources[project].items():
+            if origin in origins:
+                matcher = matchers.setdefault(origin, UrlPatternMatcher())
+                for feature, resource in features:
+                    matcher.add(feature, project, resource)
+    return matchers
+
+
+def _group_resources(features: List[dict]) -> ProjectResources:
+    resources = {}
+    for feature in features:
+        resource = feature[+Feature.resource]
+        project_resources = resources.setdefault(feature.get(+Feature.project), {})
+        project_resources.setdefault(split_url(resource)[0], []).append((feature["_id"], resource))
+    return resources
+
+
+class FeaturePatternStore:
+    """
+    In-memory matchers of the features of every origin, so that resolving the URL sent by
+    the widget into a feature never touches the database. The origins of a project are recompiled
+    when the version stamp of its features changes: at once in the worker that changed them,
+    within refresh_interval seconds in the others. Matchers are compiled in a thread and swapped
+    when ready, the event loop keeps serving with the previous ones meanwhile.
+
+    Attributes:
+    -----------
+        refresh_interval:      Time in seconds between two checks of the version stamps
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self.matchers: Dict[str, UrlPatternMatcher] = {}
+        self.resources: ProjectResources = {}
+        self.versions: Dict[ObjectId, int] = {}
+        self._loaded = False
+        self._loading: Optional[asyncio.Future] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, engine):
+        # The features are loaded in the background, the first resolutions wait for them
+        self._task = asyncio.create_task(self._run(engine))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def wait_loaded(self, engine):
+        if self._loaded:
+            return
+        if self._loading is None or self._loading.done():
+            self._loading = asyncio.ensure_future(self.load(engine))
+        await self._loading
+
+    async def resolve(self, engine, url: str) -> Optional[FeatureMatch]:
+        '''
+        Feature of a URL: the feature whose resource is the URL, otherwise the most specific
+        resource matching the URL without its query string, None if no resource matches
+        '''
+        await self.wait_loaded(engine)
+        origin, segments = split_url(url)
+        matcher = self.matchers.get(origin)
+        if matcher is None:
+            return None
+        return matcher.exact.get(url) or matcher.match(segments)
+
+    async def load(self, engine):
+        async with self._get_lock():
+            # Stamps first: a change made while the features are read is picked up by the next refresh
+            versions = await self._read_versions(engine)
+            features = await engine.get_collection(Feature).find(
+                {+Feature.resource: {"$ne": None}}, {+Feature.resource: 1, +Feature.project: 1}).to_list(length=None)
+
+            def compile_all():
+                resources = _group_resources(features)
+                return resources, compile_matchers(resources, {origin for project_resources in resources.values()
+                                                               for origin in project_resources})
+
+            self.resources, self.matchers = await asyncio.get_running_loop().run_in_executor(None, compile_all)
+            self.versions = versions
+            self._loaded = True
+
+    async def refresh(self, engine):
+        versions = await self._read_versions(engine)
+        changed = [project for project, version in versions.items() if self.versions.get(project, 0) != version]
+        if changed:
+            await self._load_projects(engine, changed, versions)
+
+    async def changed(self, engine, projects: Iterable[ObjectId]):
+        '''
+        Record that the features of the projects changed, and recompile them at once in this worker.
+        The URLs of their resources may now resolve to other features: the version stamps of the rules
+        of their features, before and after the change, are bumped as well.
+        '''
+        projects = list(set(projects))
+        await conditional.bump(engine, STAMP_KIND, [str(project) for project in projects])
+        features = {feature for project in projects
+                    for project_features in self.resources.get(project, {}).values()
+                    for feature, _ in project_features}
+        if self._loaded:
+            await self._load_projects(engine, projects, await self._read_versions(engine))
+            features.update(feature for project in projects
+                            for project_features in self.resources.get(project, {}).values()
+                            for feature, _ in project_features)
+        else:
+            features.update({feature["_id"] async for feature in engine.get_collection(Feature).find(
+                {+Feature.project: {"$in": projects}}, {"_id": 1})})
+        if features:
+            await conditional.bump(engine, "rules", [str(feature) for feature in features])
+
+    def _get_lock(self) -> asyncio.Lock:
+        # Created in the event loop of the service
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _read_versions(self, engine) -> Dict[ObjectId, int]:
+        cursor = engine.get_collection(conditional.ResourceVersion).find(
+            {"_id": {"$regex": f"^{STAMP_KIND}:"}}, {+conditional.ResourceVersion.version: 1})
+        return {ObjectId(stamp["_id"].split(":", 1)[1]): stamp[+conditional.ResourceVersion.version]
+                async for stamp in cursor}
+
+    async def _load_projects(self, engine, projects: List[ObjectId], versions: Dict[ObjectId, int]):
+        async with self._get_lock():
+            existing = [project["_id"] async for project in engine.get_collection(Project).find(
+                {"_id": {"$in": projects}}, {"_id": 1})]
+            features = await engine.get_collection(Feature).find(
+                {+Feature.project: {"$in": existing}, +Feature.resource: {"$ne": None}},
+                {+Feature.resource: 1, +Feature.project: 1}).to_list(length=None)
+
+            def recompile():
+                # The features of a deleted project are deleted in the background, forget them at once
+                changed = _group_resources(features)
+                reloaded = set(projects)
+                origins = {origin for project in projects
+                           for project_resources in (self.resources.get(project, {}), changed.get(project, {}))
+                           for origin in project_resources}
+                resources = {project: project_resources for project, project_resources in self.resources.items()
+                             if project not in reloaded}
+                resources.update(changed)
+                matchers = {origin: matcher for origin, matcher in self.matchers.items() if origin not in origins}
+                matchers.update(compile_matchers(resources, origins))
+                return resources, matchers
+
+            self.resources, self.matchers = await asyncio.get_running_loop().run_in_executor(None, recompile)
+            for project in projects:
+                self.versions[project] = versions.get(project, 0)
+
+    async def _run(self, engine):
+        try:
+            await self.wait_loaded(engine)
+        except Exception:
+            logger.exception("Unable to load the feature patterns, loading them on first use")
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                if self._loaded:
+                    await self.refresh(engine)
+            except Exception:
+                logger.exception("Unable to refresh the feature patterns, keeping the previous ones")
+
+
+feature_patterns = FeaturePatternStore(refresh_interval=float(os.getenv("FEATURE_PATTERNS_REFRESH_INTERVAL", "10")))
@@ -1,23 +1,51 @@
-from typing import List, Optional
+from typing import List, Optional, Union
 
-from fastapi import APIRouter, HTTPException, Request
+from bson.errors import InvalidId
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request, Response
 from odmantic import ObjectId
-
+from odmantic.query import and_
+from pymongo.errors import BulkWriteError
+
+from domains import conditional, counts, pagination, serialization
+from domains.bulk import BulkError, BulkResult
+from domains.jobs import logic as jobs_logic
+from domains.jobs.models import CascadeDeleteJob
+from domains.pagination import Page, InvalidCursor
+from domains.serialization import InvalidFields
 from domains.features.models import Feature, FeatureInApi
+from domains.features.patterns import feature_patterns
 from domains.projects.models import Project
 
 router = APIRouter()
 
 
-@router.post("", response_model=List[Feature])
-async def create_feature(features_request: List[FeatureInApi], request: Request):
-    features = []
-    for feature_req in features_request:
-        project = await request.app.engine.find_one(Project, Project.id == ObjectId(feature_req.project_id))
+@router.post("", response_model=Union[List[Feature], BulkResult[Feature]])
+async def create_feature(features_request: List[FeatureInApi], request: Request, response: Response):
+    errors = []
+    # Resolve all the referenced projects at once
+    project_ids = {}
+    for index, feature_req in enumerate(features_request):
+        try:
+            project_ids[index] = ObjectId(feature_req.project_id)
+        except InvalidId:
+            errors.append(BulkError(index=index, detail="invalid project_id"))
+    projects = await request.app.engine.find(Project, Project.id.in_(list(set(project_ids.values()))))
+    projects = {project.id: project for project in projects}
+
+    features, indexes = [], []
+    for index, project_id in project_ids.items():
+        if project_id not in projects:
+            errors.append(BulkError(index=index, detail="project not found"))
+            continue
+        feature_req = features_request[index]
         # Deal with the many to many relation between the feature and the requirements
-        requirements = [ObjectId(req_id) for req_id in feature_req.requirement_ids]
+        try:
+            requirements = [ObjectId(req_id) for req_id in feature_req.requirement_ids]
+        except InvalidId:
+            errors.append(BulkError(index=index, detail="invalid requirement_ids"))
+            continue
         # Create the feature and link the projects and requirements
-        feature = Feature(project=project,
+        feature = Feature(project=projects[project_id],
                           synced=feature_req.synced,
                           name=feature_req.name,
                           description=feature_req.description,
@@ -25,24 +53,57 @@ async def create_feature(features_request: List[FeatureInApi], request: Request)
                           payload=feature_req.payload,
                           requirement_ids=requirements)
         features.append(feature)
-    await request.app.engine.save_all(features)
+        indexes.append(index)
+
+    if features:
+        try:
+            await request.app.engine.get_collection(Feature).insert_many([feature.doc() for feature in features],
+                                                                         ordered=False)
+        except BulkWriteError as error:
+            failed = {write_error["index"]: write_error["errmsg"] for write_error in error.details["writeErrors"]}
+            errors.extend(BulkError(index=indexes[position], detail=detail) for position, detail in failed.items())
+            features = [feature for position, feature in enumerate(features) if position not in failed]
+    if features:
+        # Recompile the URL patterns of the projects
+        await feature_patterns.changed(request.app.engine, [feature.project.id for feature in features])
+    if errors:
+        response.status_code = 207
+        return BulkResult(items=features, errors=sorted(errors, key=lambda bulk_error: bulk_error.index))
     return features
 
 
 # TODO: PATCH verb
 
-@router.get("", response_model=List[Feature])
-async def get_features(request: Request, name: Optional[str] = None):
-    query = ""
+@router.get("", response_model=Union[Page[Feature], List[Feature]])
+async def get_features(request: Request,
+                       name: Optional[str] = None,
+                       limit: Optional[int] = Query(None, gt=0, le=pagination.MAX_LIMIT),
+                       cursor: Optional[str] = None,
+                       fields: Optional[str] = None):
+    query = {}
     if name:
         query = Feature.name == name
-    return await request.app.engine.find(Feature, query)
+    try:
+        # Payloads are only listed when requested
+        return await pagination.find_list(request.app.engine, Feature, query, None, limit, cursor,
+                                          serialization.parse_fields(Feature, fields))
+    except (InvalidCursor, InvalidFields) as error:
+        raise HTTPException(400, str(error) or None) from error
 
 
 @router.get("/count", response_model=int)
-async def count_features(request: Request):
-    count = await request.app.engine.count(Feature)
-    return count
+async def count_features(request: Request,
+                         name: Optional[str] = None,
+                         project_id: Optional[ObjectId] = None,
+                         exact: bool = False):
+    # Estimated from the collection metadata when unfiltered, cached for a few seconds otherwise
+    queries = []
+    if name:
+        queries.append(Feature.name == name)
+    if project_id is not None:
+        queries.append(Feature.project == project_id)
+    query = and_(*queries) if len(queries) > 1 else (queries[0] if queries else {})
+    return await counts.count(request.app.engine, Feature, query, exact)
 
 
 @router.get("/{id}", response_model=Feature)
@@ -53,19 +114,28 @@ async def get_feature_by_id(id: ObjectId, request: Request):
     return feature
 
 
-@router.delete("/{id}")
-async def delete_feature_by_id(id: ObjectId, request: Request):
+@router.delete("/{id}", response_model=CascadeDeleteJob, status_code=202)
+async def delete_feature_by_id(id: ObjectId, request: Request, background_tasks: BackgroundTasks):
     feature = await request.app.engine.find_one(Feature, Feature.id == id)
     if feature is None:
         raise HTTPException(404)
-    else:
-        await request.app.engine.delete(feature)
-        # Cascade delete related documents
-        await request.app.mongodb_client.ottm.system.buckets.traffic.delete_many({"meta.feature": id})
-        await request.app.mongodb_client.ottm.system.buckets.latency.delete_many({"meta.feature": id})
-
-
-@router.get("/project/{id}", response_model=List[Feature])
-async def get_project_features(request: Request, id: ObjectId):
-    features = await request.app.engine.find(Feature, Feature.project == id)
-    return features
+    await request.app.engine.delete(feature)
+    await conditional.bump(request.app.engine, "rules", [str(feature.id)])
+    await feature_patterns.changed(request.app.engine, [feature.project.id])
+    # Cascade delete related documents once the response is sent, follow it with GET /jobs/{job id}
+    job = await jobs_logic.create_cascade_delete(request.app.engine, "feature", id)
+    background_tasks.add_task(jobs_logic.run_cascade_delete, request.app.engine, job, jobs_logic.FEATURE_CASCADE)
+    return job
+
+
+@router.get("/project/{id}", response_model=Union[Page[Feature], List[Feature]])
+async def get_project_features(request: Request,
+                               id: ObjectId,
+                               limit: Optional[int] = Query(None, gt=0, le=pagination.MAX_LIMIT),
+                               cursor: Optional[str] = None,
+                               fields: Optional[str] = None):
+    try:
+        return await pagination.find_list(request.app.engine, Feature, Feature.project == id, None, limit, cursor,
+                                          serialization.parse_fields(Feature, fields))
+    except (InvalidCursor, InvalidFields) as error:
+        raise HTTPException(400, str(error) or None) from error
@@ -0,0 +1,70 @@
+'''
+Detect the language of the comments stored without one (written before language detection, or unknown),
+resuming the last backfill which did not complete. Stop it at any time, run it again to resume.
+
+Usage: python -m domains.jobs.backfill_languages [--all] [--restart] [--workers 4] [--batch-size 2000]
+                                                 [--max-rate 0]
+'''
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from odmantic import AIOEngine
+
+# Load the .env file before importing the domains, some of them read their settings at import time
+load_dotenv()
+
+from domains.jobs import logic
+from domains.jobs.models import DONE
+from domains.survey import storage
+from domains.survey.language import LanguageDetectionPool
+
+
+async def main(args) -> bool:
+    if not storage.comment_storage.updatable:
+        print("The comments of SURVEY_COMMENTS_STORAGE=timeseries cannot be updated one by one", file=sys.stderr)
+        return False
+    client = AsyncIOMotorClient(os.getenv("DB_URL"))
+    engine = AIOEngine(motor_client=client, database=os.getenv("DB_NAME"))
+    pool = LanguageDetectionPool(executor_type="process", workers=args.workers, batch_size=args.batch_size,
+                                 batch_delay=0)
+    try:
+        job = None if args.restart else await logic.find_language_backfill(engine, args.all)
+        if job is None:
+            job = await logic.create_language_backfill(engine, args.all)
+            print(f"Language backfill {job.id} started")
+        else:
+            print(f"Language backfill {job.id} resumed after comment {job.last_id} "
+                  f"({job.scanned} comments detected, {job.updated} updated)")
+        await pool.start()
+        await pool.warm_up()
+        scanned = job.scanned
+        start = time.perf_counter()
+        job = await logic.run_language_backfill(engine, job, pool, batch_size=args.batch_size,
+                                                max_rate=args.max_rate, report_interval=args.report_interval)
+        elapsed = time.perf_counter() - start
+        print(f"Language backfill {job.id} {job.status}: {job.scanned} comments detected, {job.updated} updated, "
+              f"{(job.scanned - scanned) / elapsed:.0f} comments/s")
+        return job.status == DONE
+    finally:
+        await pool.stop()
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--all", action="store_true", help="detect the language of every comment")
+    parser.add_argument("--restart", action="store_true", help="start over instead of resuming")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="detection processes (all the cores)")
+    parser.add_argument("--batch-size", type=int, default=logic.BACKFILL_BATCH_SIZE)
+    parser.add_argument("--max-rate", type=float, default=logic.BACKFILL_MAX_RATE,
+                        help="comments per second at most, 0 for no limit")
+    parser.add_argument("--report-interval", type=float, default=logic.BACKFILL_REPORT_INTERVAL,
+                        help="seconds between two progress reports")
+    sys.exit(0 if asyncio.run(main(parser.parse_args())) else 1)
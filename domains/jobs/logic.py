@@ -0,0 +1,314 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import pymongo
+from odmantic import ObjectId
+from odmantic.query import desc
+from pymongo import UpdateOne
+
+from domains.analytics import logic as analytics_logic
+from domains.features.models import Feature
+from domains.jobs.models import CascadeDeleteJob, LanguageBackfillJob, PENDING, RUNNING, DONE, FAILED
+from domains.survey import search
+from domains.survey.language import LanguageDetectionPool, UNKNOWN_LANGUAGE
+from domains.survey.models import SurveyComment
+
+logger = logging.getLogger(__name__)
+
+# Collections deleted concurrently by a job
+CONCURRENCY = int(os.getenv("CASCADE_DELETE_CONCURRENCY", "4"))
+# Documents deleted per round-trip, with a pause in between so that other traffic is not starved
+BATCH_SIZE = int(os.getenv("CASCADE_DELETE_BATCH_SIZE", "1000"))
+BATCH_PAUSE = float(os.getenv("CASCADE_DELETE_BATCH_PAUSE", "0.01"))
+# Seconds without heartbeat after which a pending or running job is deemed abandoned by a dead worker
+STALE_AFTER = float(os.getenv("CASCADE_DELETE_STALE_AFTER", "300"))
+HEARTBEAT_INTERVAL = STALE_AFTER / 5
+
+# Timeseries collections (see schema.setup), only deletable on their metaField
+TIMESERIES = {"traffic", "latency", "availability", "commit", "exception"}
+
+# (collection, field referencing the deleted document)
+PROJECT_CASCADE = [
+    ("build", "project"),
+    ("code_quality", "project"),
+    ("issue", "project"),
+    ("issue_revision", "project"),
+    ("tool", "project"),
+    ("traffic", "metadata.project"),
+    ("latency", "metadata.project"),
+    ("commit", "metadata.project"),
+    ("exception", "metadata.project"),
+    ("feature", "project"),
+    ("requirement", "project"),
+    ("version", "project"),
+    ("resource", "project"),
+    ("activity", "project"),
+    ("timesheet", "project"),
+    ("component", "project"),
+]
+FEATURE_CASCADE = [
+    ("traffic", "metadata.feature"),
+    ("latency", "metadata.feature"),
+]
+# Cascade of each kind of deleted document
+CASCADES = {"project": PROJECT_CASCADE, "feature": FEATURE_CASCADE}
+
+# Comments of a language backfill read, detected and written per batch, and comments per second at most (0: no limit)
+BACKFILL_BATCH_SIZE = int(os.getenv("LANGUAGE_BACKFILL_BATCH_SIZE", "2000"))
+BACKFILL_MAX_RATE = float(os.getenv("LANGUAGE_BACKFILL_MAX_RATE", "0"))
+# Time in seconds between two progress reports of a language backfill
+BACKFILL_REPORT_INTERVAL = float(os.getenv("LANGUAGE_BACKFILL_REPORT_INTERVAL", "10"))
+
+
+async def create_cascade_delete(engine, target: str, target_id: ObjectId) -> CascadeDeleteJob:
+    job = CascadeDeleteJob(target=target, target_id=target_id, created=datetime.utcnow())
+    await engine.save(job)
+    return job
+
+
+async def _delete_in_batches(collection, query) -> int:
+    deleted = 0
+    while True:
+        ids = [document["_id"] async for document in collection.find(query, {"_id": 1}).limit(BATCH_SIZE)]
+        if not ids:
+            return deleted
+        result = await collection.delete_many({"_id": {"$in": ids}})
+        deleted += result.deleted_count
+        await asyncio.sleep(BATCH_PAUSE)
+
+
+async def run_cascade_delete(engine, job: CascadeDeleteJob, cascade: List[Tuple[str, str]]):
+    '''
+    Delete the documents referencing job.target_id in every collection of `cascade`,
+    at most CONCURRENCY collections at a time, recording the progress in the job
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+    job : CascadeDeleteJob
+        Job created by create_cascade_delete
+    cascade : List[Tuple[str, str]]
+        Collections and the field referencing the deleted document
+    '''
+    jobs = engine.get_collection(CascadeDeleteJob)
+    await jobs.update_one({"_id": job.id}, {"$set": {+CascadeDeleteJob.status: RUNNING,
+                                                     +CascadeDeleteJob.heartbeat: datetime.utcnow()}})
+    heartbeat = asyncio.ensure_future(_heartbeat(jobs, job.id))
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def delete(collection_name, field):
+        async with semaphore:
+            collection = engine.database[collection_name]
+            if collection_name in TIMESERIES:
+                # Whole buckets are dropped at once (MongoDB 5.1 or later)
+                deleted = (await collection.delete_many({field: job.target_id})).deleted_count
+            else:
+                deleted = await _delete_in_batches(collection, {field: job.target_id})
+        await jobs.update_one({"_id": job.id}, {"$set": {f"{+CascadeDeleteJob.deleted}.{collection_name}": deleted}})
+
+    try:
+        await asyncio.gather(*[delete(collection_name, field) for collection_name, field in cascade])
+        update = {+CascadeDeleteJob.status: DONE}
+    except Exception as error:
+        logger.exception("Cascade delete of %s %s failed", job.target, job.target_id)
+        update = {+CascadeDeleteJob.status: FAILED, +CascadeDeleteJob.error: str(error)}
+    finally:
+        heartbeat.cancel()
+    update[+CascadeDeleteJob.finished] = datetime.utcnow()
+    await jobs.update_one({"_id": job.id}, {"$set": update})
+
+
+async def _heartbeat(jobs, job_id: ObjectId):
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        await jobs.update_one({"_id": job_id}, {"$set": {+CascadeDeleteJob.heartbeat: datetime.utcnow()}})
+
+
+async def resume_stale_cascade_deletes(engine) -> List[asyncio.Task]:
+    '''
+    Run again the cascade deletes left pending or running by a dead worker (no heartbeat for
+    STALE_AFTER seconds), the deletions are idempotent. Each job is claimed by an atomic update
+    of its heartbeat, so that workers starting together do not resume the same job.
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+
+    Returns
+    -------
+    List[asyncio.Task]
+        Tasks of the resumed jobs
+    '''
+    jobs = engine.get_collection(CascadeDeleteJob)
+    tasks = []
+    while True:
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=STALE_AFTER)
+        document = await jobs.find_one_and_update(
+            {+CascadeDeleteJob.status: {"$in": [PENDING, RUNNING]},
+             "$or": [{+CascadeDeleteJob.heartbeat: {"$lt": stale}},
+                     {+CascadeDeleteJob.heartbeat: None, +CascadeDeleteJob.created: {"$lt": stale}}]},
+            {"$set": {+CascadeDeleteJob.heartbeat: now}})
+        if document is None:
+            return tasks
+        job = CascadeDeleteJob.parse_doc(document)
+        logger.warning("Resuming the cascade delete of %s %s abandoned since %s",
+                       job.target, job.target_id, job.heartbeat or job.created)
+        tasks.append(asyncio.ensure_future(run_cascade_delete(engine, job, CASCADES[job.target])))
+
+
+async def find_language_backfill(engine, redetect_all: bool) -> Optional[LanguageBackfillJob]:
+    # Last backfill which did not complete (interrupted or failed), to resume from its checkpoint
+    return await engine.find_one(LanguageBackfillJob,
+                                 LanguageBackfillJob.status != DONE,
+                                 LanguageBackfillJob.redetect_all == redetect_all,
+                                 sort=desc(LanguageBackfillJob.created))
+
+
+async def create_language_backfill(engine, redetect_all: bool) -> LanguageBackfillJob:
+    job = LanguageBackfillJob(redetect_all=redetect_all, created=datetime.utcnow())
+    await engine.save(job)
+    return job
+
+
+async def _detect_languages(pool: LanguageDetectionPool, texts: List[Optional[str]]) -> List[str]:
+    # One chunk of the batch per worker of the pool
+    size = max(1, -(-len(texts) // pool.workers))
+    chunks = await asyncio.gather(*[pool.detect_many(texts[start:start + size])
+                                    for start in range(0, len(texts), size)])
+    return [language for chunk in chunks for language in chunk]
+
+
+async def _move_rating_rollups(engine, moved: List[Tuple[dict, str]]):
+    # The comments leave the rollups of their former language for the rollups of the detected one
+    features = engine.get_collection(Feature).find(
+        {"_id": {"$in": list({comment[+SurveyComment.feature] for comment, _ in moved})}}, {+Feature.project: 1})
+    feature_projects = {feature["_id"]: feature.get(+Feature.project) async for feature in features}
+    # No rollup is kept for the comments of a deleted feature
+    moved = [(comment, language) for comment, language in moved if comment[+SurveyComment.feature] in feature_projects]
+    await analytics_logic.update_rating_rollups(engine, [comment for comment, _ in moved], feature_projects, sign=-1)
+    await analytics_logic.update_rating_rollups(engine,
+                                                [{**comment, +SurveyComment.language: language}
+                                                 for comment, language in moved],
+                                                feature_projects)
+
+
+async def run_language_backfill(engine,
+                                job: LanguageBackfillJob,
+                                pool: LanguageDetectionPool,
+                                batch_size: int = BACKFILL_BATCH_SIZE,
+                                max_rate: float = BACKFILL_MAX_RATE,
+                                report_interval: float = BACKFILL_REPORT_INTERVAL) -> LanguageBackfillJob:
+    '''
+    Detect the language of the comments of the SurveyComment collection stored without one
+    (missing or unknown), or of every comment with job.redetect_all, in _id order.
+    The next batch is read while the workers of the pool detect the languages of the current one,
+    the comments whose language changed are then written with an unordered bulk write, the rating
+    rollups of the comments updated moved to the detected language, and the last comment of the batch
+    recorded in the job: running the job again resumes after it. Only one backfill must run at a time.
+    A job interrupted while writing a batch leaves job.rollups_stale: the rollups are rebuilt from
+    the comments when the resumed job ends.
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+    job : LanguageBackfillJob
+        Job created by create_language_backfill, or found by find_language_backfill to resume it
+    pool : LanguageDetectionPool
+        Started detection pool, a batch is split between its workers
+    batch_size : int
+        Comments read, detected and written per round-trip
+    max_rate : float
+        Comments per second at most so that other traffic is not starved, 0 for no limit
+    report_interval : float
+        Time in seconds between two progress reports (logged)
+
+    Returns
+    -------
+    LanguageBackfillJob
+        The job, done or failed
+    '''
+    comments = engine.get_collection(SurveyComment)
+    jobs = engine.get_collection(LanguageBackfillJob)
+    await jobs.update_one({"_id": job.id}, {"$set": {+LanguageBackfillJob.status: RUNNING}})
+    query = {} if job.redetect_all else {+SurveyComment.language: {"$in": [None, UNKNOWN_LANGUAGE]}}
+    projection = {+SurveyComment.feature: 1, +SurveyComment.date: 1, +SurveyComment.rating: 1,
+                  +SurveyComment.description: 1, +SurveyComment.language: 1}
+
+    async def read(after: Optional[ObjectId]) -> List[dict]:
+        batch_query = query if after is None else {**query, "_id": {"$gt": after}}
+        return await comments.find(batch_query, projection, sort=[("_id", pymongo.ASCENDING)],
+                                   limit=batch_size).to_list(length=batch_size)
+
+    started = last_report = time.monotonic()
+    scanned = 0
+    next_batch = None
+    # Set by an interrupted run: the rollups are rebuilt once every comment is detected
+    rebuild_rollups = job.rollups_stale
+    try:
+        batch = await read(job.last_id)
+        while batch:
+            next_batch = asyncio.ensure_future(read(batch[-1]["_id"]))
+            languages = await _detect_languages(pool, [comment.get(+SurveyComment.description) for comment in batch])
+            changed = [(comment, language) for comment, language in zip(batch, languages)
+                       if comment.get(+SurveyComment.language) != language]
+            updated = []
+            if changed:
+                await jobs.update_one({"_id": job.id}, {"$set": {+LanguageBackfillJob.rollups_stale: True}})
+                # Conditioned on the former language, a comment is never updated twice
+                await comments.bulk_write([
+                    UpdateOne({"_id": comment["_id"], +SurveyComment.language: comment.get(+SurveyComment.language)},
+                              {"$set": {+SurveyComment.language: language,
+                                        +SurveyComment.search_language: search.text_language(language)}})
+                    for comment, language in changed], ordered=False)
+                # Only the rollups of the comments actually updated move (not the ones changed meanwhile)
+                ids = [comment["_id"] for comment, _ in changed]
+                stored = {comment["_id"]: comment.get(+SurveyComment.language)
+                          async for comment in comments.find({"_id": {"$in": ids}}, {+SurveyComment.language: 1})}
+                updated = [(comment, language) for comment, language in changed
+                           if stored.get(comment["_id"]) == language]
+                moved = [(comment, language) for comment, language in updated
+                         if (comment.get(+SurveyComment.language) or UNKNOWN_LANGUAGE) != language]
+                if moved:
+                    await _move_rating_rollups(engine, moved)
+            job.last_id = batch[-1]["_id"]
+            job.scanned += len(batch)
+            job.updated += len(updated)
+            await jobs.update_one({"_id": job.id}, {"$set": {+LanguageBackfillJob.last_id: job.last_id,
+                                                             +LanguageBackfillJob.scanned: job.scanned,
+                                                             +LanguageBackfillJob.updated: job.updated,
+                                                             +LanguageBackfillJob.rollups_stale: rebuild_rollups}})
+            scanned += len(batch)
+            elapsed = time.monotonic() - started
+            if time.monotonic() - last_report >= report_interval:
+                last_report = time.monotonic()
+                logger.info("Language backfill %s: %d comments detected, %d updated, %.0f comments/s",
+                            job.id, job.scanned, job.updated, scanned / elapsed)
+            if max_rate:
+                # Throttle: the comments of this run never go faster than max_rate
+                await asyncio.sleep(max(0.0, scanned / max_rate - elapsed))
+            batch = await next_batch
+        if rebuild_rollups:
+            logger.info("Language backfill %s: rebuilding the rating rollups after an interrupted batch", job.id)
+            await analytics_logic.rebuild_rating_rollups(engine)
+            job.rollups_stale = False
+            await jobs.update_one({"_id": job.id}, {"$set": {+LanguageBackfillJob.rollups_stale: False}})
+        job.status = DONE
+    except Exception as error:
+        logger.exception("Language backfill %s failed after comment %s", job.id, job.last_id)
+        if next_batch is not None:
+            next_batch.cancel()
+        job.status = FAILED
+        job.error = str(error)
+    job.finished = datetime.utcnow()
+    await jobs.update_one({"_id": job.id}, {"$set": {+LanguageBackfillJob.status: job.status,
+                                                     +LanguageBackfillJob.error: job.error,
+                                                     +LanguageBackfillJob.finished: job.finished}})
+    return job
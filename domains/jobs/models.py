@@ -0,0 +1,67 @@
+from datetime import datetime
+from typing import Dict, Optional
+
+from odmantic import Model, ObjectId
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class CascadeDeleteJob(Model):
+    """
+    This class is a model of the background deletion of the documents
+    related to a deleted project or feature.
+    see :py:func:`~domains.jobs.logic.run_cascade_delete`
+
+    Attributes:
+    -----------
+        target:           Kind of the deleted document ("project" or "feature")
+        target_id:        Id of the deleted document
+        status:           pending, running, done or failed
+        created:          Date of the deletion request
+        finished:         Date the job ended, None while it runs
+        heartbeat:        Last time the worker running the job reported it alive,
+                          a job left pending or running without heartbeat is resumed at startup
+        deleted:          Number of documents deleted per collection, filled as collections are done
+        error:            Error of a failed job
+    """
+    target: str
+    target_id: ObjectId
+    status: str = PENDING
+    created: datetime
+    finished: Optional[datetime]
+    heartbeat: Optional[datetime]
+    deleted: Dict[str, int] = {}
+    error: Optional[str]
+
+
+class LanguageBackfillJob(Model):
+    """
+    This class is a model of the detection of the language of the comments stored without one,
+    scanned in _id order so that an interrupted backfill resumes after its last batch.
+    see :py:func:`~domains.jobs.logic.run_language_backfill`
+
+    Attributes:
+    -----------
+        redetect_all:     Detect the language of every comment, not only of the unknown ones
+        status:           pending, running, done or failed
+        created:          Date the backfill started
+        finished:         Date the job ended, None while it runs
+        last_id:          Id of the last comment of the last batch written (checkpoint)
+        scanned:          Number of comments whose language was detected
+        updated:          Number of comments whose language changed
+        rollups_stale:    The rating rollups may not match the languages of the comments
+                          (a batch was interrupted between its writes), rebuilt when the job ends
+        error:            Error of a failed job
+    """
+    redetect_all: bool = False
+    status: str = PENDING
+    created: datetime
+    finished: Optional[datetime]
+    last_id: Optional[ObjectId]
+    scanned: int = 0
+    updated: int = 0
+    rollups_stale: bool = False
+    error: Optional[str]
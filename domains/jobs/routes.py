@@ -0,0 +1,14 @@
+from fastapi import APIRouter, HTTPException, Request
+from odmantic import ObjectId
+
+from domains.jobs.models import CascadeDeleteJob
+
+router = APIRouter()
+
+
+@router.get("/{id}", response_model=CascadeDeleteJob)
+async def get_job_by_id(id: ObjectId, request: Request) -> CascadeDeleteJob:
+    job = await request.app.engine.find_one(CascadeDeleteJob, CascadeDeleteJob.id == id)
+    if job is None:
+        raise HTTPException(404)
+    return job
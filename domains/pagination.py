@@ -0,0 +1,183 @@
+import base64
+import json
+import os
+from typing import FrozenSet, Generic, List, Optional, Type, TypeVar
+
+import bson
+import pymongo
+from odmantic import Model, ObjectId
+from odmantic.query import and_
+from pydantic.generics import GenericModel
+
+from domains import serialization
+
+# Without limit nor cursor, list endpoints keep returning the whole list unless this is disabled
+UNPAGINATED_LISTS = os.getenv("UNPAGINATED_LISTS", "True").lower() == "true"
+DEFAULT_LIMIT = int(os.getenv("PAGINATION_DEFAULT_LIMIT", "100"))
+MAX_LIMIT = int(os.getenv("PAGINATION_MAX_LIMIT", "1000"))
+
+ItemType = TypeVar("ItemType")
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class Page(GenericModel, Generic[ItemType]):
+    """
+    This class is only used for modeling a page of a list endpoint.
+    The next page is requested by passing next_cursor as the cursor parameter,
+    there is no next page when next_cursor is null.
+    """
+    items: List[ItemType]
+    next_cursor: Optional[str]
+
+    class Config:
+        # Same rendering as the ODMantic models listed
+        json_encoders = {bson.ObjectId: str}
+
+
+def is_paginated(limit: Optional[int], cursor: Optional[str]) -> bool:
+    return limit is not None or cursor is not None or not UNPAGINATED_LISTS
+
+
+def encode_cursor(*values) -> str:
+    payload = json.dumps([str(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, size: int) -> List[str]:
+    '''
+    Decode an opaque cursor into the `size` raw values of the last item of the previous page
+
+    Raises
+    ------
+    InvalidCursor
+        The cursor was not produced by encode_cursor
+    '''
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError as error:
+        raise InvalidCursor from error
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor
+    return values
+
+
+def decode_id_cursor(cursor: str) -> ObjectId:
+    try:
+        return ObjectId(decode_cursor(cursor, 1)[0])
+    except (TypeError, ValueError) as error:
+        raise InvalidCursor from error
+
+
+async def find_page(engine, model: Type[Model], query, limit: Optional[int], cursor: Optional[str]) -> Page:
+    '''
+    Keyset pagination on _id: the page starts right after the _id of the cursor,
+    so that any page costs the same index range scan as the first one.
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+    model : Type[Model]
+        Model of the listed documents
+    query : QueryExpression or dict
+        Filter of the list
+    limit : Optional[int]
+        Maximum number of items of the page, DEFAULT_LIMIT when None
+    cursor : Optional[str]
+        next_cursor of the previous page, None for the first page
+    '''
+    limit = min(limit or DEFAULT_LIMIT, MAX_LIMIT)
+    # One more item tells whether there is a next page
+    items = await engine.find(model, *_page_queries(model, query, cursor), sort=model.id, limit=limit + 1)
+    next_cursor = encode_cursor(items[limit - 1].id) if len(items) > limit else None
+    return Page(items=items[:limit], next_cursor=next_cursor)
+
+
+async def find_page_dicts(engine,
+                          model: Type[Model],
+                          query,
+                          limit: Optional[int],
+                          cursor: Optional[str],
+                          fields: Optional[FrozenSet[str]] = None) -> dict:
+    '''
+    Same as find_page, the page is a plain dict rendered by serialization.documents_to_dicts
+    with only the requested fields (see serialization.parse_fields)
+    '''
+    limit = min(limit or DEFAULT_LIMIT, MAX_LIMIT)
+    queries = _page_queries(model, query, cursor)
+    query = and_(*queries) if len(queries) > 1 else (queries[0] if queries else {})
+    items = await serialization.find_dicts(engine, model, query, sort=[("_id", pymongo.ASCENDING)],
+                                           limit=limit + 1, fields=fields)
+    next_cursor = encode_cursor(items[limit - 1]["id"]) if len(items) > limit else None
+    return {"items": items[:limit], "next_cursor": next_cursor}
+
+
+def _page_queries(model: Type[Model], query, cursor: Optional[str]) -> list:
+    queries = [query] if query else []
+    if cursor is not None:
+        queries.append(model.id > decode_id_cursor(cursor))
+    return queries
+
+
+async def find_list(engine,
+                    model: Type[Model],
+                    query,
+                    sort,
+                    limit: Optional[int],
+                    cursor: Optional[str],
+                    fields: Optional[FrozenSet[str]] = None):
+    '''
+    Body of a list endpoint: a page when paginated (see is_paginated), the whole list otherwise.
+    With serialization.FAST_RESPONSES or a projection (fields), the body is a FastJSONResponse
+    rendered from the raw documents (same JSON as the response model),
+    otherwise the models validated by the response model.
+
+    Raises
+    ------
+    InvalidCursor
+        The cursor was not produced by encode_cursor
+    '''
+    fast = serialization.FAST_RESPONSES or fields is not None
+    if is_paginated(limit, cursor):
+        if fast:
+            return serialization.FastJSONResponse(await find_page_dicts(engine, model, query, limit, cursor, fields))
+        return await find_page(engine, model, query, limit, cursor)
+    if fast:
+        sort = [(+sort, pymongo.ASCENDING)] if sort is not None else None
+        return serialization.FastJSONResponse(await serialization.find_dicts(engine, model, query,
+                                                                             sort=sort, fields=fields))
+    return await engine.find(model, query, sort=sort)
+
+
+async def find_text_list(engine,
+                         model: Type[Model],
+                         search: str,
+                         limit: Optional[int],
+                         cursor: Optional[str],
+                         fields: Optional[FrozenSet[str]] = None):
+    '''
+    Body of a full-text search (the text index of the model is required): the `limit` best matches
+    (DEFAULT_LIMIT when None) ranked by textScore, even with UNPAGINATED_LISTS (a search is never
+    listed in full), as a page without next page when paginated, there are no cursors for searches.
+    Rendered as by find_list (FastJSONResponse or models validated by the response model).
+
+    Raises
+    ------
+    InvalidCursor
+        A cursor was given
+    '''
+    if cursor is not None:
+        raise InvalidCursor
+    paginated = is_paginated(limit, cursor)
+    query = {"$text": {"$search": search}}
+    sort = [("score", {"$meta": "textScore"})]
+    limit = min(limit or DEFAULT_LIMIT, MAX_LIMIT)
+    if serialization.FAST_RESPONSES or fields is not None:
+        items = await serialization.find_dicts(engine, model, query, sort=sort, limit=limit, fields=fields)
+        return serialization.FastJSONResponse({"items": items, "next_cursor": None} if paginated else items)
+    documents = await engine.get_collection(model).find(query, sort=sort, limit=limit).to_list(length=None)
+    items = [model.parse_doc(document) for document in documents]
+    return Page(items=items, next_cursor=None) if paginated else items
@@ -1,8 +1,14 @@
-from typing import List, Optional
+from typing import List, Optional, Union
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request, Response
 from odmantic import ObjectId
 
+from domains import conditional, counts, pagination, serialization
+from domains.features.patterns import feature_patterns
+from domains.jobs import logic as jobs_logic
+from domains.jobs.models import CascadeDeleteJob
+from domains.pagination import Page, InvalidCursor
+from domains.serialization import InvalidFields
 from domains.projects.models import Project, ProjectInApi
 
 router = APIRouter()
@@ -11,6 +17,8 @@ router = APIRouter()
 @router.post("", response_model=List[Project])
 async def create_projects(projects_request: List[Project], request: Request) -> List[Project]:
     await request.app.engine.save_all(projects_request)
+    # Saving an existing id replaces the project
+    await conditional.bump(request.app.engine, "project", [str(project.id) for project in projects_request])
     return projects_request
 
 
@@ -24,58 +32,65 @@ async def update_project_by_id(id: ObjectId, patch: ProjectInApi, request: Reque
     for name, value in patch_dict.items():
         setattr(project, name, value)
     await request.app.engine.save(project)
+    await conditional.bump(request.app.engine, "project", [str(id)])
     return project
 
 
-@router.get("", response_model=List[Project])
-async def get_projects(request: Request, fulltext: Optional[str] = None, name: Optional[str] = None) -> List[Project]:
-    if fulltext is not None:
-        # Note that the fulltext index is created in main.py
-        projects = await request.app.engine.find(Project, {"$text": {"$search": fulltext}})
-        return projects
-    elif name is not None:
-        projects = await request.app.engine.find(Project, Project.name.match(name), sort=Project.name)
-        return projects
-    else:
-        projects = await request.app.engine.find(Project, sort=Project.name)
-        return projects
+@router.get("", response_model=Union[Page[Project], List[Project]])
+async def get_projects(request: Request,
+                       fulltext: Optional[str] = None,
+                       name: Optional[str] = None,
+                       limit: Optional[int] = Query(None, gt=0, le=pagination.MAX_LIMIT),
+                       cursor: Optional[str] = None,
+                       fields: Optional[str] = None) -> Union[Page[Project], List[Project]]:
+    try:
+        # Payload and config are only listed when requested
+        projected_fields = serialization.parse_fields(Project, fields)
+        if fulltext is not None:
+            # Note that the fulltext index is created in schema.setup
+            return await pagination.find_text_list(request.app.engine, Project, fulltext, limit, cursor,
+                                                   projected_fields)
+        if name is not None:
+            query, sort = Project.name.match(name), Project.name
+        else:
+            query, sort = {}, Project.name
+        return await pagination.find_list(request.app.engine, Project, query, sort, limit, cursor, projected_fields)
+    except (InvalidCursor, InvalidFields) as error:
+        raise HTTPException(400, str(error) or None) from error
 
 
 @router.get("/count", response_model=int)
-async def count_projects(request: Request) -> int:
-    count = await request.app.engine.count(Project)
-    return count
+async def count_projects(request: Request, name: Optional[str] = None, exact: bool = False) -> int:
+    # Estimated from the collection metadata when unfiltered, cached for a few seconds otherwise
+    query = Project.name.match(name) if name is not None else {}
+    return await counts.count(request.app.engine, Project, query, exact)
 
 
 @router.get("/{id}", response_model=Project)
-async def get_project_by_id(id: ObjectId, request: Request) -> Project:
+async def get_project_by_id(id: ObjectId, request: Request, response: Response) -> Project:
+    # The version stamp answers the revalidations of an unchanged project without reading it
+    version, modified = await conditional.get_version(request.app.engine, "project", str(id))
+    etag = conditional.make_etag("project", id, version)
+    if conditional.is_not_modified(request, etag, modified):
+        return conditional.not_modified_response(etag, modified, conditional.RESOURCE_CACHE_CONTROL)
     project = await request.app.engine.find_one(Project, Project.id == id)
     if project is None:
         raise HTTPException(404)
+    conditional.set_headers(response, etag, modified, conditional.RESOURCE_CACHE_CONTROL)
     return project
 
 
-@router.delete("/{id}")
-async def delete_project_by_id(id: ObjectId, request: Request) -> None:
+@router.delete("/{id}", response_model=CascadeDeleteJob, status_code=202)
+async def delete_project_by_id(id: ObjectId, request: Request, background_tasks: BackgroundTasks) -> CascadeDeleteJob:
     project = await request.app.engine.find_one(Project, Project.id == id)
     if project is None:
         raise HTTPException(404)
-    else:
-        await request.app.engine.delete(project)
-        # Cascade delete related documents
-        await request.app.mongodb_client.ottm.build.delete_many({"project": id})
-        await request.app.mongodb_client.ottm.code_quality.delete_many({"project": id})
-        await request.app.mongodb_client.ottm.issue.delete_many({"project": id})
-        await request.app.mongodb_client.ottm.issue_revision.delete_many({"project": id})
-        await request.app.mongodb_client.ottm.tool.delete_many({"project": id})
-        await request.app.mongodb_client.ottm.system.buckets.traffic.delete_many({"meta.project": id})
-        await request.app.mongodb_client.ottm.system.buckets.latency.delete_many({"meta.project": id})
-        await request.app.mongodb_client.ottm.system.buckets.commit.delete_many({"meta.project": id})
-        await request.app.mongodb_client.ottm.system.buckets.exception.delete_many({"meta.project": id})
-        await request.app.mongodb_client.ottm.feature.delete_many({"project": id})
-        await request.app.mongodb_client.ottm.requirement.delete_many({"project": id})
-        await request.app.mongodb_client.ottm.version.delete_many({"project": id})
-        await request.app.mongodb_client.ottm.resource.delete_many({"project": id})
-        await request.app.mongodb_client.ottm.activity.delete_many({"project": id})
-        await request.app.mongodb_client.ottm.timesheet.delete_many({"project": id})
-        await request.app.mongodb_client.ottm.component.delete_many({"project": id})
+    await request.app.engine.delete(project)
+    # The rules of the features of the project disappear with the cascade
+    await conditional.bump(request.app.engine, "project", [str(id)])
+    await conditional.bump(request.app.engine, "rules", [conditional.ALL_RULES])
+    await feature_patterns.changed(request.app.engine, [id])
+    # Cascade delete related documents once the response is sent, follow it with GET /jobs/{job id}
+    job = await jobs_logic.create_cascade_delete(request.app.engine, "project", id)
+    background_tasks.add_task(jobs_logic.run_cascade_delete, request.app.engine, job, jobs_logic.PROJECT_CASCADE)
+    return job
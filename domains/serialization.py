@@ -0,0 +1,173 @@
+import os
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Type
+
+import bson
+import orjson
+from fastapi.responses import JSONResponse
+from odmantic import Model
+from odmantic.exceptions import DocumentParsingError
+from odmantic.field import ODMReference
+from pydantic.error_wrappers import ErrorWrapper
+from pydantic.errors import MissingError
+
+from domains.features.models import Feature
+from domains.projects.models import Project
+
+# Large lists are rendered from the raw documents, without the validation of the response model
+FAST_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "True").lower() == "true"
+
+# Raw imports of third-party tools (possibly hundreds of KB), only listed when requested with fields=
+LIST_EXCLUDED_FIELDS = {
+    Project: {"payload", "config"},
+    Feature: {"payload"},
+}
+
+
+class InvalidFields(Exception):
+    pass
+
+
+def _default(value):
+    if isinstance(value, bson.ObjectId):
+        return str(value)
+    raise TypeError
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response encoded by orjson, ObjectId are rendered as str like the ODMantic models
+    (datetime and UUID are natively rendered the same way as pydantic).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default)
+
+
+@lru_cache(maxsize=None)
+def _fields(model: Type[Model]) -> List[Tuple[str, str, Any, Optional[Type[Model]], bool]]:
+    # (name, key in the document, default, referenced model, required) in the order of the model
+    fields = []
+    for name, field in model.__fields__.items():
+        odm_field = model.__odm_fields__[name]
+        reference = odm_field.model if isinstance(odm_field, ODMReference) else None
+        fields.append((name, odm_field.key_name, field.default, reference, field.required))
+    return fields
+
+
+def parse_fields(model: Type[Model], fields: Optional[str]) -> Optional[FrozenSet[str]]:
+    '''
+    Fields of a list requested with the fields= parameter (comma separated names),
+    the fields of LIST_EXCLUDED_FIELDS are left out when the parameter is not given
+
+    Returns
+    -------
+    Optional[FrozenSet[str]]
+        Names of the fields to render ("id" is always rendered), None for every field
+
+    Raises
+    ------
+    InvalidFields
+        A requested field is not a field of the model
+    '''
+    if fields is None:
+        excluded = LIST_EXCLUDED_FIELDS.get(model)
+        return frozenset(model.__fields__) - excluded if excluded else None
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - set(model.__fields__)
+    if unknown:
+        raise InvalidFields(f"unknown fields: {', '.join(sorted(unknown))}")
+    names.add("id")
+    return None if names == set(model.__fields__) else frozenset(names)
+
+
+def projection(model: Type[Model], fields: Optional[FrozenSet[str]]) -> Optional[Dict[str, int]]:
+    if fields is None:
+        return None
+    return {key_name: 1 for name, key_name, _, _, _ in _fields(model) if name in fields}
+
+
+async def documents_to_dicts(engine,
+                             model: Type[Model],
+                             documents: List[dict],
+                             fields: Optional[FrozenSet[str]] = None) -> List[dict]:
+    '''
+    Render raw documents as the model would be by a response model: same fields in the same order,
+    defaults of the missing fields, "id" instead of "_id" and the referenced documents embedded.
+    The referenced documents are read with one $in query per reference, documents whose
+    reference is missing are left out (as engine.find does).
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+    model : Type[Model]
+        Model of the documents
+    documents : List[dict]
+        Documents as read from the collection of the model
+    fields : Optional[FrozenSet[str]]
+        Fields rendered (see parse_fields), every field when None
+
+    Raises
+    ------
+    odmantic.exceptions.DocumentParsingError
+        A rendered required field is missing from a document, as with the validated models
+    '''
+    rendered = [field for field in _fields(model) if fields is None or field[0] in fields]
+    references = {}
+    for name, key_name, _, reference, _ in rendered:
+        if reference is not None:
+            ids = list({document.get(key_name) for document in documents} - {None})
+            # Embedded in full in a full rendering, with the default fields of their model otherwise
+            reference_fields = parse_fields(reference, None) if fields is not None else None
+            referenced = await engine.get_collection(reference).find(
+                {"_id": {"$in": ids}}, projection(reference, reference_fields)).to_list(length=None)
+            references[name] = {item["id"]: item
+                                for item in await documents_to_dicts(engine, reference, referenced, reference_fields)}
+    items = []
+    for document in documents:
+        item = {}
+        for name, key_name, default, reference, required in rendered:
+            if reference is not None:
+                item[name] = references[name].get(document.get(key_name))
+                if item[name] is None:
+                    break
+            elif key_name in document:
+                item[name] = document[key_name]
+            elif required:
+                raise DocumentParsingError([ErrorWrapper(MissingError(), loc=name)], model, document.get("_id"))
+            else:
+                item[name] = default
+        else:
+            items.append(item)
+    return items
+
+
+async def find_dicts(engine,
+                     model: Type[Model],
+                     query: Dict,
+                     sort: Optional[List[Tuple[str, Any]]] = None,
+                     limit: Optional[int] = None,
+                     fields: Optional[FrozenSet[str]] = None) -> List[dict]:
+    '''
+    Same as engine.find, with only the requested fields read from MongoDB
+    and the documents rendered by documents_to_dicts
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+    model : Type[Model]
+        Model of the listed documents
+    query : QueryExpression or dict
+        Filter of the list
+    sort : Optional[List[Tuple[str, Any]]]
+        Sort specification, as for pymongo
+    limit : Optional[int]
+        Maximum number of documents, no limit when None
+    fields : Optional[FrozenSet[str]]
+        Fields rendered (see parse_fields), every field when None
+    '''
+    documents = await engine.get_collection(model).find(query, projection(model, fields),
+                                                        sort=sort, limit=limit or 0).to_list(length=None)
+    return await documents_to_dicts(engine, model, documents, fields)
@@ -0,0 +1,82 @@
+import base64
+import binascii
+import hashlib
+import os
+from datetime import datetime
+from typing import Optional
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from dateutil.relativedelta import relativedelta
+
+from domains.survey.exceptions import InvalidTimestampKey
+
+# Reasons given with a negative eligibility decision
+UNKNOWN_FEATURE = 'unknown_feature'
+INACTIVE = 'inactive'
+NOT_SAMPLED = 'ratio'
+REANSWER_DELAY = 'reanswer_delay'
+
+# Sizes in bytes of the AES keys (AES-128, AES-192, AES-256)
+KEY_SIZES = (16, 24, 32)
+
+
+def is_sampled(user_id: str, feature_url: str, ratio: Optional[int]) -> bool:
+    '''
+    Deterministic sampling: a given user is always (or never) proposed the survey on a given feature,
+    ratio percent of the users are.
+    '''
+    if ratio is None:
+        return True
+    digest = hashlib.sha256(f"{user_id}:{feature_url}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") % 100 < ratio
+
+
+def is_within_reanswer_delay(last_answered: datetime, delay_before_reanswer: Optional[int], now: datetime) -> bool:
+    if not delay_before_reanswer:
+        return False
+    return now < last_answered + relativedelta(months=delay_before_reanswer)
+
+
+def decode_key(key: str) -> bytes:
+    '''
+    Decode a timestamp key
+
+    Raises
+    ------
+    InvalidTimestampKey
+        Not the Base64 encoding of a 16, 24 or 32 bytes AES key
+    '''
+    try:
+        decoded = base64.b64decode(key, validate=True)
+    except (binascii.Error, ValueError) as error:
+        raise InvalidTimestampKey("timestamp key is not valid Base64") from error
+    if len(decoded) not in KEY_SIZES:
+        raise InvalidTimestampKey(f"timestamp key must be 16, 24 or 32 bytes, not {len(decoded)}")
+    return decoded
+
+
+def encrypt_timestamp(key: str, timestamp: datetime) -> str:
+    '''
+    Encrypt a timestamp (milliseconds since epoch) with the timestamp key
+
+    Parameters
+    ----------
+    key : str
+        Base64 encoded AES key (16, 24 or 32 bytes), see SurveyKeyTimestamp
+    timestamp : datetime
+        UTC timestamp to encrypt
+
+    Returns
+    -------
+    str
+        Base64 encoding of the 12 bytes nonce followed by the AES-GCM ciphertext and tag
+
+    Raises
+    ------
+    InvalidTimestampKey
+        Malformed key (stored before the keys were validated by the rotation)
+    '''
+    milliseconds = str(int((timestamp - datetime(1970, 1, 1)).total_seconds() * 1000))
+    nonce = os.urandom(12)
+    ciphertext = AESGCM(decode_key(key)).encrypt(nonce, milliseconds.encode(), None)
+    return base64.b64encode(nonce + ciphertext).decode()
@@ -1,2 +1,10 @@
 class ModelNotFound(Exception):
     pass
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+class InvalidTimestampKey(Exception):
+    pass
@@ -0,0 +1,69 @@
+import csv
+import io
+import zlib
+from typing import AsyncIterator
+
+from domains.survey.models import SurveyCommentApi
+
+# Rows are sent to the client by chunks of about this size (bytes)
+CHUNK_SIZE = 64 * 1024
+
+CSV_FIELDS = list(SurveyCommentApi.__fields__)
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+async def ndjson_chunks(comments: AsyncIterator[SurveyCommentApi]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    async for comment in comments:
+        buffer.write(comment.json())
+        buffer.write("\n")
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def csv_chunks(comments: AsyncIterator[SurveyCommentApi]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    async for comment in comments:
+        writer.writerow(comment.dict())
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_comments(comments: AsyncIterator[SurveyCommentApi], export_format: str, compress: bool) -> AsyncIterator[bytes]:
+    '''
+    Encode the comments as NDJSON or CSV rows while they are read from the database
+
+    Parameters
+    ----------
+    comments : AsyncIterator[SurveyCommentApi]
+        Comments, usually from logic.iter_survey_comments
+    export_format : str
+        'ndjson' or 'csv'
+    compress : bool
+        gzip the encoded rows
+    '''
+    chunks = csv_chunks(comments) if export_format == "csv" else ndjson_chunks(comments)
+    return gzip_chunks(chunks) if compress else chunks
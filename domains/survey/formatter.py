@@ -1,7 +1,9 @@
-from domains.features.models import Feature
+from odmantic import ObjectId
+
 from domains.survey.models import Survey, SurveyInApi, SurveyRule, SurveyRuleApi, SurveyComment, \
-    SurveyCommentApi
+    SurveyCommentApi, QueuedSurveyComment, SurveyKeyTimestamp, SurveyKeyTimestampApi
 from domains.projects.models import Project
+from domains.survey import search
 
 
 def map_survey_from_api_survey(api_survey: SurveyInApi, project: Project) -> Survey:
@@ -19,25 +21,28 @@ def map_survey_rule_out_api_from_survey(survey_rule: SurveyRule) -> SurveyRuleAp
     )
 
 
-def map_survey_comment_from_survey_comment_api(survey_comment_api: SurveyCommentApi, feature: Feature):
-    return SurveyComment(
-        feature=feature,
-        user_id=survey_comment_api.user_id,
-        date=survey_comment_api.date,
-        rating=survey_comment_api.rating,
-        description=survey_comment_api.description
+def map_survey_comment_api_from_document(document: dict, feature_url: str) -> SurveyCommentApi:
+    return SurveyCommentApi(
+        feature_url=feature_url,
+        user_id=str(document[+SurveyComment.user_id]),
+        date=str(document[+SurveyComment.date]),
+        rating=document[+SurveyComment.rating],
+        description=document.get(+SurveyComment.description),
+        language=document.get(+SurveyComment.language)
     )
 
 
-def map_model_comment_api_from_survey_comment(survey_comment: SurveyComment) -> SurveyCommentApi:
-    return SurveyCommentApi(
-        feature_url=survey_comment.feature.resource,
-        user_id=str(survey_comment.user_id),
-        date=str(survey_comment.date),
-        rating=survey_comment.rating,
-        description=survey_comment.description,
-        language=survey_comment.language
-    )
+def map_survey_comment_dict_from_document(document: dict, feature_url: str) -> dict:
+    # Same JSON as map_survey_comment_api_from_document once validated by SurveyCommentApi
+    rating = document.get(+SurveyComment.rating)
+    return {
+        "feature_url": feature_url,
+        "user_id": str(document[+SurveyComment.user_id]),
+        "date": str(document[+SurveyComment.date]),
+        "rating": None if rating is None else str(rating),
+        "description": document.get(+SurveyComment.description),
+        "language": document.get(+SurveyComment.language)
+    }
 
 
 def map_survey_rule_api_from_survey_rule(rule : SurveyRule) -> SurveyRuleApi:
@@ -47,4 +52,47 @@ def map_survey_rule_api_from_survey_rule(rule : SurveyRule) -> SurveyRuleApi:
         delay_before_reanswer=rule.delay_before_reanswer,
         delay_to_answer=rule.delay_to_answer,
         ratio_display=rule.ratio
-    )
\ No newline at end of file
+    )
+
+
+def map_survey_rule_api_from_document(document: dict) -> SurveyRuleApi:
+    return SurveyRuleApi(
+        is_activated=document["is_activated"],
+        is_activated_on_feature=document["is_activated"],
+        delay_before_reanswer=document.get("delay_before_reanswer"),
+        delay_to_answer=document.get("delay_to_answer"),
+        ratio_display=document.get("ratio")
+    )
+
+
+def map_queued_survey_comment_from_survey_comment_api(survey_comment_api: SurveyCommentApi) -> QueuedSurveyComment:
+    return QueuedSurveyComment(
+        feature_url=survey_comment_api.feature_url,
+        user_id=survey_comment_api.user_id,
+        date=survey_comment_api.date,
+        rating=survey_comment_api.rating,
+        description=survey_comment_api.description
+    )
+
+
+def map_survey_comment_document_from_queued_survey_comment(comment: QueuedSurveyComment,
+                                                           feature_id: ObjectId,
+                                                           language: str) -> dict:
+    return {
+        +SurveyComment.feature: feature_id,
+        +SurveyComment.user_id: comment.user_id,
+        +SurveyComment.date: comment.date,
+        +SurveyComment.rating: comment.rating,
+        +SurveyComment.description: comment.description,
+        +SurveyComment.language: language,
+        +SurveyComment.search_language: search.text_language(language)
+    }
+
+
+def map_survey_key_timestamp_api_from_survey_key_timestamp(timestamp_key: SurveyKeyTimestamp,
+                                                          active: bool) -> SurveyKeyTimestampApi:
+    return SurveyKeyTimestampApi(
+        key=timestamp_key.key,
+        version=timestamp_key.version,
+        active=active
+    )
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo.errors import BulkWriteError
+
+import domains.survey.formatter as mapper
+from domains.analytics import logic as analytics_logic
+from domains.features.patterns import feature_patterns
+from domains.survey import logic, storage
+from domains.survey.language import detector
+from domains.survey.models import SurveyCommentApi, QueuedSurveyComment
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = Gauge("survey_comments_queue_depth", "Number of comments waiting to be written")
+FLUSH_SECONDS = Histogram("survey_comments_flush_seconds", "Time spent writing a batch of queued comments")
+FLUSHED_COMMENTS = Counter("survey_comments_flushed_total", "Number of queued comments written to MongoDB")
+DROPPED_COMMENTS = Counter("survey_comments_dropped_total", "Number of queued comments that could not be written",
+                           ["reason"])
+
+
+class CommentWriteBehindQueue:
+    """
+    Bounded in-process queue of validated comments (write-behind mode of POST /survey/comments).
+    A background task writes them with unordered bulk inserts
+    as soon as batch_size comments are queued or flush_interval seconds have elapsed.
+
+    Attributes:
+    -----------
+        engine:            AIOEngine used to resolve the features and write the comments
+        max_size:          Maximum number of comments waiting to be written
+        batch_size:        Maximum number of comments written in a single insert
+        flush_interval:    Maximum time in seconds a comment waits before being written
+    """
+
+    def __init__(self, engine, max_size: int, batch_size: int, flush_interval: float):
+        self.engine = engine
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        '''
+        Stop accepting comments and wait until the queue is drained
+        '''
+        self._stopping = True
+        if self._task is not None:
+            await self._task
+
+    def put(self, survey_comment_api: SurveyCommentApi):
+        '''
+        Validate a comment and queue it
+
+        Raises
+        ------
+        pydantic.ValidationError
+            The comment is invalid
+        asyncio.QueueFull
+            The queue is full or stopping, the client should retry later
+        '''
+        comment = mapper.map_queued_survey_comment_from_survey_comment_api(survey_comment_api)
+        if self._stopping:
+            raise asyncio.QueueFull
+        self._queue.put_nowait(comment)
+        QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def _run(self):
+        while not (self._stopping and self._queue.empty()):
+            batch = await self._next_batch()
+            if batch:
+                await self._flush(batch)
+
+    async def _next_batch(self) -> List[QueuedSurveyComment]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[QueuedSurveyComment]):
+        start = time.perf_counter()
+        try:
+            # Features resolved in memory, see domains.features.patterns
+            features = {url: await feature_patterns.resolve(self.engine, url)
+                        for url in {comment.feature_url for comment in batch}}
+            features = {url: feature for url, feature in features.items() if feature is not None}
+            feature_ids = {url: feature.feature for url, feature in features.items()}
+            feature_projects = {feature.feature: feature.project for feature in features.values()}
+
+            known_comments = []
+            for comment in batch:
+                if comment.feature_url in feature_ids:
+                    known_comments.append(comment)
+                else:
+                    DROPPED_COMMENTS.labels("unknown_feature").inc()
+            languages = await detector.detect_many([comment.description for comment in known_comments])
+            documents = []
+            for comment, language in zip(known_comments, languages):
+                feature_id = feature_ids[comment.feature_url]
+                documents.append(mapper.map_survey_comment_document_from_queued_survey_comment(comment,
+                                                                                               feature_id,
+                                                                                               language))
+            if documents:
+                try:
+                    result = await storage.comment_storage.insert_many(self.engine, documents, feature_projects)
+                    FLUSHED_COMMENTS.inc(len(result.inserted_ids))
+                except BulkWriteError as error:
+                    FLUSHED_COMMENTS.inc(error.details["nInserted"])
+                    DROPPED_COMMENTS.labels("write_error").inc(len(error.details["writeErrors"]))
+                    failed = {write_error["index"] for write_error in error.details["writeErrors"]}
+                    documents = [document for index, document in enumerate(documents) if index not in failed]
+                try:
+                    await logic.update_last_answers(self.engine, documents)
+                    for comment in known_comments:
+                        logic.last_answers_cache.invalidate((str(comment.user_id), feature_ids[comment.feature_url]))
+                    await analytics_logic.update_rating_rollups(self.engine, documents, feature_projects)
+                except Exception:
+                    logger.exception("Unable to add %d comments to the last answers and rollups", len(documents))
+        except Exception:
+            logger.exception("Unable to write %d queued comments", len(batch))
+            DROPPED_COMMENTS.labels("write_error").inc(len(batch))
+        finally:
+            FLUSH_SECONDS.observe(time.perf_counter() - start)
+            QUEUE_DEPTH.set(self._queue.qsize())
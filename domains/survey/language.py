@@ -0,0 +1,174 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+UNKNOWN_LANGUAGE = 'unknown'
+
+# Texts shorter than this are not worth a detection, the result would be noise
+MIN_LENGTH = int(os.getenv("LANGDETECT_MIN_LENGTH", "10"))
+
+
+# Language profiles of the process, see _get_factory
+_factory = None
+_factory_lock = threading.Lock()
+
+
+def _get_factory():
+    # Loaded once per process under a lock: unlike langdetect's own init_factory, the threads
+    # of a pool never see a factory whose profiles are still loading.
+    # langdetect is only imported on first use, its profiles are loaded by warm_up (or by the first detection)
+    global _factory
+    if _factory is None:
+        with _factory_lock:
+            if _factory is None:
+                from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
+                factory = DetectorFactory()
+                factory.load_profile(PROFILES_DIRECTORY)
+                _factory = factory
+    return _factory
+
+
+def _init_worker():
+    # Load every language profile once per worker
+    _get_factory()
+
+
+def detect_language(text: Optional[str]) -> str:
+    if text is None or len(text.strip()) < MIN_LENGTH:
+        return UNKNOWN_LANGUAGE
+    from langdetect import LangDetectException
+    try:
+        detector = _get_factory().create()
+        # Seeded per detection (every detector has its own random generator):
+        # a text gets the same language whatever the thread or process detecting it
+        detector.seed = 0
+        detector.append(text)
+        return detector.detect()
+    except LangDetectException:
+        return UNKNOWN_LANGUAGE
+
+
+def detect_languages(texts: List[Optional[str]]) -> List[str]:
+    return [detect_language(text) for text in texts]
+
+
+class LanguageDetectionPool:
+    """
+    Runs langdetect (CPU-bound) in a thread or process pool instead of the event loop.
+    Concurrent detections are grouped in micro-batches of up to batch_size texts,
+    waiting at most batch_delay seconds, so that a worker handles many texts per submission.
+    Until started, detection runs inline. Starting is cheap, the workers load the language
+    profiles on warm_up (or on their first detection).
+
+    Attributes:
+    -----------
+        executor_type:     'process' or 'thread'
+        workers:           Number of workers of the pool
+        batch_size:        Maximum number of texts sent to a worker at once
+        batch_delay:       Maximum time in seconds a text waits for its batch to fill up
+    """
+
+    def __init__(self, executor_type: str, workers: int, batch_size: int, batch_delay: float):
+        self.executor_type = executor_type
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._executor: Optional[Executor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batches = set()
+        self.warmed_up = False
+
+    async def start(self):
+        if self.executor_type == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="langdetect")
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def warm_up(self):
+        # Spawn the workers and load the profiles now rather than on the first comment
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self._executor, _init_worker)
+                               for _ in range(self.workers)])
+        self.warmed_up = True
+
+    async def stop(self):
+        if self._task is not None:
+            # The batch being collected is detected before the task ends
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._batches:
+            await asyncio.gather(*self._batches)
+        # Texts queued after the last batch are detected inline
+        while self._queue is not None and not self._queue.empty():
+            text, future = self._queue.get_nowait()
+            future.set_result(detect_language(text))
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def detect(self, text: Optional[str]) -> str:
+        if text is None or len(text.strip()) < MIN_LENGTH:
+            return UNKNOWN_LANGUAGE
+        if self._executor is None:
+            return detect_language(text)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def detect_many(self, texts: List[Optional[str]]) -> List[str]:
+        if self._executor is None:
+            return detect_languages(texts)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, detect_languages, texts)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: List[Tuple[str, asyncio.Future]] = []
+            try:
+                batch.append(await self._queue.get())
+                deadline = loop.time() + self.batch_delay
+                while len(batch) < self.batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # Stopping: the batch being collected is detected inline
+                for text, future in batch:
+                    future.set_result(detect_language(text))
+                raise
+            # Don't wait for the batch to be detected before collecting the next one
+            task = asyncio.create_task(self._detect_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _detect_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in batch]
+        try:
+            languages = await asyncio.get_running_loop().run_in_executor(self._executor, detect_languages, texts)
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), language in zip(batch, languages):
+            if not future.done():
+                future.set_result(language)
+
+
+detector = LanguageDetectionPool(executor_type=os.getenv("LANGDETECT_EXECUTOR", "process"),
+                                 workers=int(os.getenv("LANGDETECT_WORKERS", "1")),
+                                 batch_size=int(os.getenv("LANGDETECT_BATCH_SIZE", "32")),
+                                 batch_delay=float(os.getenv("LANGDETECT_BATCH_DELAY", "0.005")))
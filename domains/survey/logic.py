@@ -1,24 +1,40 @@
+import asyncio
+import logging
+import os
 import uuid
 from datetime import datetime
-from typing import List
-from langdetect import detect, LangDetectException, DetectorFactory
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+import pymongo
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from odmantic import ObjectId
+from domains import conditional, pagination
+from domains.bulk import BulkError
+from domains.cache import TTLCache, MISSING
+from domains.analytics import logic as analytics_logic
 from domains.features.models import Feature
-from domains.survey.exceptions import ModelNotFound
+from domains.features.patterns import FeatureMatch, feature_patterns
+from domains.survey import eligibility, search, storage
+from domains.survey.exceptions import ModelNotFound, SearchUnavailable
+from domains.survey.language import detector
 from domains.survey.models import SurveyInApi, Survey, SurveyRule, SurveyCommentApi, SurveyComment, \
-    SurveyKeyTimestamp, SurveyCommentParameter
+    SurveyKeyTimestamp, SurveyCommentParameter, SurveyRuleApi, SurveyLastAnswer, SurveyEligibilityApi, \
+    SurveyKeyTimestampApi
+from domains.survey.timestamp_keys import timestamp_keys
 from domains.projects.models import Project
 
 import domains.survey.formatter as mapper
 
-DetectorFactory.seed = 0
+logger = logging.getLogger(__name__)
 
-
-def _detect_language(text: str) -> str:
-    try:
-        return detect(text)
-    except LangDetectException:
-        return 'unknown'
+# (ETag, rules or None for features without rules) of the widget's hot path, keyed by feature id
+survey_rules_cache = TTLCache("survey_rules",
+                              max_size=int(os.getenv("SURVEY_RULES_CACHE_SIZE", "10000")),
+                              ttl=float(os.getenv("SURVEY_RULES_CACHE_TTL", "60")))
+# Last answer (or None) of a user on a feature, keyed by (user_id, feature id)
+last_answers_cache = TTLCache("last_answers",
+                              max_size=int(os.getenv("LAST_ANSWERS_CACHE_SIZE", "100000")),
+                              ttl=float(os.getenv("LAST_ANSWERS_CACHE_TTL", "30")))
 
 
 async def _create_survey(survey: SurveyInApi, project: Project, engine) -> Survey:
@@ -27,111 +43,419 @@ async def _create_survey(survey: SurveyInApi, project: Project, engine) -> Surve
     return survey
 
 
-async def _get_comments_from_feature(engine,
-                                     feature: Feature,
-                                     parameter: SurveyCommentParameter) -> List[SurveyComment]:
-    query = SurveyComment.feature == feature.id
+async def _get_feature_urls(engine, query) -> Dict[ObjectId, str]:
+    # Only the resource is needed to map the comments, leave the payload in the database
+    cursor = engine.get_collection(Feature).find(query, {+Feature.resource: 1})
+    return {feature["_id"]: feature.get(+Feature.resource) async for feature in cursor}
+
+
+def _get_comments_query(feature_urls: Dict[ObjectId, str], parameter: SurveyCommentParameter) -> dict:
+    # Keys of the stored layout, see storage.comment_storage
+    field = storage.comment_storage.field
+    query = {field(+SurveyComment.feature): {"$in": list(feature_urls)}}
+    dates = {}
     if parameter.starting_date is not None:
-        query = query & SurveyComment.date.gte(parameter.starting_date)
+        dates["$gte"] = parameter.starting_date
     if parameter.ending_date is not None:
-        query = query & SurveyComment.date.lte(parameter.ending_date)
+        dates["$lte"] = parameter.ending_date
+    if dates:
+        query[field(+SurveyComment.date)] = dates
     if parameter.language is not None:
-        query = query & (SurveyComment.language == parameter.language)
+        query[field(+SurveyComment.language)] = parameter.language
+    return query
 
-    comments = await engine.find(SurveyComment, query)
 
-    return comments
+async def _get_parameter_feature_urls(engine, parameter: SurveyCommentParameter) -> Dict[ObjectId, str]:
+    if parameter.feature_url is not None:
+        return await _get_feature_urls(engine, Feature.resource == parameter.feature_url)
+    if parameter.project_id is not None:
+        return await _get_feature_urls(engine, Feature.project == ObjectId(parameter.project_id))
+    return {}
 
 
 async def _create_survey_rules(survey: Survey,
                                survey_api: SurveyInApi,
-                               engine) -> List[SurveyRule]:
-    survey_rules = []
-    for feature_rule in survey_api.feature_rules:
-        feature = await engine.find_one(Feature, Feature.resource == feature_rule.url)
-        if feature is None:
-            raise ModelNotFound
-
-        survey_rule = SurveyRule(survey=survey,
-                                 feature=feature,
-                                 ratio=feature_rule.ratio,
-                                 delay_to_answer=survey_api.delay_to_answer,
-                                 delay_before_reanswer=feature_rule.delay_before_new_proposition,
-                                 is_activated=True)
-        survey_rules.append(survey_rule)
-    await engine.save_all(survey_rules)
-    return survey_rules
-
-
-async def create_survey_rules(survey_api: SurveyInApi, engine) -> List[SurveyRule]:
+                               engine) -> Tuple[List[SurveyRuleApi], List[BulkError]]:
+    feature_rules = survey_api.feature_rules or []
+    # Resolve all the feature urls at once
+    features = engine.get_collection(Feature).find(
+        {+Feature.resource: {"$in": list({feature_rule.url for feature_rule in feature_rules})}},
+        {+Feature.resource: 1})
+    feature_ids = {}
+    async for feature in features:
+        feature_ids.setdefault(feature[+Feature.resource], feature["_id"])
+
+    errors, documents, indexes = [], [], []
+    for index, feature_rule in enumerate(feature_rules):
+        if feature_rule.url not in feature_ids:
+            errors.append(BulkError(index=index, detail="feature not found"))
+            continue
+        documents.append({+SurveyRule.survey: survey.id,
+                          +SurveyRule.feature: feature_ids[feature_rule.url],
+                          +SurveyRule.ratio: feature_rule.ratio,
+                          +SurveyRule.delay_to_answer: survey_api.delay_to_answer,
+                          +SurveyRule.delay_before_reanswer: feature_rule.delay_before_new_proposition,
+                          +SurveyRule.is_activated: True})
+        indexes.append(index)
+    if documents:
+        try:
+            await engine.get_collection(SurveyRule).insert_many(documents, ordered=False)
+        except BulkWriteError as error:
+            failed = {write_error["index"]: write_error["errmsg"] for write_error in error.details["writeErrors"]}
+            errors.extend(BulkError(index=indexes[position], detail=detail) for position, detail in failed.items())
+            documents = [document for position, document in enumerate(documents) if position not in failed]
+    feature_ids = {document[+SurveyRule.feature] for document in documents}
+    for feature_id in feature_ids:
+        survey_rules_cache.invalidate(feature_id)
+    await conditional.bump(engine, "rules", [str(feature_id) for feature_id in feature_ids])
+    survey_rules = [mapper.map_survey_rule_api_from_document(document) for document in documents]
+    return survey_rules, sorted(errors, key=lambda bulk_error: bulk_error.index)
+
+
+async def create_survey_rules(survey_api: SurveyInApi, engine) -> Tuple[List[SurveyRuleApi], List[BulkError]]:
     project = await engine.find_one(Project, Project.id == ObjectId(survey_api.project_id))
     if project is None:
         raise ModelNotFound
     survey = await _create_survey(survey_api, project, engine)
-    return await _create_survey_rules(survey, survey_api, engine)
+    survey_rules, errors = await _create_survey_rules(survey, survey_api, engine)
+    return survey_rules, errors
 
 
-async def get_survey_rules(feature_url: str, engine) -> SurveyRule:
-    feature = await engine.find_one(Feature, Feature.resource == feature_url)
+async def _resolve_feature(feature_url: str, engine) -> FeatureMatch:
+    # In memory, see domains.features.patterns
+    feature = await feature_patterns.resolve(engine, feature_url)
     if feature is None:
         raise ModelNotFound
-    survey_rule = await engine.find_one(SurveyRule, SurveyRule.feature == feature.id)
-    if survey_rule is None:
-        raise ModelNotFound
-    return survey_rule
+    return feature
 
 
-async def add_survey_comments(survey_comment_api: SurveyCommentApi, engine) -> SurveyComment:
-    feature = await engine.find_one(Feature,
-                                    Feature.resource == survey_comment_api.feature_url)
-    if feature is None:
+async def _find_survey_rule(feature_id: ObjectId, engine) -> Optional[dict]:
+    # Backed by an index (see schema.setup)
+    return await engine.get_collection(SurveyRule).find_one({+SurveyRule.feature: feature_id})
+
+
+async def _get_feature_rules(feature: FeatureMatch, engine, etag: Optional[str] = None) -> SurveyRuleApi:
+    # Rules cached at another version than the ETag served with them are read again:
+    # other workers only see the writes through the version stamps
+    cached = survey_rules_cache.get(feature.feature)
+    if cached is MISSING or (etag is not None and cached[0] != etag):
+        document = await _find_survey_rule(feature.feature, engine)
+        survey_rule_api = None if document is None else mapper.map_survey_rule_api_from_document(document)
+        cached = (etag, survey_rule_api)
+        survey_rules_cache.set(feature.feature, cached)
+    if cached[1] is None:
         raise ModelNotFound
-    comment = mapper.map_survey_comment_from_survey_comment_api(survey_comment_api, feature)
-    comment.language = _detect_language(survey_comment_api.description)
-    await engine.save(comment)
-    return comment
+    return cached[1]
+
+
+async def get_survey_rules(feature_url: str, engine, etag: Optional[str] = None) -> SurveyRuleApi:
+    '''
+    Rules of the feature of a URL
+
+    Parameters
+    ----------
+    feature_url : str
+        URL of the page of the widget
+    engine : AIOEngine
+        Async IO Pymongo engine
+    etag : Optional[str]
+        ETag served with the rules (see get_survey_rules_version), read after it: cached rules
+        of another version are read again so that the rules are never older than their ETag
+
+    Raises
+    ------
+    ModelNotFound
+        No feature matches the URL, or the feature has no rules
+    '''
+    return await _get_feature_rules(await _resolve_feature(feature_url, engine), engine, etag)
+
+
+async def get_survey_rules_version(feature_url: str, engine) -> Tuple[str, Optional[datetime]]:
+    '''
+    ETag and Last-Modified of the rules of the feature of a URL, from the version stamps bumped
+    on the writes of the rules of the feature and on project deletions
+
+    Raises
+    ------
+    ModelNotFound
+        No feature matches the URL
+    '''
+    feature = await _resolve_feature(feature_url, engine)
+    (version, modified), (all_version, all_modified) = await asyncio.gather(
+        conditional.get_version(engine, "rules", str(feature.feature)),
+        conditional.get_version(engine, "rules", conditional.ALL_RULES))
+    last_modified = max((date for date in (modified, all_modified) if date is not None), default=None)
+    # The feature is part of the ETag: the URL may resolve to another feature since the client read the rules
+    return conditional.make_etag("rules", feature.feature, version, all_version), last_modified
+
+
+async def add_survey_comments(survey_comment_api: SurveyCommentApi, engine) -> dict:
+    '''
+    Write a comment on the feature of its URL
+
+    Returns
+    -------
+    dict
+        Comment document, in the layout of SurveyComment
+
+    Raises
+    ------
+    ModelNotFound
+        No feature matches the URL of the comment
+    pydantic.ValidationError
+        Invalid comment (e.g. a rating out of 1 to 5)
+    '''
+    feature = await _resolve_feature(survey_comment_api.feature_url, engine)
+    comment = mapper.map_queued_survey_comment_from_survey_comment_api(survey_comment_api)
+    language = await detector.detect(comment.description)
+    document = mapper.map_survey_comment_document_from_queued_survey_comment(comment, feature.feature, language)
+    feature_projects = {feature.feature: feature.project}
+    await storage.comment_storage.insert_many(engine, [document], feature_projects)
+    # The comment is stored: failing now would have the client retry and duplicate it,
+    # as when the queue is flushed the last answers and rollups are only logged on errors
+    try:
+        await update_last_answers(engine, [document])
+        last_answers_cache.invalidate((str(comment.user_id), feature.feature))
+        await analytics_logic.update_rating_rollups(engine, [document], feature_projects)
+    except Exception:
+        logger.exception("Unable to add the comment of user %s on feature %s to the last answers and rollups",
+                         comment.user_id, feature.feature)
+    return document
+
+
+async def update_last_answers(engine, comments: List[dict]):
+    # Comments may be written out of order, only move the date forward
+    operations = [
+        UpdateOne({+SurveyLastAnswer.user_id: comment[+SurveyComment.user_id],
+                   +SurveyLastAnswer.feature: comment[+SurveyComment.feature]},
+                  {"$max": {+SurveyLastAnswer.last_answered: comment[+SurveyComment.date]}},
+                  upsert=True)
+        for comment in comments
+    ]
+    if operations:
+        await engine.get_collection(SurveyLastAnswer).bulk_write(operations, ordered=False)
+
+
+async def _iter_comment_documents(engine,
+                                  parameter: SurveyCommentParameter,
+                                  batch_size: int) -> AsyncIterator[Tuple[dict, str]]:
+    feature_urls = await _get_parameter_feature_urls(engine, parameter)
+    if not feature_urls:
+        return
+    comment_storage = storage.comment_storage
+    cursor = comment_storage.collection(engine).find(_get_comments_query(feature_urls, parameter),
+                                                     batch_size=batch_size)
+    async for document in cursor:
+        document = comment_storage.from_stored(document)
+        yield document, feature_urls[document[+SurveyComment.feature]]
+
+
+async def iter_survey_comments(engine,
+                               parameter: SurveyCommentParameter,
+                               batch_size: int = 1000) -> AsyncIterator[SurveyCommentApi]:
+    async for document, feature_url in _iter_comment_documents(engine, parameter, batch_size):
+        yield mapper.map_survey_comment_api_from_document(document, feature_url)
 
 
 async def get_survey_comments(engine,
-                              parameter: SurveyCommentParameter) -> List[SurveyComment]:
-    comments = []
-    if parameter.feature_url is not None:
-        feature = await engine.find_one(Feature,
-                                        Feature.resource == parameter.feature_url)
-        comments = await _get_comments_from_feature(engine,
-                                                    feature,
-                                                    parameter)
+                              parameter: SurveyCommentParameter) -> List[SurveyCommentApi]:
+    return [comment async for comment in iter_survey_comments(engine, parameter)]
+
+
+async def get_survey_comment_dicts(engine, parameter: SurveyCommentParameter) -> List[dict]:
+    # Same as get_survey_comments, as plain dicts for serialization.FastJSONResponse
+    return [mapper.map_survey_comment_dict_from_document(document, feature_url)
+            async for document, feature_url in _iter_comment_documents(engine, parameter, 1000)]
+
+
+def _decode_comments_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    date, comment_id = pagination.decode_cursor(cursor, 2)
+    try:
+        return datetime.fromisoformat(date), ObjectId(comment_id)
+    except (TypeError, ValueError) as error:
+        raise pagination.InvalidCursor from error
+
+
+async def get_survey_comments_page(engine,
+                                   parameter: SurveyCommentParameter,
+                                   limit: Optional[int],
+                                   cursor: Optional[str],
+                                   as_dict: bool = False) -> Union[pagination.Page, dict]:
+    # Newest comments first, keyset pagination on (date, _id)
+    limit = min(limit or pagination.DEFAULT_LIMIT, pagination.MAX_LIMIT)
+    feature_urls = await _get_parameter_feature_urls(engine, parameter)
+    if not feature_urls:
+        return {"items": [], "next_cursor": None} if as_dict else pagination.Page(items=[], next_cursor=None)
+    comment_storage = storage.comment_storage
+    date_field = comment_storage.field(+SurveyComment.date)
+    query = _get_comments_query(feature_urls, parameter)
+    if cursor is not None:
+        date, comment_id = _decode_comments_cursor(cursor)
+        query = {"$and": [query, {"$or": [{date_field: {"$lt": date}},
+                                          {date_field: date, "_id": {"$lt": comment_id}}]}]}
+    # One more comment tells whether there is a next page
+    documents = await comment_storage.collection(engine).find(
+        query,
+        sort=[(date_field, pymongo.DESCENDING), ("_id", pymongo.DESCENDING)],
+        limit=limit + 1).to_list(length=limit + 1)
+    documents = [comment_storage.from_stored(document) for document in documents]
+    next_cursor = None
+    if len(documents) > limit:
+        last = documents[limit - 1]
+        next_cursor = pagination.encode_cursor(last[+SurveyComment.date].isoformat(), last["_id"])
+    if as_dict:
+        items = [mapper.map_survey_comment_dict_from_document(document, feature_urls[document[+SurveyComment.feature]])
+                 for document in documents[:limit]]
+        return {"items": items, "next_cursor": next_cursor}
+    items = [mapper.map_survey_comment_api_from_document(document, feature_urls[document[+SurveyComment.feature]])
+             for document in documents[:limit]]
+    return pagination.Page(items=items, next_cursor=next_cursor)
+
+
+async def _get_last_answers(engine, user_id: str, feature_ids: List[ObjectId]) -> Dict[ObjectId, datetime]:
+    # Backed by the unique index of the last answers
+    cursor = engine.get_collection(SurveyLastAnswer).find(
+        {+SurveyLastAnswer.user_id: uuid.UUID(user_id), +SurveyLastAnswer.feature: {"$in": feature_ids}},
+        {+SurveyLastAnswer.feature: 1, +SurveyLastAnswer.last_answered: 1})
+    return {last_answer[+SurveyLastAnswer.feature]: last_answer[+SurveyLastAnswer.last_answered]
+            async for last_answer in cursor}
+
+
+def _decode_search_cursor(cursor: str) -> Tuple[float, ObjectId]:
+    score, comment_id = pagination.decode_cursor(cursor, 2)
+    try:
+        return float(score), ObjectId(comment_id)
+    except (TypeError, ValueError) as error:
+        raise pagination.InvalidCursor from error
+
+
+async def search_survey_comments_page(engine,
+                                      parameter: SurveyCommentParameter,
+                                      text: str,
+                                      limit: Optional[int],
+                                      cursor: Optional[str],
+                                      as_dict: bool = False) -> Union[pagination.Page, dict]:
+    '''
+    Comments whose description matches `text` (MongoDB $text search: words, "phrases", -exclusions),
+    filtered by the parameter and ranked by relevance, with keyset pagination on (score, _id).
+    $text stems the search terms in a single language: the terms are stemmed in the language of the
+    parameter if any, otherwise every language of the text index is searched (its own comments only,
+    with the terms stemmed in that language) and the results are merged by score.
+
+    Raises
+    ------
+    SearchUnavailable
+        The comments are stored without text index (time-series storage)
+    InvalidCursor
+        The cursor was not produced by a previous page
+    '''
+    comment_storage = storage.comment_storage
+    if not comment_storage.text_search:
+        raise SearchUnavailable
+    limit = min(limit or pagination.DEFAULT_LIMIT, pagination.MAX_LIMIT)
+    after = None if cursor is None else _decode_search_cursor(cursor)
+    feature_urls = await _get_parameter_feature_urls(engine, parameter)
+    if not feature_urls:
+        return {"items": [], "next_cursor": None} if as_dict else pagination.Page(items=[], next_cursor=None)
+    languages = search.SEARCH_LANGUAGES if parameter.language is None else [search.text_language(parameter.language)]
 
-    elif parameter.project_id is not None:
-        features = await engine.find(Feature,
-                                     Feature.project == ObjectId(parameter.project_id))
+    def pipeline(text_language: str) -> List[dict]:
+        # The text index, prefixed by the language, selects the matching comments, the filters apply to them
+        stages = [
+            {"$match": {"$text": {"$search": text, "$language": text_language},
+                        +SurveyComment.search_language: text_language,
+                        **_get_comments_query(feature_urls, parameter)}},
+            {"$addFields": {"score": {"$meta": "textScore"}}},
+        ]
+        if after is not None:
+            score, comment_id = after
+            stages.append({"$match": {"$or": [{"score": {"$lt": score}},
+                                              {"score": score, "_id": {"$lt": comment_id}}]}})
+        # One more comment tells whether there is a next page
+        return stages + [{"$sort": {"score": -1, "_id": -1}}, {"$limit": limit + 1}]
 
-        for feature in features:
-            result = await _get_comments_from_feature(engine,
-                                                      feature,
-                                                      parameter)
-            comments = comments + result
-    return comments
+    collection = comment_storage.collection(engine)
+    results = await asyncio.gather(*[collection.aggregate(pipeline(text_language)).to_list(length=limit + 1)
+                                     for text_language in languages])
+    documents = sorted((document for result in results for document in result),
+                       key=lambda document: (document["score"], document["_id"]), reverse=True)[:limit + 1]
+    next_cursor = None
+    if len(documents) > limit:
+        last = documents[limit - 1]
+        next_cursor = pagination.encode_cursor(last["score"], last["_id"])
+    map_document = mapper.map_survey_comment_dict_from_document if as_dict \
+        else mapper.map_survey_comment_api_from_document
+    items = [map_document(document, feature_urls[document[+SurveyComment.feature]]) for document in documents[:limit]]
+    if as_dict:
+        return {"items": items, "next_cursor": next_cursor}
+    return pagination.Page(items=items, next_cursor=next_cursor)
+
+
+async def get_last_times_user_answered(feature_urls: List[str], user_id: str, engine) -> Dict[str, Optional[datetime]]:
+    # Features resolved in memory, their last answers read in a single round-trip
+    features = {}
+    for feature_url in feature_urls:
+        feature = await feature_patterns.resolve(engine, feature_url)
+        if feature is not None:
+            features[feature_url] = feature.feature
+    last_answers = await _get_last_answers(engine, user_id, list(set(features.values()))) if features else {}
+    return {feature_url: last_answers.get(features.get(feature_url)) for feature_url in feature_urls}
 
 
 async def get_last_time_user_answered(feature_url: str, user_id: str, engine) -> datetime:
-    feature = await engine.find_one(Feature, Feature.resource == feature_url)
-    if feature is None:
+    last_times = await get_last_times_user_answered([feature_url], user_id, engine)
+    if last_times[feature_url] is None:
         raise ModelNotFound
-    comment_list = await engine.find(SurveyComment, SurveyComment.feature == feature.id,
-                                     SurveyComment.user_id == uuid.UUID(user_id),
-                                     sort=SurveyComment.date.desc())
-    if comment_list is None or not comment_list:
+    return last_times[feature_url]
+
+
+async def _get_last_time_user_answered_cached(feature: FeatureMatch, user_id: str, engine) -> Optional[datetime]:
+    last_answered = last_answers_cache.get((user_id, feature.feature))
+    if last_answered is MISSING:
+        last_answered = (await _get_last_answers(engine, user_id, [feature.feature])).get(feature.feature)
+        last_answers_cache.set((user_id, feature.feature), last_answered)
+    return last_answered
+
+
+async def get_survey_eligibility(feature_url: str, user_id: str, engine) -> SurveyEligibilityApi:
+    try:
+        feature = await _resolve_feature(feature_url, engine)
+        rule = await _get_feature_rules(feature, engine)
+    except ModelNotFound:
+        return SurveyEligibilityApi(eligible=False, reason=eligibility.UNKNOWN_FEATURE)
+    if not rule.is_activated:
+        return SurveyEligibilityApi(eligible=False, reason=eligibility.INACTIVE)
+    # Sampling first, most page views stop here without any query.
+    # Sampled on the resource so that a user gets the same decision on every URL of a pattern
+    if not eligibility.is_sampled(user_id, feature.resource, rule.ratio_display):
+        return SurveyEligibilityApi(eligible=False, reason=eligibility.NOT_SAMPLED)
+    now = datetime.utcnow()
+    last_answered = await _get_last_time_user_answered_cached(feature, user_id, engine)
+    if last_answered is not None and eligibility.is_within_reanswer_delay(last_answered,
+                                                                          rule.delay_before_reanswer,
+                                                                          now):
+        return SurveyEligibilityApi(eligible=False, reason=eligibility.REANSWER_DELAY)
+    timestamp_key = await timestamp_keys.get_active(engine)
+    if timestamp_key is None:
         raise ModelNotFound
-    return comment_list[0].date
+    return SurveyEligibilityApi(eligible=True,
+                                delay_to_answer=rule.delay_to_answer,
+                                timestamp=eligibility.encrypt_timestamp(timestamp_key.key, now),
+                                key_version=timestamp_key.version)
 
 
-async def add_timestamp_key_encoded(key: SurveyKeyTimestamp, engine):
-    await engine.save(key)
+async def add_timestamp_key_encoded(key: SurveyKeyTimestamp, engine) -> SurveyKeyTimestamp:
+    return await timestamp_keys.rotate(engine, key.key)
 
 
 async def get_timestamp_key_encoded(engine) -> str:
-    timestamp_key_model = await engine.find_one(SurveyKeyTimestamp)
+    timestamp_key_model = await timestamp_keys.get_active(engine)
     if timestamp_key_model is None:
         raise ModelNotFound
     return timestamp_key_model.key
+
+
+async def get_timestamp_keys(engine) -> List[SurveyKeyTimestampApi]:
+    timestamp_key_models = await timestamp_keys.get_accepted(engine)
+    return [mapper.map_survey_key_timestamp_api_from_survey_key_timestamp(timestamp_key_model, index == 0)
+            for index, timestamp_key_model in enumerate(timestamp_key_models)]
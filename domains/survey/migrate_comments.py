@@ -0,0 +1,33 @@
+'''
+Copy the comments into the time-series collection of SURVEY_COMMENTS_STORAGE=timeseries.
+
+Usage: python -m domains.survey.migrate_comments
+'''
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from odmantic import AIOEngine
+
+# Load the .env file before importing the domains, some of them read their settings at import time
+load_dotenv()
+
+from domains.survey import storage
+from schema import schema
+
+
+async def main():
+    client = AsyncIOMotorClient(os.getenv("DB_URL"))
+    engine = AIOEngine(motor_client=client, database=os.getenv("DB_NAME"))
+    try:
+        # Creates the time-series collection if the service never started on this version
+        await schema.setup(client, engine)
+        copied = await storage.copy_comments_to_timeseries(engine)
+        print(f"{copied} comments copied")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,8 @@
 from datetime import datetime
 from typing import List, Optional
 from uuid import UUID
-from odmantic import Reference, Model
-from pydantic import BaseModel
+from odmantic import Reference, Model, ObjectId
+from pydantic import BaseModel, conint
 
 from domains.features.models import Feature
 from domains.projects.models import Project
@@ -84,6 +84,19 @@ class SurveyRule(Model):
     is_activated: bool
 
 
+class SurveyEligibilityApi(BaseModel):
+    """
+    This class is only used for modeling the API output
+    of the decision to propose the survey to a user on a feature.
+    see :py:class:`~domains.survey.SurveyRule`
+    """
+    eligible: bool
+    reason: Optional[str]
+    delay_to_answer: Optional[int]
+    timestamp: Optional[str]
+    key_version: Optional[int]
+
+
 class SurveyCommentApi(BaseModel):
     """
     This class is only used for modeling the API input
@@ -99,15 +112,29 @@ class SurveyCommentApi(BaseModel):
     language: Optional[str]
 
 
+class QueuedSurveyComment(BaseModel):
+    """
+    This class is only used to validate a SurveyCommentApi
+    before it is queued for a delayed write (write-behind mode),
+    the feature is resolved from its URL when the queue is flushed.
+    see :py:class:`~domains.survey.SurveyComment`
+    """
+    feature_url: str
+    user_id: UUID
+    date: datetime
+    rating: conint(ge=1, le=5)
+    description: Optional[str]
+
+
 class SurveyCommentParameter(BaseModel):
     """
     This class is only used to encapsulate the different
     parameters for filtering the comments.
     """
-    language: Optional[str] = None,
-    feature_url: Optional[str] = None,
-    project_id: Optional[str] = None,
-    starting_date: Optional[datetime] = None,
+    language: Optional[str] = None
+    feature_url: Optional[str] = None
+    project_id: Optional[str] = None
+    starting_date: Optional[datetime] = None
     ending_date: Optional[datetime] = None
 
 
@@ -124,6 +151,7 @@ class SurveyComment(Model):
         rating:           Rating (between 1 and 5)
         description:      Comment given by the user
         language:         comment's language
+        search_language:  Language of the full-text index of the description, derived from the language
 
     """
     feature: Feature = Reference()
@@ -132,16 +160,50 @@ class SurveyComment(Model):
     rating: int
     description: Optional[str]
     language: Optional[str]
+    search_language: Optional[str]
+
+
+class SurveyLastAnswer(Model):
+    """
+    This class is a model for the last time a user answered the survey on a feature.
+    It is upserted on every comment written, so that the widget gets it
+    without going through the comments of the user.
+
+    Attributes:
+    -----------
+        user_id:          Id of the user sending the feedback
+        feature:          Feature (no reference so as to avoid lookups)
+        last_answered:    Date of the most recent feedback of the user on the feature
+    """
+    user_id: UUID
+    feature: ObjectId
+    last_answered: datetime
 
 
 class SurveyKeyTimestamp(Model):
     """
     This class is a model for the encryption/decryption key
     used to encrypt/decrypt timestamp send to the user.
-    Only one key can be stored in the BDD at the same time.
+    Keys are versioned: only the key with the highest version is active (used to encrypt),
+    previous keys are still accepted for decryption during a grace period after a rotation.
     Attributes:
     -----------
-        key:      Timestamp's key for encryption/decryption. It is encoded (Base64).
-        
+        key:          Timestamp's key for encryption/decryption. It is encoded (Base64).
+        version:      Version of the key, set by the rotation
+        created:      Date of the rotation that introduced the key
+
+    """
+    key: str
+    version: Optional[int]
+    created: Optional[datetime]
+
+
+class SurveyKeyTimestampApi(BaseModel):
+    """
+    This class is only used for modeling the API output
+    of a timestamp key accepted for decryption.
+    see :py:class:`~domains.survey.SurveyKeyTimestamp`
     """
     key: str
+    version: Optional[int]
+    active: bool
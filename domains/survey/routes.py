@@ -1,52 +1,102 @@
+import asyncio
+import os
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Union
+from uuid import UUID
 
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Query, Request, Response, HTTPException
+from fastapi.responses import StreamingResponse
+from odmantic import ObjectId
+from pydantic import ValidationError
+from pymongo.errors import DuplicateKeyError
 
 import domains.survey.formatter as mapper
-from domains.survey import logic
-from domains.survey.exceptions import ModelNotFound
+from domains import conditional, pagination, serialization
+from domains.bulk import BulkResult
+from domains.pagination import Page, InvalidCursor
+from domains.survey import export, logic
+from domains.survey.exceptions import InvalidTimestampKey, ModelNotFound, SearchUnavailable
 from domains.survey.models import SurveyKeyTimestamp, SurveyCommentParameter, SurveyRuleApi, SurveyInApi, \
-    SurveyCommentApi
+    SurveyCommentApi, SurveyEligibilityApi, SurveyKeyTimestampApi
 
 router = APIRouter()
 
+# Comments read from MongoDB per round-trip when exporting
+EXPORT_BATCH_SIZE = int(os.getenv("SURVEY_EXPORT_BATCH_SIZE", "1000"))
 
-@router.post("", response_model=List[SurveyRuleApi])
-async def create_survey_rules(request: Request, survey_api: SurveyInApi) -> List[SurveyRuleApi]:
+
+@router.post("", response_model=Union[List[SurveyRuleApi], BulkResult[SurveyRuleApi]])
+async def create_survey_rules(request: Request, response: Response, survey_api: SurveyInApi):
     try:
-        survey_rules = await logic.create_survey_rules(survey_api, request.app.engine)
-        return [mapper.map_survey_rule_api_from_survey_rule(rule) for rule in survey_rules]
+        survey_rules, errors = await logic.create_survey_rules(survey_api, request.app.engine)
     except ModelNotFound as error:
         raise HTTPException(404) from error
+    if errors:
+        response.status_code = 207
+        return BulkResult(items=survey_rules, errors=errors)
+    return survey_rules
 
 
 @router.get("/rules", response_model=SurveyRuleApi)
-async def get_survey_rule_from_feature(request: Request, feature_url: str) -> SurveyRuleApi:
+async def get_survey_rule_from_feature(request: Request, response: Response, feature_url: str) -> SurveyRuleApi:
     try:
-        survey_rule = await logic.get_survey_rules(feature_url, request.app.engine)
-        return mapper.map_survey_rule_api_from_survey_rule(survey_rule)
+        # Widgets, browsers and the CDN revalidate their copy, unchanged rules are answered with a 304
+        etag, last_modified = await logic.get_survey_rules_version(feature_url, request.app.engine)
+        if conditional.is_not_modified(request, etag, last_modified):
+            return conditional.not_modified_response(etag, last_modified, conditional.RULES_CACHE_CONTROL)
+        survey_rule_api = await logic.get_survey_rules(feature_url, request.app.engine, etag)
     except ModelNotFound as error:
         raise HTTPException(404) from error
+    conditional.set_headers(response, etag, last_modified, conditional.RULES_CACHE_CONTROL)
+    return survey_rule_api
+
+
+@router.get("/eligibility", response_model=SurveyEligibilityApi)
+async def get_survey_eligibility(request: Request, feature_url: str, user_id: UUID) -> SurveyEligibilityApi:
+    try:
+        return await logic.get_survey_eligibility(feature_url, str(user_id), request.app.engine)
+    except ModelNotFound as error:
+        # No timestamp key stored
+        raise HTTPException(404) from error
+    except InvalidTimestampKey as error:
+        # Active key stored before the rotation validated the keys
+        raise HTTPException(503, f"{error}, rotate it with POST /survey/timestamps") from error
 
 
 @router.post("/comments", response_model=SurveyCommentApi)
 async def add_survey_comments(request: Request,
+                              response: Response,
                               survey_comment_api: SurveyCommentApi) -> SurveyCommentApi:
+    if request.app.comment_queue is not None:
+        # Write-behind mode: the comment is written later by the queue
+        try:
+            request.app.comment_queue.put(survey_comment_api)
+        except ValidationError as error:
+            raise HTTPException(422, detail=error.errors()) from error
+        except asyncio.QueueFull as error:
+            raise HTTPException(503) from error
+        response.status_code = 202
+        return survey_comment_api
     try:
         comment = await logic.add_survey_comments(survey_comment_api, request.app.engine)
-        return mapper.map_model_comment_api_from_survey_comment(comment)
+    except ValidationError as error:
+        raise HTTPException(422, detail=error.errors()) from error
     except ModelNotFound as error:
         raise HTTPException(404) from error
+    # The URL of the comment rather than the resource of its feature (possibly a pattern)
+    return mapper.map_survey_comment_api_from_document(comment, survey_comment_api.feature_url)
 
 
-@router.get("/projects/{project_id}/comments", response_model=List[SurveyCommentApi])
+@router.get("/projects/{project_id}/comments",
+            response_model=Union[Page[SurveyCommentApi], List[SurveyCommentApi]])
 async def get_comments(request: Request,
                        project_id: str,
                        language: Optional[str] = None,
                        feature_url: Optional[str] = None,
                        starting_date: Optional[datetime] = None,
-                       ending_date: Optional[datetime] = None) -> List[SurveyCommentApi]:
+                       ending_date: Optional[datetime] = None,
+                       limit: Optional[int] = Query(None, gt=0, le=pagination.MAX_LIMIT),
+                       cursor: Optional[str] = None) -> Union[Page[SurveyCommentApi], List[SurveyCommentApi]]:
     comments_filter_parameter = SurveyCommentParameter(
         language=language,
         feature_url=feature_url,
@@ -54,12 +104,83 @@ async def get_comments(request: Request,
         starting_date=starting_date,
         ending_date=ending_date
     )
-    comments = await logic.get_survey_comments(request.app.engine,
-                                               comments_filter_parameter)
-
-    result = [mapper.map_model_comment_api_from_survey_comment(c) for c in comments]
-
-    return result
+    fast = serialization.FAST_RESPONSES
+    if pagination.is_paginated(limit, cursor):
+        try:
+            page = await logic.get_survey_comments_page(request.app.engine,
+                                                        comments_filter_parameter,
+                                                        limit,
+                                                        cursor,
+                                                        as_dict=fast)
+        except InvalidCursor as error:
+            raise HTTPException(400) from error
+        return serialization.FastJSONResponse(page) if fast else page
+    if fast:
+        return serialization.FastJSONResponse(await logic.get_survey_comment_dicts(request.app.engine,
+                                                                                   comments_filter_parameter))
+    return await logic.get_survey_comments(request.app.engine,
+                                           comments_filter_parameter)
+
+
+@router.get("/projects/{project_id}/comments/search", response_model=Page[SurveyCommentApi])
+async def search_comments(request: Request,
+                          project_id: ObjectId,
+                          q: str = Query(..., min_length=1),
+                          language: Optional[str] = None,
+                          feature_url: Optional[str] = None,
+                          starting_date: Optional[datetime] = None,
+                          ending_date: Optional[datetime] = None,
+                          limit: Optional[int] = Query(None, gt=0, le=pagination.MAX_LIMIT),
+                          cursor: Optional[str] = None) -> Page[SurveyCommentApi]:
+    comments_filter_parameter = SurveyCommentParameter(
+        language=language,
+        feature_url=feature_url,
+        project_id=str(project_id),
+        starting_date=starting_date,
+        ending_date=ending_date
+    )
+    fast = serialization.FAST_RESPONSES
+    try:
+        # Best matches first, see the fulltext index of the comments in schema.setup
+        page = await logic.search_survey_comments_page(request.app.engine,
+                                                       comments_filter_parameter,
+                                                       q,
+                                                       limit,
+                                                       cursor,
+                                                       as_dict=fast)
+    except InvalidCursor as error:
+        raise HTTPException(400) from error
+    except SearchUnavailable as error:
+        raise HTTPException(501, "full-text search requires SURVEY_COMMENTS_STORAGE=collection") from error
+    return serialization.FastJSONResponse(page) if fast else page
+
+
+@router.get("/projects/{project_id}/comments/export")
+async def export_comments(request: Request,
+                          project_id: ObjectId,
+                          export_format: str = Query("ndjson", alias="format", regex="^(ndjson|csv)$"),
+                          compress: bool = False,
+                          language: Optional[str] = None,
+                          feature_url: Optional[str] = None,
+                          starting_date: Optional[datetime] = None,
+                          ending_date: Optional[datetime] = None) -> StreamingResponse:
+    comments_filter_parameter = SurveyCommentParameter(
+        language=language,
+        feature_url=feature_url,
+        project_id=str(project_id),
+        starting_date=starting_date,
+        ending_date=ending_date
+    )
+    comments = logic.iter_survey_comments(request.app.engine,
+                                          comments_filter_parameter,
+                                          batch_size=EXPORT_BATCH_SIZE)
+    # A valid ObjectId (24 hexadecimal digits) needs no escaping in the header
+    headers = {"Content-Disposition": f'attachment; filename="comments-{project_id}.{export_format}"'}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(export.export_comments(comments, export_format, compress),
+                             media_type=export.MEDIA_TYPES[export_format],
+                             headers=headers)
 
 
 @router.get("/times", response_model=datetime)
@@ -70,9 +191,22 @@ async def get_last_time_user_answered(request: Request, user_id: str = None, fea
         raise HTTPException(404) from error
 
 
+@router.get("/times/batch", response_model=Dict[str, Optional[datetime]])
+async def get_last_times_user_answered(request: Request,
+                                       user_id: UUID,
+                                       feature_urls: List[str] = Query(...)) -> Dict[str, Optional[datetime]]:
+    return await logic.get_last_times_user_answered(feature_urls, str(user_id), request.app.engine)
+
+
 @router.post("/timestamps")
 async def add_timestamp_key_encoded(request: Request, key: SurveyKeyTimestamp):
-    await logic.add_timestamp_key_encoded(key, request.app.engine)
+    try:
+        await logic.add_timestamp_key_encoded(key, request.app.engine)
+    except InvalidTimestampKey as error:
+        raise HTTPException(422, str(error)) from error
+    except DuplicateKeyError as error:
+        # Concurrent rotation
+        raise HTTPException(409) from error
 
 
 @router.get("/timestamps", response_model=str)
@@ -81,3 +215,8 @@ async def get_timestamp_key_encoded(request: Request) -> str:
         return await logic.get_timestamp_key_encoded(request.app.engine)
     except ModelNotFound as error:
         raise HTTPException(404) from error
+
+
+@router.get("/timestamps/keys", response_model=List[SurveyKeyTimestampApi])
+async def get_timestamp_keys(request: Request) -> List[SurveyKeyTimestampApi]:
+    return await logic.get_timestamp_keys(request.app.engine)
@@ -0,0 +1,19 @@
+from typing import Optional
+
+# Languages with a MongoDB text search stemmer, by code of the language detection
+# (the text index rejects the comments of any other language in its language override field)
+TEXT_LANGUAGES = {
+    "da": "da", "nl": "nl", "en": "en", "fi": "fi", "fr": "fr", "de": "de", "hu": "hu", "it": "it",
+    "no": "nb", "pt": "pt", "ro": "ro", "ru": "ru", "es": "es", "sv": "sv", "tr": "tr",
+}
+# Words indexed as they are (no stemming, no stop words)
+NO_LANGUAGE = "none"
+# Every language of the text index, searched one by one when the search has no language
+SEARCH_LANGUAGES = sorted(set(TEXT_LANGUAGES.values()) | {NO_LANGUAGE})
+
+
+def text_language(language: Optional[str]) -> str:
+    '''
+    Language of the text index of a comment (SurveyComment.search_language) from its detected language
+    '''
+    return TEXT_LANGUAGES.get(language, NO_LANGUAGE)
@@ -0,0 +1,170 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pymongo
+from odmantic import ObjectId
+
+from domains.features.models import Feature
+from domains.survey.models import SurveyComment
+
+# Time-series collection of the comments (see schema.setup), used when SURVEY_COMMENTS_STORAGE=timeseries
+TIMESERIES_COLLECTION = "comments"
+TIMESERIES_META_FIELD = "metadata"
+# Last comment copied into the time-series collection, see copy_comments_to_timeseries
+COPY_CHECKPOINT_COLLECTION = "comment_copy_checkpoint"
+
+
+class CommentStorage:
+    """
+    Reads and writes of the comments whatever the layout of the stored documents.
+    Documents are exchanged in the layout of SurveyComment
+    (feature, user_id, date, rating, description, language).
+    """
+    # Full-text search of the descriptions (text index of schema.setup)
+    text_search = True
+    # Comments updatable one by one (language backfill)
+    updatable = True
+
+    def collection(self, engine):
+        return engine.get_collection(SurveyComment)
+
+    def field(self, key_name: str) -> str:
+        '''
+        Key of a SurveyComment field in the stored documents (for queries and sorts)
+        '''
+        return key_name
+
+    def to_stored(self, document: dict, project: Optional[ObjectId]) -> dict:
+        return document
+
+    def from_stored(self, document: dict) -> dict:
+        return document
+
+    async def insert_many(self, engine, documents: List[dict], feature_projects: Dict[ObjectId, ObjectId]):
+        '''
+        Write comments with an unordered insert_many
+
+        Parameters
+        ----------
+        engine : AIOEngine
+            Async IO Pymongo engine
+        documents : List[dict]
+            Comments in the layout of SurveyComment
+        feature_projects : Dict[ObjectId, ObjectId]
+            Project of the feature of every comment
+
+        Raises
+        ------
+        pymongo.errors.BulkWriteError
+            Some comments were not written, same indexes as `documents`
+        '''
+        return await self.collection(engine).insert_many(
+            [self.to_stored(document, feature_projects.get(document[+SurveyComment.feature]))
+             for document in documents],
+            ordered=False)
+
+
+class TimeseriesCommentStorage(CommentStorage):
+    """
+    Comments stored in the time-series collection TIMESERIES_COLLECTION:
+    the date is the timeField, the project, feature and language are the metaField
+    so that the comments of a feature are stored (and compressed) together by date.
+    Time-series collections have no text index, and only update their metaField on metaField filters.
+    """
+    text_search = False
+    updatable = False
+    META = {+SurveyComment.feature: "feature", +SurveyComment.language: "language", "project": "project"}
+
+    def collection(self, engine):
+        return engine.database[TIMESERIES_COLLECTION]
+
+    def field(self, key_name: str) -> str:
+        if key_name in self.META:
+            return f"{TIMESERIES_META_FIELD}.{self.META[key_name]}"
+        return key_name
+
+    def to_stored(self, document: dict, project: Optional[ObjectId]) -> dict:
+        stored = {key: value for key, value in document.items() if key not in self.META}
+        stored[TIMESERIES_META_FIELD] = {"project": project,
+                                         "feature": document[+SurveyComment.feature],
+                                         "language": document.get(+SurveyComment.language)}
+        return stored
+
+    def from_stored(self, document: dict) -> dict:
+        metadata = document.pop(TIMESERIES_META_FIELD, None) or {}
+        document[+SurveyComment.feature] = metadata.get("feature")
+        document[+SurveyComment.language] = metadata.get("language")
+        return document
+
+
+STORAGES = {
+    "collection": CommentStorage(),
+    "timeseries": TimeseriesCommentStorage(),
+}
+comment_storage = STORAGES[os.getenv("SURVEY_COMMENTS_STORAGE", "collection").lower()]
+
+
+async def _not_copied(engine, documents: List[dict]) -> List[dict]:
+    # Comments of the batch missing from the time-series collection, through its feature and date index
+    target = STORAGES["timeseries"]
+    dates = [document[+SurveyComment.date] for document in documents]
+    copied = target.collection(engine).find(
+        {target.field(+SurveyComment.feature): {"$in": list({document.get(+SurveyComment.feature)
+                                                              for document in documents})},
+         +SurveyComment.date: {"$gte": min(dates), "$lte": max(dates)},
+         "_id": {"$in": [document["_id"] for document in documents]}},
+        {"_id": 1})
+    copied_ids = {document["_id"] async for document in copied}
+    return [document for document in documents if document["_id"] not in copied_ids]
+
+
+async def copy_comments_to_timeseries(engine, batch_size: int = 10000) -> int:
+    '''
+    Copy the comments of the SurveyComment collection into the time-series collection, in _id order.
+    The last comment copied is recorded after every batch (COPY_CHECKPOINT_COLLECTION), the copy resumes
+    after it: run it again once the service writes to the time-series collection so as to copy
+    the comments written in the meantime. The batch following the checkpoint may have been partly
+    copied by an interrupted copy, its comments already copied are skipped.
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+    batch_size : int
+        Comments read and written per round-trip
+
+    Returns
+    -------
+    int
+        Number of comments copied
+    '''
+    source = CommentStorage()
+    target = STORAGES["timeseries"]
+    checkpoints = engine.database[COPY_CHECKPOINT_COLLECTION]
+    checkpoint = await checkpoints.find_one({"_id": TIMESERIES_COLLECTION})
+    query = {} if checkpoint is None else {"_id": {"$gt": checkpoint["last_id"]}}
+    copied = 0
+    first_batch = True
+    cursor = source.collection(engine).find(query, sort=[("_id", pymongo.ASCENDING)], batch_size=batch_size)
+    while True:
+        documents = await cursor.to_list(length=batch_size)
+        if not documents:
+            return copied
+        last_id = documents[-1]["_id"]
+        if first_batch:
+            documents = await _not_copied(engine, documents)
+            first_batch = False
+        if documents:
+            feature_ids = list({document.get(+SurveyComment.feature) for document in documents})
+            features = engine.get_collection(Feature).find({"_id": {"$in": feature_ids}}, {+Feature.project: 1})
+            feature_projects = {feature["_id"]: feature.get(+Feature.project) async for feature in features}
+            await target.collection(engine).insert_many(
+                [target.to_stored(document, feature_projects.get(document.get(+SurveyComment.feature)))
+                 for document in documents],
+                ordered=False)
+        await checkpoints.update_one({"_id": TIMESERIES_COLLECTION},
+                                     {"$set": {"last_id": last_id, "updated": datetime.utcnow()},
+                                      "$inc": {"copied": len(documents)}},
+                                     upsert=True)
+        copied += len(documents)
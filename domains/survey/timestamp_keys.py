@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from domains.survey import eligibility
+from domains.survey.models import SurveyKeyTimestamp
+
+logger = logging.getLogger(__name__)
+
+# Number of versions read on refresh, older keys are never accepted anymore
+KEY_HISTORY = 10
+
+
+class TimestampKeyStore:
+    """
+    In-memory copy of the timestamp keys, refreshed periodically from MongoDB,
+    so that serving the keys never touches the database.
+
+    Attributes:
+    -----------
+        refresh_interval:      Time in seconds between two reloads of the keys
+        grace_period:          Time in seconds a previous key is still accepted after a rotation
+    """
+
+    def __init__(self, refresh_interval: float, grace_period: float):
+        self.refresh_interval = refresh_interval
+        self.grace_period = grace_period
+        self.active: Optional[SurveyKeyTimestamp] = None
+        self.previous: List[SurveyKeyTimestamp] = []
+        self._loaded = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, engine):
+        await self.refresh(engine)
+        self._task = asyncio.create_task(self._run(engine))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def get_active(self, engine) -> Optional[SurveyKeyTimestamp]:
+        # Only reads MongoDB when the store was never loaded (not started)
+        if not self._loaded:
+            await self.refresh(engine)
+        return self.active
+
+    async def get_accepted(self, engine) -> List[SurveyKeyTimestamp]:
+        active = await self.get_active(engine)
+        return ([active] if active is not None else []) + self.previous
+
+    async def refresh(self, engine):
+        keys = await engine.find(SurveyKeyTimestamp,
+                                 sort=SurveyKeyTimestamp.version.desc(),
+                                 limit=KEY_HISTORY)
+        now = datetime.utcnow()
+        previous = []
+        # A key is retired when the next version is created
+        for key, next_key in zip(keys[1:], keys):
+            if next_key.created is not None and now - next_key.created < timedelta(seconds=self.grace_period):
+                previous.append(key)
+            else:
+                break
+        self.active = keys[0] if keys else None
+        self.previous = previous
+        self._loaded = True
+
+    async def rotate(self, engine, key: str) -> SurveyKeyTimestamp:
+        '''
+        Make `key` the active key, the version is unique so concurrent rotations cannot both win
+
+        Raises
+        ------
+        InvalidTimestampKey
+            Not the Base64 encoding of a 16, 24 or 32 bytes AES key
+        pymongo.errors.DuplicateKeyError
+            Another rotation created the same version concurrently
+        '''
+        eligibility.decode_key(key)
+        latest = await engine.find_one(SurveyKeyTimestamp, sort=SurveyKeyTimestamp.version.desc())
+        version = 1 if latest is None or latest.version is None else latest.version + 1
+        timestamp_key = SurveyKeyTimestamp(key=key, version=version, created=datetime.utcnow())
+        await engine.get_collection(SurveyKeyTimestamp).insert_one(timestamp_key.doc())
+        await self.refresh(engine)
+        return timestamp_key
+
+    async def _run(self, engine):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh(engine)
+            except Exception:
+                logger.exception("Unable to refresh the timestamp keys, keeping the previous ones")
+
+
+timestamp_keys = TimestampKeyStore(refresh_interval=float(os.getenv("TIMESTAMP_KEY_REFRESH_INTERVAL", "60")),
+                                   grace_period=float(os.getenv("TIMESTAMP_KEY_GRACE_PERIOD", "86400")))
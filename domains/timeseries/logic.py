@@ -0,0 +1,352 @@
+import asyncio
+import json
+import os
+import math
+from datetime import datetime, timezone
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional, Tuple
+
+from bson.errors import InvalidId
+from odmantic import ObjectId
+from pymongo.errors import BulkWriteError
+
+from domains.bulk import BulkError
+from domains.timeseries.models import IngestionResult, TimeseriesBucket, TimeseriesQueryResult
+
+# Measurements written per insert_many
+CHUNK_SIZE = int(os.getenv("TIMESERIES_INGESTION_CHUNK_SIZE", "5000"))
+# Rejected measurements detailed in the response, the others are only counted
+MAX_REPORTED_ERRORS = 100
+# Buckets returned by a downsampled query when the caller does not ask for fewer
+MAX_POINTS = int(os.getenv("TIMESERIES_MAX_POINTS", "1000"))
+# Values per bucket the percentiles are computed from, larger buckets are randomly sampled
+PERCENTILE_SAMPLES = int(os.getenv("TIMESERIES_PERCENTILE_SAMPLES", "10000"))
+
+TIME_FIELD = "timestamp"
+META_FIELD = "metadata"
+VALUE_FIELD = "value"
+
+NUMBER = "number"
+BOOLEAN = "boolean"
+ID = "id"
+TEXT = "text"
+
+# Type of the value and metadata (field: (type, required)) of each timeseries collection (see schema.setup)
+SERIES = {
+    "traffic": (NUMBER, {"project": (ID, True), "feature": (ID, True)}),
+    "latency": (NUMBER, {"project": (ID, True), "feature": (ID, True)}),
+    "availability": (BOOLEAN, {"project": (ID, True), "feature": (ID, True)}),
+    "commit": (NUMBER, {"project": (ID, True), "component": (ID, True), "contributor": (TEXT, True)}),
+    "exception": (NUMBER, {"project": (ID, True), "component": (ID, True), "source": (TEXT, False)}),
+}
+# Series whose buckets also hold the p50/p95/p99 of the values
+PERCENTILE_SERIES = {"latency"}
+PERCENTILES = [50, 95, 99]
+
+# Units of a query interval ("15m", "1d"...), with their $dateTrunc unit
+INTERVAL_UNITS = {"s": ("second", 1), "m": ("minute", 60), "h": ("hour", 3600), "d": ("day", 86400),
+                  "w": ("week", 604800)}
+# Candidates of the automatic interval selection, from the finest
+AUTOMATIC_INTERVALS = ["1s", "10s", "1m", "5m", "15m", "30m", "1h", "3h", "6h", "12h", "1d", "7d"]
+
+
+class InvalidMeasurement(Exception):
+    pass
+
+
+class InvalidQuery(Exception):
+    pass
+
+
+def _naive_utc(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _parse_timestamp(value) -> datetime:
+    # ISO 8601 string, or milliseconds since the epoch
+    try:
+        if isinstance(value, str):
+            return _naive_utc(datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value))
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return datetime.utcfromtimestamp(value / 1000)
+    except (OverflowError, OSError, ValueError) as error:
+        # Malformed, NaN, or out of the range of the dates (e.g. a timestamp in nanoseconds)
+        raise InvalidMeasurement(f"invalid {TIME_FIELD}") from error
+    raise InvalidMeasurement(f"invalid {TIME_FIELD}")
+
+
+def _parse_value(value_type: str, value):
+    if value_type == BOOLEAN:
+        if not isinstance(value, bool):
+            raise InvalidMeasurement(f"{VALUE_FIELD} must be a boolean")
+    elif isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise InvalidMeasurement(f"{VALUE_FIELD} must be a number")
+    elif isinstance(value, float) and not math.isfinite(value):
+        raise InvalidMeasurement(f"{VALUE_FIELD} must be a finite number")
+    return value
+
+
+def _parse_metadata(fields: Dict[str, Tuple[str, bool]], metadata) -> Dict[str, Any]:
+    if not isinstance(metadata, dict):
+        raise InvalidMeasurement(f"{META_FIELD} must be an object")
+    parsed = {}
+    for name, (field_type, required) in fields.items():
+        value = metadata.get(name)
+        if value is None:
+            if required:
+                raise InvalidMeasurement(f"{META_FIELD}.{name} is required")
+            continue
+        if field_type == ID:
+            try:
+                value = ObjectId(value)
+            except (InvalidId, TypeError) as error:
+                raise InvalidMeasurement(f"{META_FIELD}.{name} must be an ObjectId") from error
+        elif not isinstance(value, str):
+            raise InvalidMeasurement(f"{META_FIELD}.{name} must be a string")
+        parsed[name] = value
+    return parsed
+
+
+def parse_measurement(series: str, raw) -> dict:
+    '''
+    Turn one measurement of the API into the document written in the `series` collection,
+    checking only what the collection relies on (no pydantic model for speed)
+
+    Parameters
+    ----------
+    series : str
+        Name of the timeseries collection
+    raw : Union[bytes, dict]
+        Measurement, still JSON-encoded for NDJSON input
+
+    Raises
+    ------
+    InvalidMeasurement
+        The measurement is malformed
+    '''
+    if isinstance(raw, (bytes, str)):
+        try:
+            raw = json.loads(raw)
+        except ValueError as error:
+            raise InvalidMeasurement("invalid JSON") from error
+    if not isinstance(raw, dict):
+        raise InvalidMeasurement("a measurement must be an object")
+    value_type, metadata_fields = SERIES[series]
+    return {TIME_FIELD: _parse_timestamp(raw.get(TIME_FIELD)),
+            META_FIELD: _parse_metadata(metadata_fields, raw.get(META_FIELD)),
+            VALUE_FIELD: _parse_value(value_type, raw.get(VALUE_FIELD))}
+
+
+async def ndjson_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    '''
+    Split a streamed NDJSON body into its non-empty lines, without reading it all in memory
+    '''
+    pending = b""
+    async for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+async def _iterate(measurements) -> AsyncIterator:
+    if hasattr(measurements, "__aiter__"):
+        async for measurement in measurements:
+            yield measurement
+    else:
+        for measurement in measurements:
+            yield measurement
+
+
+def _first_errors(errors: List[BulkError]) -> List[BulkError]:
+    return sorted(errors, key=lambda bulk_error: bulk_error.index)[:MAX_REPORTED_ERRORS]
+
+
+async def _insert(collection, documents: List[dict], indexes: List[int]) -> Tuple[int, List[BulkError]]:
+    try:
+        await collection.insert_many(documents, ordered=False)
+        return len(documents), []
+    except BulkWriteError as error:
+        return (error.details["nInserted"],
+                [BulkError(index=indexes[write_error["index"]], detail=write_error["errmsg"])
+                 for write_error in error.details["writeErrors"]])
+
+
+async def ingest_measurements(engine, series: str, measurements) -> IngestionResult:
+    '''
+    Validate and write a batch of measurements in the `series` timeseries collection,
+    by unordered insert_many of CHUNK_SIZE documents. Parsing the next chunk overlaps
+    with the write of the previous one.
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+    series : str
+        Name of the timeseries collection
+    measurements : Union[Iterable, AsyncIterable]
+        Decoded measurements, or lines of an NDJSON body
+    '''
+    collection = engine.database[series]
+    accepted, rejected, errors = 0, 0, []
+    pending: Optional[asyncio.Task] = None
+
+    async def write(documents, indexes):
+        nonlocal accepted, rejected, errors, pending
+        if pending is not None:
+            inserted, write_errors = await pending
+            accepted += inserted
+            rejected += len(write_errors)
+            errors.extend(write_errors)
+        pending = asyncio.create_task(_insert(collection, documents, indexes)) if documents else None
+
+    documents, indexes = [], []
+    index = 0
+    async for raw in _iterate(measurements):
+        try:
+            documents.append(parse_measurement(series, raw))
+            indexes.append(index)
+        except InvalidMeasurement as error:
+            rejected += 1
+            errors.append(BulkError(index=index, detail=str(error)))
+            if len(errors) > 2 * MAX_REPORTED_ERRORS:
+                errors = _first_errors(errors)
+        index += 1
+        if len(documents) >= CHUNK_SIZE:
+            await write(documents, indexes)
+            documents, indexes = [], []
+    await write(documents, indexes)
+    await write([], [])
+    return IngestionResult(accepted=accepted, rejected=rejected, errors=_first_errors(errors))
+
+
+def _interval_seconds(interval: str) -> int:
+    return int(interval[:-1]) * INTERVAL_UNITS[interval[-1]][1]
+
+
+def choose_interval(start: datetime, end: datetime, interval: Optional[str], max_points: int) -> str:
+    '''
+    Keep the requested interval when it yields at most `max_points` buckets over [start, end),
+    otherwise pick the finest interval that does
+
+    Raises
+    ------
+    InvalidQuery
+        Malformed interval
+    '''
+    if interval is not None and (interval[-1:] not in INTERVAL_UNITS or not interval[:-1].isdigit()
+                                 or int(interval[:-1]) == 0):
+        raise InvalidQuery(f"invalid interval {interval}")
+    span = max((end - start).total_seconds(), 1)
+    if interval is not None and span / _interval_seconds(interval) <= max_points:
+        return interval
+    finest = _interval_seconds(interval) if interval is not None else 0
+    for candidate in AUTOMATIC_INTERVALS:
+        seconds = _interval_seconds(candidate)
+        if seconds >= finest and span / seconds <= max_points:
+            return candidate
+    return f"{math.ceil(span / 86400 / max_points)}d"
+
+
+async def _query_percentiles(engine,
+                             series: str,
+                             match: dict,
+                             value: Any,
+                             bucket_start: dict,
+                             interval_seconds: int,
+                             groups: List[dict],
+                             percentile_samples: int) -> Dict[datetime, Dict[str, float]]:
+    # Sampling rate of every bucket, by position from the first bucket (the units have a fixed length)
+    first = groups[0]["_id"]
+    rates = [1.0] * (int((groups[-1]["_id"] - first).total_seconds()) // interval_seconds + 1)
+    for bucket in groups:
+        rates[int((bucket["_id"] - first).total_seconds()) // interval_seconds] = \
+            min(1.0, percentile_samples / bucket["count"])
+    pipeline = [{"$match": match}, {"$set": {"bucket": bucket_start}}]
+    if min(rates) < 1:
+        position = {"$toInt": {"$divide": [{"$subtract": ["$bucket", first]}, interval_seconds * 1000]}}
+        pipeline.append({"$match": {"$expr": {"$lt": [{"$rand": {}}, {"$arrayElemAt": [rates, position]}]}}})
+    pipeline.append({"$group": {"_id": "$bucket", "values": {"$push": value}}})
+
+    # numpy is only imported when first needed (slow import)
+    import numpy as np
+    percentiles = {}
+    # One bucket of values at a time
+    async for bucket in engine.database[series].aggregate(pipeline, allowDiskUse=True):
+        percentiles[bucket["_id"]] = dict(zip(["p50", "p95", "p99"],
+                                              np.percentile(np.asarray(bucket["values"], dtype=float), PERCENTILES)))
+    return percentiles
+
+
+async def query_buckets(engine,
+                        series: str,
+                        start: datetime,
+                        end: datetime,
+                        metadata: Dict[str, str],
+                        interval: Optional[str] = None,
+                        max_points: int = MAX_POINTS,
+                        percentile_samples: int = PERCENTILE_SAMPLES) -> TimeseriesQueryResult:
+    '''
+    Downsample the measurements of [start, end) into buckets of `interval`, grouped by MongoDB
+    ($dateTrunc). The percentiles are computed here with numpy, from a second aggregation that
+    pushes at most about `percentile_samples` values per bucket (a random sample of larger buckets).
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+    series : str
+        Name of the timeseries collection
+    start, end : datetime
+        Range of the query
+    metadata : Dict[str, str]
+        Filter on the metadata of the measurements (e.g. project, feature)
+    interval : Optional[str]
+        Requested size of the buckets ("15m", "1h", "1d"...), automatic when None
+    max_points : int
+        Maximum number of buckets returned, a coarser interval is used otherwise
+    percentile_samples : int
+        Maximum number of values per bucket the percentiles are computed from
+
+    Raises
+    ------
+    InvalidQuery
+        Malformed interval or metadata filter
+    '''
+    value_type, metadata_fields = SERIES[series]
+    start, end = _naive_utc(start), _naive_utc(end)
+    try:
+        match = {f"{META_FIELD}.{name}": value for name, value in _parse_metadata(
+            {name: (metadata_fields[name][0], False) for name in metadata}, metadata).items()}
+    except (KeyError, InvalidMeasurement) as error:
+        raise InvalidQuery(f"invalid metadata filter {error}") from error
+    match[TIME_FIELD] = {"$gte": start, "$lt": end}
+    interval = choose_interval(start, end, interval, max_points)
+    unit, _ = INTERVAL_UNITS[interval[-1]]
+
+    value = f"${VALUE_FIELD}" if value_type == NUMBER else {"$toInt": f"${VALUE_FIELD}"}
+    bucket_start = {"$dateTrunc": {"date": f"${TIME_FIELD}", "unit": unit, "binSize": int(interval[:-1])}}
+    group = {"_id": bucket_start,
+             "count": {"$sum": 1},
+             "sum": {"$sum": value},
+             "min": {"$min": value},
+             "max": {"$max": value}}
+    pipeline = [{"$match": match}, {"$group": group}, {"$sort": {"_id": 1}}]
+    groups = await engine.database[series].aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+
+    percentiles = {}
+    if series in PERCENTILE_SERIES and groups:
+        percentiles = await _query_percentiles(engine, series, match, value, bucket_start,
+                                               _interval_seconds(interval), groups, percentile_samples)
+    buckets = [TimeseriesBucket(timestamp=bucket["_id"],
+                                count=bucket["count"],
+                                sum=bucket["sum"],
+                                min=bucket["min"],
+                                max=bucket["max"],
+                                **percentiles.get(bucket["_id"], {}))
+               for bucket in groups]
+    return TimeseriesQueryResult(interval=interval, buckets=buckets)
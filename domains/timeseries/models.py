@@ -0,0 +1,40 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from domains.bulk import BulkError
+
+
+class IngestionResult(BaseModel):
+    """
+    This class is only used for modeling the API output of an ingestion,
+    errors holds the first rejected measurements (by their index in the batch).
+    """
+    accepted: int
+    rejected: int
+    errors: List[BulkError]
+
+
+class TimeseriesBucket(BaseModel):
+    """
+    This class is only used for modeling the API output of one bucket of a downsampled query,
+    the percentiles are only computed for the latency.
+    """
+    timestamp: datetime
+    count: int
+    sum: float
+    min: float
+    max: float
+    p50: Optional[float]
+    p95: Optional[float]
+    p99: Optional[float]
+
+
+class TimeseriesQueryResult(BaseModel):
+    """
+    This class is only used for modeling the API output of a downsampled query,
+    interval is the bucket size actually used (possibly larger than the requested one).
+    """
+    interval: str
+    buckets: List[TimeseriesBucket]
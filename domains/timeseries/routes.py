@@ -0,0 +1,53 @@
+import json
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Path, Query, Request
+
+from domains.timeseries import logic
+from domains.timeseries.models import IngestionResult, TimeseriesQueryResult
+
+router = APIRouter()
+
+SERIES_REGEX = "^(" + "|".join(logic.SERIES) + ")$"
+
+
+@router.post("/{series}", response_model=IngestionResult)
+async def ingest_measurements(request: Request, series: str = Path(..., regex=SERIES_REGEX)) -> IngestionResult:
+    # A JSON array of measurements, or one measurement per line with the application/x-ndjson
+    # content type (streamed). A measurement is {"timestamp", "value", "metadata"}, see logic.SERIES
+    if "ndjson" in request.headers.get("content-type", ""):
+        measurements = logic.ndjson_lines(request.stream())
+    else:
+        try:
+            measurements = json.loads(await request.body())
+        except ValueError as error:
+            raise HTTPException(400, "invalid JSON") from error
+        if not isinstance(measurements, list):
+            raise HTTPException(400, "a JSON array of measurements is expected")
+    return await logic.ingest_measurements(request.app.engine, series, measurements)
+
+
+@router.get("/{series}", response_model=TimeseriesQueryResult)
+async def query_measurements(request: Request,
+                             series: str = Path(..., regex=SERIES_REGEX),
+                             start: Optional[datetime] = None,
+                             end: Optional[datetime] = None,
+                             interval: Optional[str] = None,
+                             max_points: int = Query(logic.MAX_POINTS, gt=0, le=logic.MAX_POINTS),
+                             project_id: Optional[str] = None,
+                             feature_id: Optional[str] = None,
+                             component_id: Optional[str] = None,
+                             contributor: Optional[str] = None,
+                             source: Optional[str] = None) -> TimeseriesQueryResult:
+    # Last day by default
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=1)
+    metadata = {name: value for name, value in [("project", project_id), ("feature", feature_id),
+                                                ("component", component_id), ("contributor", contributor),
+                                                ("source", source)]
+                if value is not None}
+    try:
+        return await logic.query_buckets(request.app.engine, series, start, end, metadata, interval, max_points)
+    except logic.InvalidQuery as error:
+        raise HTTPException(400, str(error)) from error
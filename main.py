@@ -1,22 +1,43 @@
+import asyncio
+import logging
 import os
 from dotenv import load_dotenv
 
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from motor.motor_asyncio import AsyncIOMotorClient
 from odmantic import AIOEngine
 from starlette_exporter import PrometheusMiddleware, handle_metrics
 
+# Load the .env file before importing the domains, some of them read their settings at import time
+load_dotenv()
+
 import domains.projects.routes as projects_routes
 import domains.survey.routes as surveys_routes
 import domains.features.routes as features_routes
+import domains.analytics.routes as analytics_routes
+import domains.jobs.routes as jobs_routes
+import domains.timeseries.routes as timeseries_routes
+from domains.jobs import logic as jobs_logic
+from domains.features.patterns import feature_patterns
+from domains.survey.ingestion import CommentWriteBehindQueue
+from domains.survey.language import detector
+from domains.survey.timestamp_keys import timestamp_keys
 
+from monitoring.mongo import CommandMetricsListener, QueryBudgetMiddleware
 from schema import schema
 
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Seconds before retrying a failed warm-up, doubled on every failure up to the maximum
+WARM_UP_RETRY_DELAY = float(os.getenv("WARM_UP_RETRY_DELAY", "1"))
+WARM_UP_MAX_RETRY_DELAY = float(os.getenv("WARM_UP_MAX_RETRY_DELAY", "60"))
 
 app = FastAPI()
+# MongoDB commands per request, see monitoring.mongo
+app.add_middleware(QueryBudgetMiddleware, query_budget=int(os.getenv("MONGODB_QUERY_BUDGET", "20")))
 app.add_middleware(PrometheusMiddleware)
 app.add_route("/metrics", handle_metrics)
 app.add_middleware(
@@ -30,21 +51,82 @@ app.add_middleware(
 
 @app.on_event("startup")
 async def startup_db_client():
-    app.mongodb_client = AsyncIOMotorClient(os.getenv("DB_URL"))
+    event_listeners = []
+    if os.getenv("MONGODB_COMMAND_MONITORING", "True").lower() == "true":
+        event_listeners.append(CommandMetricsListener())
+    app.mongodb_client = AsyncIOMotorClient(os.getenv("DB_URL"), event_listeners=event_listeners)
     # app.mongodb = app.mongodb_client[os.getenv("DB_NAME")]
     app.engine = AIOEngine(motor_client=app.mongodb_client, database=os.getenv("DB_NAME"))
-    # Recreate timeseries collections and indexes
+    # Recreate timeseries collections and indexes, a single read when the schema is current
     await schema.setup(app.mongodb_client, app.engine)
+    # Cascade deletes abandoned by a dead worker
+    app.resumed_jobs = await jobs_logic.resume_stale_cascade_deletes(app.engine)
+    # Language detection pool, the language profiles are loaded by warm_up
+    await detector.start()
+    # Timestamp keys served from memory
+    await timestamp_keys.start(app.engine)
+    # URL patterns of the features resolved in memory, loaded in the background (awaited by warm_up)
+    await feature_patterns.start(app.engine)
+    # Optional write-behind mode of POST /survey/comments
+    app.comment_queue = None
+    if os.getenv("SURVEY_COMMENTS_WRITE_BEHIND", "False").lower() == "true":
+        app.comment_queue = CommentWriteBehindQueue(app.engine,
+                                                    max_size=int(os.getenv("SURVEY_COMMENTS_QUEUE_SIZE", "10000")),
+                                                    batch_size=int(os.getenv("SURVEY_COMMENTS_BATCH_SIZE", "500")),
+                                                    flush_interval=float(os.getenv("SURVEY_COMMENTS_FLUSH_INTERVAL", "1")))
+        await app.comment_queue.start()
+    # Heavy initializations run once the application serves requests, see GET /ready
+    app.warm_up = asyncio.create_task(warm_up())
+
+
+async def warm_up():
+    # Ready once the URL patterns are loaded: retried with backoff, a failure at boot
+    # (e.g. MongoDB not reachable yet) must not keep the service unready
+    delay = WARM_UP_RETRY_DELAY
+    while True:
+        try:
+            await feature_patterns.wait_loaded(app.engine)
+            break
+        except Exception:
+            logger.exception("Unable to load the URL patterns, retrying in %.1f seconds", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARM_UP_MAX_RETRY_DELAY)
+    try:
+        await detector.warm_up()
+    except Exception:
+        logger.exception("Warm-up failed, the languages are detected on first use")
+
+
+@app.get("/ready")
+async def ready():
+    # Readiness probe: the service answers before the warm-up, but slower on the first comments
+    is_ready = app.warm_up.done() and not app.warm_up.cancelled() and app.warm_up.exception() is None
+    return JSONResponse({"ready": is_ready, "schema_version": schema.SCHEMA_VERSION},
+                        status_code=200 if is_ready else 503)
 
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if not app.warm_up.done():
+        app.warm_up.cancel()
+    # Interrupted jobs are resumed by the next startup
+    for job in app.resumed_jobs:
+        job.cancel()
+    # Drain the queued comments before closing the connection
+    if app.comment_queue is not None:
+        await app.comment_queue.stop()
+    await detector.stop()
+    await timestamp_keys.stop()
+    await feature_patterns.stop()
     app.mongodb_client.close()
 
 
 app.include_router(projects_routes.router, prefix="/projects", tags=["projects"])
 app.include_router(surveys_routes.router, prefix="/survey", tags=["survey"])
 app.include_router(features_routes.router, prefix="/features", tags=["features"])
+app.include_router(analytics_routes.router, prefix="/analytics", tags=["analytics"])
+app.include_router(jobs_routes.router, prefix="/jobs", tags=["jobs"])
+app.include_router(timeseries_routes.router, prefix="/timeseries", tags=["timeseries"])
 
 
 # Start the async event loop and ASGI server.
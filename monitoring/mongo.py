@@ -0,0 +1,134 @@
+import contextvars
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+from pymongo import monitoring
+from starlette_exporter.middleware import get_matching_route_path
+
+logger = logging.getLogger(__name__)
+
+# Label of the commands issued outside of a request (queues, jobs, refreshes...)
+BACKGROUND = "background"
+
+COMMAND_DURATION = Histogram("mongodb_command_duration_seconds",
+                             "Duration of the MongoDB commands",
+                             ["collection", "command", "route"],
+                             buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+COMMAND_FAILURES = Counter("mongodb_command_failures_total",
+                           "MongoDB commands that failed",
+                           ["collection", "command", "route"])
+REQUEST_COMMANDS = Histogram("http_request_mongodb_commands",
+                             "Number of MongoDB commands issued by a request",
+                             ["route"],
+                             buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500))
+OVER_BUDGET = Counter("http_requests_over_query_budget_total",
+                      "Requests that issued more MongoDB commands than the query budget",
+                      ["route"])
+
+
+class RequestCommands:
+    """
+    Commands issued by the request being served, the pymongo listener runs in Motor's threads.
+
+    Attributes:
+    -----------
+        route:             Route template of the request (e.g. /projects/{id})
+        count:             Number of commands issued so far
+    """
+
+    def __init__(self, route: str):
+        self.route = route
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def increment(self):
+        with self._lock:
+            self.count += 1
+
+
+# Motor copies the context into its threads, the listener sees the request of the command
+current_request: contextvars.ContextVar[Optional[RequestCommands]] = contextvars.ContextVar("mongodb_request",
+                                                                                           default=None)
+
+
+def _collection(event: monitoring.CommandStartedEvent) -> str:
+    # The collection is the value of the command name (find, insert, aggregate...) or of "collection" (getMore)
+    collection = event.command.get(event.command_name)
+    if event.command_name == "getMore":
+        collection = event.command.get("collection")
+    return collection if isinstance(collection, str) else ""
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """
+    Exports the duration of every MongoDB command, labelled by collection, command
+    and route of the request that issued it, and counts the commands of each request.
+    """
+
+    def __init__(self):
+        self._started: Dict[Tuple[int, object], Tuple[str, str, str]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        request = current_request.get()
+        if request is not None:
+            request.increment()
+        route = request.route if request is not None else BACKGROUND
+        self._started[(event.request_id, event.connection_id)] = (_collection(event), event.command_name, route)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        labels = self._started.pop((event.request_id, event.connection_id), None)
+        if labels is not None:
+            COMMAND_DURATION.labels(*labels).observe(event.duration_micros / 1e6)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        labels = self._started.pop((event.request_id, event.connection_id), None)
+        if labels is not None:
+            COMMAND_DURATION.labels(*labels).observe(event.duration_micros / 1e6)
+            COMMAND_FAILURES.labels(*labels).inc()
+
+
+class QueryBudgetMiddleware:
+    """
+    ASGI middleware counting the MongoDB commands of each request (see CommandMetricsListener),
+    requests issuing more than query_budget commands are logged and counted, so that
+    N+1 query patterns show up on the dashboards.
+
+    Attributes:
+    -----------
+        query_budget:      Maximum number of commands expected from a request
+    """
+
+    def __init__(self, app, query_budget: int):
+        self.app = app
+        self.query_budget = query_budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = get_matching_route_path(scope, scope["app"].routes) or "unmatched"
+        request = RequestCommands(route)
+        token = current_request.set(request)
+
+        async def wrapped_send(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Background tasks run after the response, their commands are not the request's
+                current_request.set(None)
+                self._observe(scope, request)
+
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            if current_request.get() is request:
+                self._observe(scope, request)
+            current_request.reset(token)
+
+    def _observe(self, scope, request: RequestCommands):
+        REQUEST_COMMANDS.labels(request.route).observe(request.count)
+        if request.count > self.query_budget:
+            OVER_BUDGET.labels(request.route).inc()
+            logger.warning("%s %s issued %d MongoDB commands (budget %d)",
+                           scope["method"], request.route, request.count, self.query_budget)
@@ -1,27 +1,74 @@
+import os
+from datetime import datetime
+
 import pymongo
+from pymongo import IndexModel
 from motor.motor_asyncio import AsyncIOMotorClient
 
+from domains.analytics.models import RatingRollup
+from domains.features.models import Feature
 from domains.projects.models import Project
+from domains.survey.models import SurveyRule, SurveyComment, SurveyLastAnswer, SurveyKeyTimestamp
+from domains.survey import search
+from domains.survey.storage import TIMESERIES_COLLECTION, TIMESERIES_META_FIELD
+from domains.timeseries import logic as timeseries
 
-async def setup(client, engine):
-    '''
-    Define native collections for timeseries
-    And extra indexes
+# Collection holding the version of the schema applied to the database
+SCHEMA_VERSION_COLLECTION = "schema_version"
+SCHEMA_VERSION_ID = "schema"
 
-    Parameters
-    ----------
-    engine : AIOEngine
-        Async IO Pymongo engine
-    client : AsyncIOMotorClient
-        Async IO Pymongo client
-    '''
-    # TODO : ODMantic project plan to add a feature allowing to specify it in the Model
-    # Ensure we have a fulltext index so as to search through title and description fields
-    motor_collection = engine.get_collection(Project)
-    index_info = await motor_collection.index_information()
-    if len(index_info) < 2:
-        await motor_collection.create_index([("name", pymongo.TEXT), ("description", pymongo.TEXT)], name="idxProjectFullText", background=True)
+# Indexes declared per model, created by the migrations and verified on every setup
+# TODO : ODMantic project plan to add a feature allowing to specify it in the Model
+INDEXES = {
+    # Fulltext index so as to search through title and description fields
+    Project: [
+        IndexModel([("name", pymongo.TEXT), ("description", pymongo.TEXT)], name="idxProjectFullText"),
+    ],
+    # Feature resolution from the URL given by the feedback widget
+    Feature: [
+        IndexModel([("resource", pymongo.ASCENDING)], name="idxFeatureResource"),
+    ],
+    # Rule of a feature
+    SurveyRule: [
+        IndexModel([("feature", pymongo.ASCENDING)], name="idxSurveyRuleFeature"),
+    ],
+    # Last answer of a user on a feature, and comments of a feature over a date range
+    SurveyComment: [
+        IndexModel([("feature", pymongo.ASCENDING), ("user_id", pymongo.ASCENDING), ("date", pymongo.DESCENDING)],
+                   name="idxSurveyCommentFeatureUserDate"),
+        IndexModel([("feature", pymongo.ASCENDING), ("date", pymongo.DESCENDING)],
+                   name="idxSurveyCommentFeatureDate"),
+        # Fulltext index of the descriptions, stemmed in the language of every comment.
+        # Prefixed by that language: a search (stemmed in one language) only reads the comments of its language
+        IndexModel([("search_language", pymongo.ASCENDING), ("description", pymongo.TEXT)],
+                   name="idxSurveyCommentLanguageFullText",
+                   default_language=search.NO_LANGUAGE, language_override="search_language"),
+    ],
+    # Last answer of a user on a feature, one per (user_id, feature)
+    SurveyLastAnswer: [
+        IndexModel([("user_id", pymongo.ASCENDING), ("feature", pymongo.ASCENDING)],
+                   name="idxSurveyLastAnswerUserFeature", unique=True),
+    ],
+    # Versions of the timestamp key, a rotation fails if its version already exists
+    SurveyKeyTimestamp: [
+        IndexModel([("version", pymongo.DESCENDING)], name="idxSurveyKeyTimestampVersion", unique=True),
+    ],
+    # One rollup per feature, day and language, summaries of a project over a date range
+    RatingRollup: [
+        IndexModel([("feature", pymongo.ASCENDING), ("day", pymongo.ASCENDING), ("language", pymongo.ASCENDING)],
+                   name="idxRatingRollupFeatureDayLanguage", unique=True),
+        IndexModel([("project", pymongo.ASCENDING), ("day", pymongo.ASCENDING)],
+                   name="idxRatingRollupProjectDay"),
+    ],
+}
 
+
+async def _create_indexes(engine, models):
+    for model in models:
+        await engine.get_collection(model).create_indexes(INDEXES[model])
+
+
+async def _create_timeseries_collections(client, engine):
     db = client.get_database()
     collections = await db.list_collection_names()
 
@@ -71,3 +118,153 @@ async def setup(client, engine):
                     "timeField": "timestamp",
                     "metaField": "metadata"
         })
+
+
+async def _migration_1(client, engine):
+    await _create_indexes(engine, [Project])
+    await _create_timeseries_collections(client, engine)
+
+
+async def _migration_2(client, engine):
+    await _create_indexes(engine, [Feature, SurveyRule, SurveyComment])
+
+
+async def _migration_3(client, engine):
+    await _create_indexes(engine, [RatingRollup])
+
+
+async def _migration_4(client, engine):
+    await _create_indexes(engine, [SurveyLastAnswer])
+    # Last answers of the comments written before they were maintained
+    pipeline = [
+        {"$group": {"_id": {"user_id": "$user_id", "feature": "$feature"}, "last_answered": {"$max": "$date"}}},
+        {"$project": {"_id": 0, "user_id": "$_id.user_id", "feature": "$_id.feature", "last_answered": 1}},
+        {"$merge": {"into": SurveyLastAnswer.__collection__,
+                    "on": ["user_id", "feature"],
+                    "whenMatched": [{"$set": {"last_answered": {"$max": ["$last_answered", "$$new.last_answered"]}}}],
+                    "whenNotMatched": "insert"}},
+    ]
+    await engine.get_collection(SurveyComment).aggregate(pipeline).to_list(length=None)
+
+
+async def _migration_5(client, engine):
+    # Number the keys stored before they were versioned, the most recent one becomes the active key
+    collection = engine.get_collection(SurveyKeyTimestamp)
+    latest = await collection.find_one({"version": {"$ne": None}}, sort=[("version", pymongo.DESCENDING)])
+    version = 0 if latest is None else latest["version"]
+    async for key in collection.find({"version": None}, sort=[("_id", pymongo.ASCENDING)]):
+        version += 1
+        await collection.update_one({"_id": key["_id"]}, {"$set": {"version": version}})
+    await _create_indexes(engine, [SurveyKeyTimestamp])
+
+
+async def _migration_6(client, engine):
+    # Comments timeseries collection (SURVEY_COMMENTS_STORAGE=timeseries), metadata :
+    #  - Project ID
+    #  - Feature ID
+    #  - Language
+    # Comments are sparse: with the hour granularity a bucket holds up to 30 days of comments of a feature
+    collections = await engine.database.list_collection_names()
+    if TIMESERIES_COLLECTION not in collections:
+        await engine.database.create_collection(TIMESERIES_COLLECTION, timeseries={
+                    "timeField": "date",
+                    "metaField": TIMESERIES_META_FIELD,
+                    "granularity": "hours"
+        })
+    # Comments of a feature over a date range
+    await engine.database[TIMESERIES_COLLECTION].create_indexes([
+        IndexModel([(f"{TIMESERIES_META_FIELD}.feature", pymongo.ASCENDING), ("date", pymongo.DESCENDING)],
+                   name="idxCommentsFeatureDate"),
+    ])
+
+
+async def _migration_7(client, engine):
+    # Language of the fulltext index of the comments written before it was stored
+    branches = [{"case": {"$eq": ["$language", language]}, "then": text_language}
+                for language, text_language in search.TEXT_LANGUAGES.items()]
+    await engine.get_collection(SurveyComment).update_many(
+        {"search_language": None},
+        [{"$set": {"search_language": {"$switch": {"branches": branches, "default": search.NO_LANGUAGE}}}}])
+    await _create_indexes(engine, [SurveyComment])
+
+
+async def _migration_8(client, engine):
+    # Measurements of a project, feature or component over a time range (downsampled queries)
+    for series, (_, metadata_fields) in timeseries.SERIES.items():
+        await engine.database[series].create_indexes([
+            IndexModel([(f"{timeseries.META_FIELD}.{name}", pymongo.ASCENDING),
+                        (timeseries.TIME_FIELD, pymongo.ASCENDING)],
+                       name=f"idx{series.capitalize()}{name.capitalize()}Timestamp")
+            for name, (field_type, _) in metadata_fields.items() if field_type == timeseries.ID
+        ])
+
+
+# Verify the declared indexes on every boot, even when the schema version is current
+VERIFY_INDEXES = os.getenv("SCHEMA_VERIFY_INDEXES", "False").lower() == "true"
+
+# Ordered list of (version, migration), every migration must be idempotent
+MIGRATIONS = [
+    (1, _migration_1),
+    (2, _migration_2),
+    (3, _migration_3),
+    (4, _migration_4),
+    (5, _migration_5),
+    (6, _migration_6),
+    (7, _migration_7),
+    (8, _migration_8),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+async def get_schema_version(engine) -> int:
+    document = await engine.database[SCHEMA_VERSION_COLLECTION].find_one({"_id": SCHEMA_VERSION_ID})
+    return 0 if document is None else document["version"]
+
+
+async def _set_schema_version(engine, version: int):
+    await engine.database[SCHEMA_VERSION_COLLECTION].update_one(
+        {"_id": SCHEMA_VERSION_ID},
+        {"$max": {"version": version}, "$set": {"updated": datetime.utcnow()}},
+        upsert=True)
+
+
+async def verify_indexes(engine):
+    '''
+    Recreate the declared indexes missing from the database
+    (e.g. dropped by hand after the migration ran)
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+    '''
+    for model, indexes in INDEXES.items():
+        index_info = await engine.get_collection(model).index_information()
+        missing = [index for index in indexes if index.document["name"] not in index_info]
+        if missing:
+            await engine.get_collection(model).create_indexes(missing)
+
+
+async def setup(client, engine):
+    '''
+    Define native collections for timeseries
+    And extra indexes
+    Migrations newer than the version stored in the database are applied in order,
+    then the declared indexes are verified. When the stored version is current,
+    the only round-trip is the read of that version (unless VERIFY_INDEXES).
+
+    Parameters
+    ----------
+    engine : AIOEngine
+        Async IO Pymongo engine
+    client : AsyncIOMotorClient
+        Async IO Pymongo client
+    '''
+    current_version = await get_schema_version(engine)
+    if current_version >= SCHEMA_VERSION and not VERIFY_INDEXES:
+        return
+    for version, migration in MIGRATIONS:
+        if version > current_version:
+            await migration(client, engine)
+            await _set_schema_version(engine, version)
+    await verify_indexes(engine)
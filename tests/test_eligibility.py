@@ -0,0 +1,23 @@
+import base64
+import os
+from datetime import datetime
+
+import pytest
+
+from domains.survey.eligibility import decode_key, encrypt_timestamp
+from domains.survey.exceptions import InvalidTimestampKey
+
+
+@pytest.mark.parametrize("size", [16, 24, 32])
+def test_encrypt_timestamp(size):
+    key = base64.b64encode(os.urandom(size)).decode()
+    # 12 bytes nonce, 13 bytes of milliseconds and a 16 bytes tag
+    assert len(base64.b64decode(encrypt_timestamp(key, datetime(2024, 3, 1)))) == 12 + 13 + 16
+
+
+@pytest.mark.parametrize("key", ["not base64!", base64.b64encode(os.urandom(20)).decode(), ""])
+def test_invalid_key(key):
+    with pytest.raises(InvalidTimestampKey):
+        decode_key(key)
+    with pytest.raises(InvalidTimestampKey):
+        encrypt_timestamp(key, datetime(2024, 3, 1))
@@ -0,0 +1,100 @@
+import asyncio
+
+from odmantic import ObjectId
+
+from domains.features.patterns import FeaturePatternStore, UrlPatternMatcher, compile_matchers, split_url
+
+ORIGIN = "https://shop.example"
+
+
+def matcher_of(*resources):
+    # Features numbered by the position of their resource, all in one project
+    matcher = UrlPatternMatcher()
+    features = {}
+    for resource in resources:
+        features[resource] = ObjectId()
+        matcher.add(features[resource], ObjectId(), resource)
+    return matcher, features
+
+
+def resolve(matcher, url):
+    match = matcher.exact.get(url) or matcher.match(split_url(url)[1])
+    return None if match is None else match.resource
+
+
+def test_split_url():
+    assert split_url("HTTPS://Shop.Example/orders//42/?tab=1#top") == ("https://shop.example", ["orders", "42"])
+
+
+def test_specificity_order():
+    resources = [f"{ORIGIN}/files/**", f"{ORIGIN}/files/*", f"{ORIGIN}/files/report-*.pdf",
+                 f"{ORIGIN}/files/report-1.pdf"]
+    url = f"{ORIGIN}/files/report-1.pdf"
+    # Literal > partial wildcard > whole segment wildcard > rest of the path
+    for expected in reversed(range(len(resources))):
+        matcher, _ = matcher_of(*resources[:expected + 1])
+        assert resolve(matcher, url) == resources[expected]
+
+
+def test_longest_affixes_win_between_partial_wildcards():
+    matcher, _ = matcher_of(f"{ORIGIN}/files/*.pdf", f"{ORIGIN}/files/report-*.pdf", f"{ORIGIN}/files/report-*")
+    assert resolve(matcher, f"{ORIGIN}/files/report-1.pdf") == f"{ORIGIN}/files/report-*.pdf"
+    assert resolve(matcher, f"{ORIGIN}/files/report-1.csv") == f"{ORIGIN}/files/report-*"
+    assert resolve(matcher, f"{ORIGIN}/files/invoice.pdf") == f"{ORIGIN}/files/*.pdf"
+
+
+def test_several_wildcards_in_a_segment():
+    matcher, _ = matcher_of(f"{ORIGIN}/files/{{year}}-{{month}}.csv")
+    assert resolve(matcher, f"{ORIGIN}/files/2024-01.csv") == f"{ORIGIN}/files/{{year}}-{{month}}.csv"
+    assert resolve(matcher, f"{ORIGIN}/files/202401.csv") is None
+
+
+def test_literal_branch_falls_back_to_wildcards():
+    matcher, _ = matcher_of(f"{ORIGIN}/orders/new/view", f"{ORIGIN}/orders/{{id}}/edit")
+    assert resolve(matcher, f"{ORIGIN}/orders/new/edit") == f"{ORIGIN}/orders/{{id}}/edit"
+    assert resolve(matcher, f"{ORIGIN}/orders/new/view") == f"{ORIGIN}/orders/new/view"
+    assert resolve(matcher, f"{ORIGIN}/orders/new") is None
+
+
+def test_rest_of_path_matches_nothing_left():
+    matcher, _ = matcher_of(f"{ORIGIN}/docs/**")
+    assert resolve(matcher, f"{ORIGIN}/docs") == f"{ORIGIN}/docs/**"
+    assert resolve(matcher, f"{ORIGIN}/docs/guide/chapter-1") == f"{ORIGIN}/docs/**"
+    assert resolve(matcher, f"{ORIGIN}/blog") is None
+
+
+def test_query_string_stripped_from_patterns():
+    matcher, _ = matcher_of(f"{ORIGIN}/orders/{{id}}", f"{ORIGIN}/settings")
+    assert resolve(matcher, f"{ORIGIN}/orders/42?tab=details#items") == f"{ORIGIN}/orders/{{id}}"
+    assert resolve(matcher, f"{ORIGIN}/settings?user=5") == f"{ORIGIN}/settings"
+    assert resolve(matcher, f"{ORIGIN}/settings/") == f"{ORIGIN}/settings"
+
+
+def test_literal_with_query_string_only_matches_itself():
+    matcher, _ = matcher_of(f"{ORIGIN}/search?tab=1")
+    assert resolve(matcher, f"{ORIGIN}/search?tab=1") == f"{ORIGIN}/search?tab=1"
+    assert resolve(matcher, f"{ORIGIN}/search?tab=2") is None
+    assert resolve(matcher, f"{ORIGIN}/search") is None
+
+
+def test_same_regex_compiled_once():
+    matcher, _ = matcher_of(f"{ORIGIN}/orders/{{id}}-x", f"{ORIGIN}/orders/{{name}}-x")
+    assert len(matcher.root.literals["orders"].partials[("", "-x")]) == 1
+    # The first feature of a pattern wins
+    assert resolve(matcher, f"{ORIGIN}/orders/42-x") == f"{ORIGIN}/orders/{{id}}-x"
+
+
+def test_projects_sharing_an_origin():
+    first, second = ObjectId(), ObjectId()
+    resources = {first: {ORIGIN: [(ObjectId(), f"{ORIGIN}/orders/*")]},
+                 second: {ORIGIN: [(ObjectId(), f"{ORIGIN}/orders/{{id}}/items"), (ObjectId(), f"{ORIGIN}/**")]}}
+    store = FeaturePatternStore(refresh_interval=60)
+    store.resources, store.matchers, store._loaded = resources, compile_matchers(resources, [ORIGIN]), True
+
+    def project_of(url):
+        return asyncio.run(store.resolve(None, url)).project
+
+    assert project_of(f"{ORIGIN}/orders/42") == first
+    assert project_of(f"{ORIGIN}/orders/42/items") == second
+    assert project_of(f"{ORIGIN}/cart") == second
+    assert asyncio.run(store.resolve(None, "https://other.example/orders/42")) is None
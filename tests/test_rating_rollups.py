@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pydantic import ValidationError
+
+from domains.analytics.logic import _day
+from domains.survey.models import QueuedSurveyComment
+
+
+def test_day_of_naive_date():
+    assert _day(datetime(2024, 3, 1, 23, 59)) == datetime(2024, 3, 1)
+
+
+def test_day_of_aware_date_is_utc():
+    # 2024-03-02 01:30 in UTC+2 is 2024-03-01 23:30 in UTC, the day of $dateTrunc
+    date = datetime(2024, 3, 2, 1, 30, tzinfo=timezone(timedelta(hours=2)))
+    assert _day(date) == datetime(2024, 3, 1)
+
+
+@pytest.mark.parametrize("rating", [0, 6, -1])
+def test_rating_out_of_range(rating):
+    with pytest.raises(ValidationError):
+        QueuedSurveyComment(feature_url="https://shop.example/orders",
+                            user_id="6f1b3c52-3f0e-4a5b-9d1e-2a7c8b9d0e1f",
+                            date=datetime(2024, 3, 1),
+                            rating=rating)
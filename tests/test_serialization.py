@@ -0,0 +1,48 @@
+import asyncio
+from datetime import datetime
+
+import orjson
+import pytest
+from fastapi.encoders import jsonable_encoder
+from odmantic import ObjectId
+from odmantic.exceptions import DocumentParsingError
+
+from domains.projects.models import Project
+from domains.serialization import FastJSONResponse, documents_to_dicts
+
+DOCUMENTS = [
+    {"_id": ObjectId(), "name": "shop", "description": "Online shop", "config": {"sonar": "shop"},
+     "synced": datetime(2024, 3, 1, 12, 30), "is_active": False, "payload": {"id": 42}},
+    # Optional fields missing, rendered with their defaults
+    {"_id": ObjectId(), "name": "back office"},
+]
+
+
+def fast_path(documents, fields=None):
+    # Projects have no reference, the engine is not used
+    items = asyncio.run(documents_to_dicts(None, Project, documents, fields))
+    return orjson.loads(FastJSONResponse(items).body)
+
+
+def validated_path(documents):
+    return jsonable_encoder([Project.parse_doc(document) for document in documents])
+
+
+def test_same_json_as_the_validated_path():
+    assert fast_path(DOCUMENTS) == validated_path(DOCUMENTS)
+
+
+def test_projected_fields():
+    assert fast_path(DOCUMENTS, frozenset({"id", "name"})) == [{"name": item["name"], "id": item["id"]}
+                                                                for item in validated_path(DOCUMENTS)]
+
+
+def test_missing_required_field_fails_on_both_paths():
+    documents = [{"_id": ObjectId(), "description": "no name"}]
+    with pytest.raises(DocumentParsingError):
+        validated_path(documents)
+    with pytest.raises(DocumentParsingError):
+        fast_path(documents)
+    # Not rendered, not required
+    assert fast_path(documents, frozenset({"id", "description"})) == [{"description": "no name",
+                                                                      "id": str(documents[0]["_id"])}]